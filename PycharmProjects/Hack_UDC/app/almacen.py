@@ -0,0 +1,279 @@
+
+# LIBRERÍAS
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.series import SerieOHLCV
+
+
+# Ruta de la base de datos. Todos los workers de gunicorn de la misma máquina
+# abren el mismo fichero, así que comparten los datos subidos y descargados.
+RUTA_DB = os.getenv(
+    "STUDYSTOCK_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "studystock.db")
+)
+MMAP_BYTES = int(os.getenv("STUDYSTOCK_DB_MMAP_MB", 256)) * 1024 * 1024
+
+COLUMNAS = ['open', 'high', 'low', 'close', 'volume']
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS velas (
+    fuente TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    fecha INTEGER NOT NULL,
+    open REAL, high REAL, low REAL, close REAL, volume REAL,
+    PRIMARY KEY (fuente, ticker, fecha)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS series (
+    fuente TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    actualizado REAL NOT NULL,
+    profundidad INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fuente, ticker)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS resultados (
+    tipo TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    calculado REAL NOT NULL,
+    contenido TEXT NOT NULL,
+    PRIMARY KEY (tipo, ticker)
+) WITHOUT ROWID;
+"""
+
+
+# CONEXIONES (una por hilo y por proceso)
+
+_local = threading.local()
+
+
+def _conexion(ruta: str):
+    conexiones = getattr(_local, "conexiones", None)
+    # Tras un fork (workers de gunicorn) no se reutilizan conexiones del padre
+    if conexiones is None or getattr(_local, "pid", None) != os.getpid():
+        conexiones = _local.conexiones = {}
+        _local.pid = os.getpid()
+
+    con = conexiones.get(ruta)
+    if con is None:
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        con = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")      # lectores y escritor a la vez entre procesos
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(f"PRAGMA mmap_size={MMAP_BYTES}")  # lecturas con memoria mapeada
+        con.executescript(ESQUEMA)
+        _migrar(con)
+        conexiones[ruta] = con
+    return con
+
+
+def _migrar(con):
+    # Bases de datos creadas antes de guardar la profundidad de las series
+    try:
+        with con:
+            con.execute("ALTER TABLE series ADD COLUMN profundidad INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass  # la columna ya existe
+
+
+# ALMACÉN OHLCV PERSISTENTE
+
+class AlmacenOHLCV:
+    # Series OHLCV de una fuente ("local", "twelvedata:1day", ...) guardadas en SQLite.
+    # Se usa como un diccionario ticker -> DataFrame, igual que el antiguo DB_LOCAL,
+    # pero las escrituras hacen upsert por fecha en lugar de reescribir el historial.
+
+    def __init__(self, fuente: str, ruta: str = RUTA_DB):
+        self.fuente = fuente
+        self.ruta = ruta
+
+    @property
+    def _con(self):
+        return _conexion(self.ruta)
+
+    # --- Interfaz tipo diccionario ---
+
+    def __contains__(self, ticker):
+        fila = self._con.execute(
+            "SELECT 1 FROM series WHERE fuente = ? AND ticker = ?", (self.fuente, ticker)
+        ).fetchone()
+        return fila is not None
+
+    def __getitem__(self, ticker):
+        df = self.leer(ticker)
+        if df is None:
+            raise KeyError(ticker)
+        return df
+
+    def __setitem__(self, ticker, df):
+        self.guardar(ticker, df)
+
+    def __delitem__(self, ticker):
+        with self._con as con:
+            con.execute("DELETE FROM velas WHERE fuente = ? AND ticker = ?", (self.fuente, ticker))
+            con.execute("DELETE FROM series WHERE fuente = ? AND ticker = ?", (self.fuente, ticker))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self._con.execute(
+            "SELECT COUNT(*) FROM series WHERE fuente = ?", (self.fuente,)
+        ).fetchone()[0]
+
+    def keys(self):
+        filas = self._con.execute(
+            "SELECT ticker FROM series WHERE fuente = ? ORDER BY ticker", (self.fuente,)
+        ).fetchall()
+        return [f[0] for f in filas]
+
+    # --- Lectura / escritura ---
+
+    def leer(self, ticker: str, ultimas: int = None):
+        # Devuelve la serie compacta (app/series.py) o None si el ticker no existe, marcada
+        # con la fuente y la última escritura del ticker (forman parte de su versión).
+        # Las filas van directas de SQLite a arrays NumPy, sin pasar por un DataFrame.
+        if ultimas:
+            consulta = ("SELECT * FROM (SELECT fecha, open, high, low, close, volume FROM velas "
+                        "WHERE fuente = ? AND ticker = ? ORDER BY fecha DESC LIMIT ?) ORDER BY fecha")
+            parametros = (self.fuente, ticker, int(ultimas))
+        else:
+            consulta = ("SELECT fecha, open, high, low, close, volume FROM velas "
+                        "WHERE fuente = ? AND ticker = ? ORDER BY fecha")
+            parametros = (self.fuente, ticker)
+
+        # La marca de escritura se lee antes que las velas: si entre medias llega otra carga,
+        # la serie queda con una marca antigua y la siguiente lectura la vuelve a leer
+        # (al revés, datos viejos con marca nueva se quedarían en las cachés).
+        actualizado = self.actualizado(ticker)
+        if actualizado is None:
+            return None
+        filas = self._con.execute(consulta, parametros).fetchall()
+
+        tabla = np.array(filas, dtype=np.float64).reshape(len(filas), len(COLUMNAS) + 1)
+        serie = SerieOHLCV.desde_columnas(tabla[:, 0], tabla[:, 1:5].T, tabla[:, 5])
+        return serie.sellar(self.fuente, actualizado)
+
+    def guardar(self, ticker: str, df: pd.DataFrame, profundidad: int = 0):
+        # Upsert por fecha: las velas nuevas se añaden y las existentes se sobrescriben.
+        # 'profundidad' es el nº de velas pedido en una descarga completa (se queda el mayor).
+        fechas = pd.DatetimeIndex(df.index)
+        if fechas.tz is not None:
+            fechas = fechas.tz_localize(None)
+        epoch = (fechas.asi8 // 10**9).tolist()
+        valores = df[COLUMNAS].astype(float).to_numpy().tolist()
+        filas = [(self.fuente, ticker, f, *v) for f, v in zip(epoch, valores)]
+
+        with self._con as con:
+            con.executemany(
+                "INSERT INTO velas (fuente, ticker, fecha, open, high, low, close, volume) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (fuente, ticker, fecha) DO UPDATE SET "
+                "open = excluded.open, high = excluded.high, low = excluded.low, "
+                "close = excluded.close, volume = excluded.volume",
+                filas
+            )
+            con.execute(
+                "INSERT INTO series (fuente, ticker, actualizado, profundidad) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (fuente, ticker) DO UPDATE SET actualizado = excluded.actualizado, "
+                "profundidad = MAX(series.profundidad, excluded.profundidad)",
+                (self.fuente, ticker, time.time(), int(profundidad))
+            )
+        return len(filas)
+
+    # --- Cargas atómicas por bloques ---
+
+    def preparacion(self):
+        # Almacén temporal (otra fuente en la misma base de datos) donde se van guardando
+        # los bloques de una carga; solo se pasa a esta fuente con incorporar().
+        return AlmacenOHLCV(f"{self.fuente}~carga~{uuid.uuid4().hex}", self.ruta)
+
+    def incorporar(self, preparacion, ticker: str):
+        # Copia las velas preparadas con upsert y borra la preparación, todo en una transacción
+        with self._con as con:
+            cursor = con.execute(
+                "INSERT INTO velas (fuente, ticker, fecha, open, high, low, close, volume) "
+                "SELECT ?, ticker, fecha, open, high, low, close, volume FROM velas "
+                "WHERE fuente = ? AND ticker = ? "
+                "ON CONFLICT (fuente, ticker, fecha) DO UPDATE SET "
+                "open = excluded.open, high = excluded.high, low = excluded.low, "
+                "close = excluded.close, volume = excluded.volume",
+                (self.fuente, preparacion.fuente, ticker)
+            )
+            con.execute(
+                "INSERT INTO series (fuente, ticker, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT (fuente, ticker) DO UPDATE SET actualizado = excluded.actualizado",
+                (self.fuente, ticker, time.time())
+            )
+            con.execute("DELETE FROM velas WHERE fuente = ?", (preparacion.fuente,))
+            con.execute("DELETE FROM series WHERE fuente = ?", (preparacion.fuente,))
+        return cursor.rowcount
+
+    def descartar(self):
+        # Borra todo lo guardado en esta fuente (preparaciones de cargas fallidas)
+        with self._con as con:
+            con.execute("DELETE FROM velas WHERE fuente = ?", (self.fuente,))
+            con.execute("DELETE FROM series WHERE fuente = ?", (self.fuente,))
+
+    def tamano(self):
+        # (nº de velas, bytes de datos) de la fuente: 6 columnas numéricas de 8 bytes por vela
+        filas = self._con.execute(
+            "SELECT COUNT(*) FROM velas WHERE fuente = ?", (self.fuente,)
+        ).fetchone()[0]
+        return filas, filas * (len(COLUMNAS) + 1) * 8
+
+    def ultima_fecha(self, ticker: str):
+        # Fecha de la última vela guardada, o None si no hay historial.
+        fila = self._con.execute(
+            "SELECT MAX(fecha) FROM velas WHERE fuente = ? AND ticker = ?", (self.fuente, ticker)
+        ).fetchone()
+        return pd.Timestamp(fila[0], unit='s') if fila and fila[0] is not None else None
+
+    def actualizado(self, ticker: str):
+        # Momento (epoch) de la última escritura del ticker, o None.
+        fila = self._con.execute(
+            "SELECT actualizado FROM series WHERE fuente = ? AND ticker = ?", (self.fuente, ticker)
+        ).fetchone()
+        return fila[0] if fila else None
+
+    def profundidad(self, ticker: str):
+        # Mayor nº de velas pedido en una descarga completa del ticker (0 si no consta).
+        fila = self._con.execute(
+            "SELECT profundidad FROM series WHERE fuente = ? AND ticker = ?", (self.fuente, ticker)
+        ).fetchone()
+        return fila[0] if fila else 0
+
+
+# RESULTADOS PRECALCULADOS (JSON) COMPARTIDOS ENTRE WORKERS
+
+class AlmacenResultados:
+    # Guarda respuestas ya calculadas ("stock", "predict", ...) por ticker.
+
+    def __init__(self, ruta: str = RUTA_DB):
+        self.ruta = ruta
+
+    def guardar(self, tipo: str, ticker: str, contenido: dict):
+        with _conexion(self.ruta) as con:
+            con.execute(
+                "INSERT INTO resultados (tipo, ticker, calculado, contenido) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (tipo, ticker) DO UPDATE SET "
+                "calculado = excluded.calculado, contenido = excluded.contenido",
+                (tipo, ticker, time.time(), json.dumps(contenido))
+            )
+
+    def leer(self, tipo: str, ticker: str):
+        # Devuelve (contenido, calculado) o None.
+        fila = _conexion(self.ruta).execute(
+            "SELECT contenido, calculado FROM resultados WHERE tipo = ? AND ticker = ?", (tipo, ticker)
+        ).fetchone()
+        if fila is None:
+            return None
+        return json.loads(fila[0]), fila[1]
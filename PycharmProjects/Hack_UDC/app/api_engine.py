@@ -1,172 +1,210 @@
 
 # LIBRERÍAS
+import asyncio
 import os
 import pandas as pd
 import numpy as np
-from twelvedata import TDClient
-from prophet import Prophet
 from dotenv import load_dotenv
 import logging
-from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error
+from app.cache import TTL_FALLO, CacheSeries, ttl_restante
+from app.almacen import AlmacenOHLCV
+from app import cartera, cliente_td, concurrencia
+from app.pronostico import ServicioPronostico
+from app.indicadores import MotorIndicadores
+from app.metricas import tramo
+from app.series import ARCHIVO_SERIES, INTERVALO_BASE, INTERVALOS, SerieOHLCV, como_serie, remuestrear
 
 
 # Configuración de logs y entorno
 load_dotenv()
-logging.getLogger('prophet').setLevel(logging.ERROR)
+log = logging.getLogger("studystock.engine")
 
-API_KEY = os.getenv("TWELVE_DATA_KEY") # Para la KEY, basta con registrarse en Twelve Data
-td = TDClient(apikey=API_KEY)
+# La clave (o claves, TWELVE_DATA_KEYS=k1,k2) de Twelve Data se gestiona en app/cliente_td.py,
+# con límite de créditos por minuto para cada una. Basta con registrarse en Twelve Data.
+
+# Caché en memoria de las series de Twelve Data (TTL según sesión de mercado + LRU).
+# Las series circulan por el motor en formato compacto (app/series.py), no como DataFrame.
+CACHE_SERIES = CacheSeries()
 
 
 # DESCARGAR DATOS DE UNA EMPRESA
 
-def descargar_datos(symbol: str):
-    # Descarga el último año de datos diarios usando Twelve Data.
-    try:
-        if not API_KEY:
-            return {"error": "No se encontró TWELVE_DATA_KEY en el archivo .env"}
+def descargar_datos(symbol: str, interval: str = INTERVALO_BASE, outputsize: int = 365, desde: pd.Timestamp = None):
+    # Descarga las últimas 'outputsize' velas del intervalo usando Twelve Data.
+    # Con 'desde' solo pide las velas a partir de esa fecha (descarga incremental).
+    return cliente_td.descargar_datos(symbol, interval, outputsize, desde)
 
-        # Solicitamos la serie temporal
-        ts = td.time_series(
-            symbol=symbol,
-            interval="1day",
-            outputsize=365,  # Un año de datos para la IA
-            order="ASC"  # Orden ascendente para Prophet
-        )
+# DESCARGAR HISTORIAL EMPRESA
 
-        df = ts.as_pandas()
+def obtener_historial_formateado(serie: SerieOHLCV, dias: int = 10):
 
-        if df is None or df.empty:
-            return {"error": f"No se encontraron datos para {symbol}. Revisa el ticker."}
+    # Extrae los últimos 'n' días del historial y los formatea para JSON.
 
-        # Twelve Data devuelve las columnas con mayúscula inicial, las pasamos a minúsculas.
-        df.columns = [col.lower() for col in df.columns]
-        return df
-    except Exception as e:
-        if "api key" in str(e).lower():
-            return {"error": "API Key inválida o expirada."}
-        return {"error": f"Error en Twelve Data: {str(e)}"}
+    if serie is None or len(serie) == 0:
+        return {}
 
-# DESCARGAR HISTORIAL EMPRESA
+    # Tomamos los últimos 'n' registros (en este caso 10), con fechas YYYY-MM-DD
+    ultimas = como_serie(serie).ultimas(dias)
+    fechas = np.datetime_as_string((ultimas.tiempos * ultimas.unidad).astype('datetime64[s]'), unit='D')
+    return {str(fecha): round(float(valor), 2) for fecha, valor in zip(fechas, ultimas.close)}
 
-def obtener_historial_formateado(df: pd.DataFrame, dias: int = 10):
+# ESTADÍSTICAS EMPRESA
 
-    # Extrae los últimos 'n' días del historial y los formatea para JSON.
+def calcular_estadisticas(serie: SerieOHLCV):
+    # Cálculos financieros básicos, directamente sobre las columnas (sin DataFrame).
+    serie = como_serie(serie)
+    return {
+        "ultimo_cierre": round(float(serie.close[-1]), 2),
+        "rango_diario": round(float(serie.high[-1]) - float(serie.low[-1]), 2),
+        "volumen_medio": int(np.nanmean(serie.volume))
+    }
 
-    if df is None or df.empty:
-        return {}
+# RESUMEN DE UNA EMPRESA (respuesta de /stock)
+
+@tramo("estadisticas")
+def resumen_stock(ticker: str, serie: SerieOHLCV):
+    stats = calcular_estadisticas(serie)
+    historial = obtener_historial_formateado(serie, 15)
 
-    # Tomamos los últimos 'n' registros (en este caso 10).
-    ultimo_historial = df['close'].tail(dias).to_dict()
+    return {
+        "ticker": ticker,
+        "intervalo": como_serie(serie).intervalo,
+        "metricas": stats,
+        "historial_cierre": historial
+    }
 
-    # Formateamos las fechas (que son el índice) a strings YYYY-MM-DD
-    return {str(fecha.date()): round(float(valor), 2) for fecha, valor in ultimo_historial.items()}
+# INDICADORES TÉCNICOS (SMA/EMA, RSI, MACD, Bollinger, ATR, volatilidad, drawdown, VWAP)
+# Caché por (ticker, última vela) y actualización incremental al llegar velas nuevas.
 
-# ESTADÍSTICAS EMPRESA
+MOTOR_INDICADORES = MotorIndicadores()
 
-def calcular_estadisticas(df: pd.DataFrame):
-    # Cálculos financieros básicos.
+@tramo("indicadores")
+def calcular_indicadores(ticker: str, serie: SerieOHLCV, ultimos: int = 30):
+    serie = como_serie(serie)
+    tabla = MOTOR_INDICADORES.calcular(ticker, serie).tail(ultimos).round(4)
+    # NaN (ventanas aún sin completar) -> null en el JSON
+    tabla = tabla.astype(object).where(tabla.notna(), None)
+    historial = {str(fecha.date()): fila for fecha, fila in tabla.to_dict(orient="index").items()}
     return {
-        "ultimo_cierre": round(float(df['close'].iloc[-1]), 2),
-        "rango_diario": round(float(df['high'].iloc[-1] - df['low'].iloc[-1]), 2),
-        "volumen_medio": int(df['volume'].mean())
+        "ticker": ticker,
+        "ultima_vela": str(serie.ultima_fecha.date()),
+        "indicadores": historial[str(tabla.index[-1].date())],
+        "historial": historial
     }
 
-# COMPARAR DOS EMPRESAS (tanto insertadas en POST como de Twelve Data)
 
-def comparar_empresas(ticker1: str, ticker2: str):
-    # Buscamos ambos usando nuestra función "maestra" que ya creamos
-    df1 = obtener_datos(ticker1)
-    df2 = obtener_datos(ticker2)
+def calcular_indicadores_lote(datos: dict, ultimos: int = 30):
+    return {t: calcular_indicadores(t, s, ultimos) for t, s in datos.items() if isinstance(s, SerieOHLCV)}
+
 
-    if isinstance(df1, dict) and "error" in df1: return df1
-    if isinstance(df2, dict) and "error" in df2: return df2
+# COMPARAR EMPRESAS (tanto insertadas en POST como de Twelve Data)
 
-    # Calculamos el rendimiento porcentual de ambas para comparar
+def comparar_empresas(*tickers: str):
+    # Buscamos todos usando nuestra función "maestra" que ya creamos
+    datos = {t: obtener_datos(t) for t in tickers}
+    return resumen_comparativa(datos)
+
+
+async def comparar_empresas_async(*tickers: str):
+    # Las descargas que falten se hacen en una sola petición batch
+    datos = await obtener_datos_lote_async(list(tickers))
+    return await concurrencia.ejecutar(resumen_comparativa, datos)
+
+
+@tramo("estadisticas")
+def resumen_comparativa(datos: dict):
+    # Ranking de cualquier número de empresas por rendimiento del periodo.
+    for serie in datos.values():
+        if isinstance(serie, dict) and "error" in serie: return serie
+    datos = {t: como_serie(serie) for t, serie in datos.items()}
+
+    # Calculamos el rendimiento porcentual de todas para comparar
     # (Precio Final / Precio Inicial - 1) * 100
-    perf1 = ((df1['close'].iloc[-1] / df1['close'].iloc[0]) - 1) * 100
-    perf2 = ((df2['close'].iloc[-1] / df2['close'].iloc[0]) - 1) * 100
-
-    return {  # Ánalisis de cada empresa y mejor opción.
-        ticker1: {
-            "ultimo_precio": round(float(df1['close'].iloc[-1]), 2),
-            "rendimiento_periodo": f"{round(perf1, 2)}%",
-            "fuente": "Local" if ticker1 in DB_LOCAL else "Twelve Data"
-        },
-        ticker2: {
-            "ultimo_precio": round(float(df2['close'].iloc[-1]), 2),
-            "rendimiento_periodo": f"{round(perf2, 2)}%",
-            "fuente": "Local" if ticker2 in DB_LOCAL else "Twelve Data"
-        },
-        "lider-rendimiento": ticker1 if perf1 > perf2 else ticker2
+    rendimientos = {t: (float(s.close[-1]) / float(s.close[0]) - 1) * 100 for t, s in datos.items()}
+    ranking = sorted(rendimientos, key=rendimientos.get, reverse=True)
+
+    resultado = {  # Ánalisis de cada empresa y mejor opción.
+        t: {
+            "ultimo_precio": round(float(datos[t].close[-1]), 2),
+            "rendimiento_periodo": f"{round(rendimientos[t], 2)}%",
+            "fuente": "Local" if t in DB_LOCAL else "Twelve Data"
+        }
+        for t in datos
     }
+    resultado["lider-rendimiento"] = ranking[0]
+    resultado["ranking"] = ranking
+    return resultado
+
+
+# SERIES ALINEADAS (una columna de cierres por ticker)
+
+def alinear_cierres(datos: dict):
+    # DataFrame ancho con las fechas de todos los tickers; NaN donde un ticker no cotizó.
+    cierres = {t: pd.Series(s.close.astype(np.float64), index=s.fechas)
+               for t, s in datos.items() if isinstance(s, SerieOHLCV)}
+    if not cierres:
+        return pd.DataFrame()
+    return pd.concat(cierres, axis=1).sort_index()
+
+
+# ANÁLISIS DE CARTERA (correlación, covarianza, beta, Sharpe/Sortino y pesos óptimos)
+# El cálculo vive en app/cartera.py; aquí solo se separa el índice de referencia.
+
+@tramo("cartera")
+def analizar_cartera(datos: dict, benchmark=None, interval: str = INTERVALO_BASE,
+                     tasa_libre: float = cartera.TASA_LIBRE):
+    datos = {t: como_serie(s) for t, s in datos.items()}
+    if benchmark is not None:
+        benchmark = como_serie(benchmark)
+    return cartera.analizar(datos, benchmark, tasa_libre, cartera.PERIODOS_ANUALES[interval])
 
 
 # PREDCCIÓN FUTURO EMPRESA (IA)
+# El entrenamiento vive en app/pronostico.py: pool de procesos con Prophet precargado
+# y caché de resultados hasta que lleguen velas nuevas. 'modelo' elige el backend
+# ("prophet" o "fast", ver app/modelos.py); ambos devuelven la misma estructura.
 
-def predecir_ia(df: pd.DataFrame):
-    try:
-        # Si hay menos de 15 registros de valores en el historial de la empresa, al modelo
-        # de IA no le sirve como aprendizaje (muy pocos datos).
-        if len(df) < 15:
-            return {"error": f"Datos insuficientes ({len(df)}). Se requieren al menos 15."}
-
-        df_p = df.copy()
-        # Estandarizar nombres de columnas
-        if 'datetime' in df_p.columns:
-            df_p = df_p.rename(columns={'datetime': 'ds', 'close': 'y', 'volume': 'volume'})
+SERVICIO_PRONOSTICO = ServicioPronostico()
+
+def predecir_ia(serie: SerieOHLCV, ticker: str = None, modelo: str = "prophet"):
+    return SERVICIO_PRONOSTICO.predecir(serie, ticker, modelo)
+
+
+async def predecir_ia_async(serie: SerieOHLCV, ticker: str = None, modelo: str = "prophet", progreso=None):
+    return await SERVICIO_PRONOSTICO.predecir_async(serie, ticker, modelo, progreso=progreso)
+
+
+async def backtest_async(serie: SerieOHLCV, ticker: str = None, modelo: str = "prophet",
+                         horizonte: int = 5, pliegues: int = 3):
+    return await SERVICIO_PRONOSTICO.backtest_async(serie, ticker, modelo, horizonte=horizonte, pliegues=pliegues)
+
+
+async def predecir_lote_async(symbols: list, modelo: str = "prophet"):
+    # Predicción de varias empresas en un solo trabajo. Produce (ticker, resultado, segundos)
+    # en orden de finalización; los tickers sin datos salen primero con su error.
+    datos = await obtener_datos_lote_async(symbols)
+
+    validos = {}
+    for ticker, df in datos.items():
+        if isinstance(df, dict) and "error" in df:
+            yield ticker, df, 0.0
         else:
-            df_p = df_p.reset_index().rename(
-                columns={'datetime': 'ds', 'index': 'ds', 'close': 'y', 'volume': 'volume'})
-
-        df_p['ds'] = pd.to_datetime(df_p['ds']).dt.tz_localize(None)
-        df_p = df_p.dropna(subset=['ds', 'y', 'volume'])
-
-        # 2. Validación Cruzada (Cálculo del MAE)
-        # Dividimos: entrenamos con todo menos los últimos 5 días para testear
-        train = df_p.iloc[:-5]
-        test = df_p.iloc[-5:]
-
-        m_val = Prophet(daily_seasonality=False, yearly_seasonality=True)
-        m_val.add_regressor('volume')
-        m_val.fit(train)
-
-        # Predicción sobre el periodo de prueba
-        forecast_test = m_val.predict(test[['ds', 'volume']])
-
-        # AQUÍ DEFINIMOS MAE CORRECTAMENTE
-        valor_mae = mean_absolute_error(test['y'], forecast_test['yhat'])
-        precision = (1 - (valor_mae / test['y'].mean())) * 100
-
-        # 3. Predicción Futura Final
-        m_final = Prophet(daily_seasonality=False, yearly_seasonality=True)
-        m_final.add_regressor('volume')
-        m_final.fit(df_p)
-
-        future = m_final.make_future_dataframe(periods=7)
-        vol_medio = df_p['volume'].mean()
-        future['volume'] = df_p['volume'].tolist() + [vol_medio] * 7
-
-        forecast_final = m_final.predict(future).tail(7)
-
-        return {
-            "status": "success",
-            "metricas": {
-                "error_medio_usd": round(float(valor_mae), 2),
-                "precision_porcentual": f"{round(precision, 2)}%"
-            },
-            "predicciones": {str(row.ds.date()): round(row.yhat, 2) for row in forecast_final.itertuples()}
-        }
+            validos[ticker] = df
 
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())
-        return {"error": f"Fallo en el motor de IA: {str(e)}"}
+    async for resultado in SERVICIO_PRONOSTICO.predecir_lote(validos, modelo):
+        yield resultado
 
 
 # INSERTAR UNA EMPRESA
 
-DB_LOCAL = {}  #Nuestro conjunto de empresas intoducidas
+# Nuestro conjunto de empresas introducidas. Se guarda en disco (SQLite) para que
+# sobreviva a reinicios y lo vean todos los workers de la máquina.
+DB_LOCAL = AlmacenOHLCV("local")
+
+def es_local(*series):
+    # True si alguna de las series se leyó de DB_LOCAL (sus respuestas se revalidan siempre)
+    return any(isinstance(s, SerieOHLCV) and s.fuente == DB_LOCAL.fuente for s in series)
+
 
 def guardar_datos_manuales(ticker: str, registros: list):
     try:
@@ -183,25 +221,283 @@ def guardar_datos_manuales(ticker: str, registros: list):
 
         df = df.set_index('datetime')
 
-        DB_LOCAL[ticker.upper()] = df
+        # Upsert por fecha: volver a subir un ticker solo añade/actualiza sus velas
+        DB_LOCAL.guardar(ticker.upper(), df)
         return {"mensaje": f"Empresa {ticker} cargada con {len(df)} registros."}
     except Exception as e:
         return {"error": f"Error al procesar los datos: {str(e)}"}
 
 
+# SERIES DE TWELVE DATA GUARDADAS EN DISCO
+# De cada ticker solo se descarga y guarda la serie diaria (la base); las barras
+# semanales, mensuales y anuales se remuestrean a partir de ella en el servidor y se
+# guardan en caché. La base diaria tiene VELAS_BASE velas; la primera vez que se pide un
+# intervalo grueso se amplía de una vez a MAX_VELAS_BASE (una descarga completa más
+# profunda, registrada en la columna 'profundidad' del almacén). Twelve Data cobra un
+# crédito por símbolo y petición sea cual sea 'outputsize', así que esa ampliación cuesta
+# un solo crédito por ticker y después cambiar entre 1week, 1month y 1year no gasta
+# ninguno; a cambio esa primera respuesta trae ~5000 velas en lugar de 365.
+
+VELAS_BASE = int(os.getenv("SERIE_BASE_VELAS", 365))
+MAX_VELAS_BASE = 5000  # Máximo de velas por petición en Twelve Data
+
+
+def velas_base(interval: str = INTERVALO_BASE, outputsize: int = None):
+    # Profundidad de la serie diaria necesaria para 'outputsize' barras del intervalo
+    if interval != INTERVALO_BASE:
+        return MAX_VELAS_BASE
+    return min(max(VELAS_BASE, outputsize or VELAS_BASE), MAX_VELAS_BASE)
+
+def series_twelve(interval: str = INTERVALO_BASE):
+    return AlmacenOHLCV(f"twelvedata:{interval}")
+
+
+def _intervalo_no_soportado(interval: str):
+    if interval in INTERVALOS:
+        return None
+    return {"error": f"Intervalo no soportado: {interval}. Opciones: {', '.join(INTERVALOS)}"}
+
+
+def _derivar(ticker: str, serie, interval: str, outputsize: int = None):
+    # Barras del intervalo pedido a partir de la serie base. El remuestreo se guarda en
+    # caché con la versión de la base (que incluye su última escritura en el almacén),
+    # así que se rehace cuando llegan velas nuevas o una carga cambia velas antiguas.
+    if not isinstance(serie, SerieOHLCV):
+        return serie
+    if interval != serie.intervalo:
+        clave = ("remuestreo", ticker, interval, serie.version)
+        derivada = CACHE_SERIES.obtener(clave)
+        if derivada is None:
+            with tramo("remuestreo"):
+                derivada = remuestrear(serie, interval)
+            CACHE_SERIES.guardar(clave, derivada)
+        serie = derivada
+    return serie.ultimas(outputsize) if outputsize else serie
+
+
 # OBTENER DATOS: ALGORITMO DE ELECCIÓN
 # SI ESTÁ EN DB_LOCAL (introducido por POST), lo extraemos de ahí.
 # Si no, buscamos en Twelve Data
 
-def obtener_datos(symbol: str):
+@tramo("lectura_local")
+def _buscar_guardado(ticker: str, interval: str, outputsize: int):
+    # Busca la serie sin salir a la red: DB_LOCAL, caché en memoria y almacén en disco.
+    # Devuelve None si hay que descargarla.
+
+    # Comprobar en DB_LOCAL (Datos inyectados por el usuario)
+    actualizado = DB_LOCAL.actualizado(ticker)
+    if actualizado is not None:
+        return _derivar(ticker, _leer_local(ticker, actualizado), interval)
+
+    base = _buscar_base(ticker, velas_base(interval, outputsize))
+    return None if base is None else _derivar(ticker, base, interval, outputsize)
+
+
+def _leer_local(ticker: str, actualizado: float):
+    # La serie decodificada se guarda en caché hasta la siguiente carga del ticker: la
+    # entrada se reemplaza en cuanto cambia su última escritura ('actualizado'). Como las
+    # de Twelve Data, se comparte entre workers con un fichero mmap por carga.
+    clave = ("local", ticker)
+    serie = CACHE_SERIES.obtener(clave)
+    if serie is not None and serie.actualizado == actualizado:
+        log.debug("Recuperando %s de la caché local.", ticker)
+        return serie
+
+    serie = _leer_compartida(DB_LOCAL, ticker, None, actualizado)
+    if serie is not None:
+        CACHE_SERIES.guardar(clave, serie)
+    return serie
+
+
+def _buscar_base(ticker: str, velas: int = VELAS_BASE):
+    # Comprobar la caché de series ya descargadas
+    clave = (ticker, INTERVALO_BASE, velas)
+    df = CACHE_SERIES.obtener(clave)
+    if df is not None:
+        log.debug("Recuperando %s de la caché.", ticker)
+        return df
+
+    # Comprobar las series de Twelve Data guardadas en disco (compartidas entre workers),
+    # siempre que se descargaran con al menos 'velas' de profundidad
+    almacen = series_twelve()
+    actualizado = almacen.actualizado(ticker)
+    if actualizado is not None and ttl_restante(actualizado) > 0 and almacen.profundidad(ticker) >= velas:
+        serie = _leer_compartida(almacen, ticker, velas, actualizado)
+        CACHE_SERIES.guardar(clave, serie, ttl=ttl_restante(actualizado))
+        return serie
+
+    return None
+
+
+def _leer_compartida(almacen: AlmacenOHLCV, ticker: str, outputsize: int, actualizado: float):
+    # Con SERIES_MMAP_DIR el primer worker que lee la serie de SQLite la deja en un
+    # fichero mmap; los demás la mapean y comparten la misma copia en memoria.
+    if ARCHIVO_SERIES is not None:
+        serie = ARCHIVO_SERIES.leer(almacen.fuente, ticker, outputsize, actualizado)
+        if serie is not None:
+            log.debug("Recuperando %s del fichero compartido.", ticker)
+            return serie
+
+    log.debug("Recuperando %s del almacén en disco.", ticker)
+    serie = almacen.leer(ticker, ultimas=outputsize)
+    if serie is not None and ARCHIVO_SERIES is not None:
+        serie = ARCHIVO_SERIES.escribir(almacen.fuente, ticker, outputsize, actualizado, serie)
+    return serie
+
+
+def _ultima_vela(ticker: str, velas: int = VELAS_BASE):
+    # Última vela guardada de la serie base (None si nunca se descargó o si se descargó
+    # con menos de 'velas' de profundidad: entonces se descarga completa).
+    almacen = series_twelve()
+    if almacen.profundidad(ticker) < velas:
+        return None
+    return almacen.ultima_fecha(ticker)
+
+
+def _registrar_descarga(ticker: str, df, desde: pd.Timestamp = None, velas: int = VELAS_BASE):
+    # Guarda en disco y en caché una serie base recién descargada. Los errores no se guardan.
+    # En una descarga incremental ('desde') se fusionan las velas nuevas con el historial:
+    # el upsert por fecha elimina duplicados y la serie completa se relee del almacén.
+    # Si la actualización falla se sirve el historial guardado, y se deja en caché
+    # TTL_FALLO segundos para no volver a Twelve Data (con sus reintentos) en cada petición.
+    almacen = series_twelve()
+    if not isinstance(df, pd.DataFrame):
+        if desde is not None:
+            log.warning("Falló la actualización de %s, se sirve el historial guardado.", ticker)
+            serie = almacen.leer(ticker, ultimas=velas)
+            if serie is not None:
+                CACHE_SERIES.guardar((ticker, INTERVALO_BASE, velas), serie, ttl=TTL_FALLO)
+            return serie
+        return df
+
+    almacen.guardar(ticker, df, profundidad=velas if desde is None else 0)
+    if desde is not None:
+        serie = almacen.leer(ticker, ultimas=velas)
+    else:
+        serie = SerieOHLCV.desde_dataframe(df).sellar(almacen.fuente, almacen.actualizado(ticker))
+    CACHE_SERIES.guardar((ticker, INTERVALO_BASE, velas), serie)
+    return serie
+
+
+def obtener_datos(symbol: str, interval: str = INTERVALO_BASE, outputsize: int = 365):
+    # 'outputsize' es el nº de barras del intervalo pedido
+    error = _intervalo_no_soportado(interval)
+    if error:
+        return error
 
     ticker = symbol.upper()
 
-    # Comprobar en DB_LOCAL (Datos inyectados por el usuario)
-    if ticker in DB_LOCAL:
-        print(f"DEBUG: Recuperando {ticker} de la memoria local.")
-        return DB_LOCAL[ticker]
+    df = _buscar_guardado(ticker, interval, outputsize)
+    if df is not None:
+        return df
+
+    # Si no está, ir a la API externa (solo por las velas nuevas si ya tenemos historial)
+    velas = velas_base(interval, outputsize)
+    desde = _ultima_vela(ticker, velas)
+    log.debug("%s no encontrado en local. Consultando Twelve Data...", ticker)
+    df = descargar_datos(ticker, INTERVALO_BASE, velas, desde)
+    return _derivar(ticker, _registrar_descarga(ticker, df, desde, velas), interval, outputsize)
+
+
+# OBTENER DATOS (VERSIÓN ASÍNCRONA PARA LOS ENDPOINTS)
+# Mismo algoritmo, pero las lecturas de disco van a un pool de hilos y la
+# descarga usa el cliente HTTP asíncrono, sin bloquear el bucle de eventos.
+
+async def obtener_datos_async(symbol: str, interval: str = INTERVALO_BASE, outputsize: int = 365):
+    error = _intervalo_no_soportado(interval)
+    if error:
+        return error
+
+    ticker = symbol.upper()
+
+    df = await concurrencia.ejecutar(_buscar_guardado, ticker, interval, outputsize)
+    if df is not None:
+        return df
+
+    base = await _descargar_async(ticker, velas_base(interval, outputsize))
+    return await concurrencia.ejecutar(_derivar, ticker, base, interval, outputsize)
+
+
+async def _descargar_async(ticker: str, velas: int = VELAS_BASE):
+    # Las peticiones simultáneas del mismo ticker (y profundidad) comparten una sola descarga
+    return await concurrencia.VUELOS.ejecutar(("descarga", ticker, velas), _descargar_y_registrar, ticker, velas)
+
+
+async def _descargar_y_registrar(ticker: str, velas: int = VELAS_BASE):
+    # Descarga (incremental si ya hay historial suficiente) y registra la serie base.
+    desde = await concurrencia.ejecutar(_ultima_vela, ticker, velas)
+    log.debug("%s no encontrado en local. Consultando Twelve Data...", ticker)
+    df = await cliente_td.descargar_datos_async(ticker, INTERVALO_BASE, velas, desde)
+    return await concurrencia.ejecutar(_registrar_descarga, ticker, df, desde, velas)
+
+
+# OBTENER VARIAS EMPRESAS A LA VEZ
+# Lo que ya está guardado se lee en paralelo; lo que falta se descarga en una
+# sola petición batch a Twelve Data en lugar de una por ticker.
+
+async def obtener_datos_lote_async(symbols: list, interval: str = INTERVALO_BASE, outputsize: int = 365):
+    tickers = list(dict.fromkeys(s.upper() for s in symbols))
+    error = _intervalo_no_soportado(interval)
+    if error:
+        return dict.fromkeys(tickers, error)
+
+    guardados = await asyncio.gather(
+        *(concurrencia.ejecutar(_buscar_guardado, t, interval, outputsize) for t in tickers))
+    datos = dict(zip(tickers, guardados))
+
+    faltan = [t for t, df in datos.items() if df is None]
+    if not faltan:
+        return datos
+
+    # Cada ticker del batch queda "en vuelo" como si fuera una descarga individual:
+    # si otra petición ya lo está descargando se espera esa, y las que lleguen
+    # mientras tanto esperan a este batch en lugar de repetirlo.
+    velas = velas_base(interval, outputsize)
+    tareas = {t: concurrencia.VUELOS.en_curso(("descarga", t, velas)) for t in faltan}
+    resto = [t for t in faltan if tareas[t] is None]
+    lote = asyncio.ensure_future(_descargar_lote(resto, velas)) if resto else None
+
+    async def del_lote(ticker):
+        return (await lote)[ticker]
+
+    for t in resto:
+        tareas[t] = concurrencia.VUELOS.lanzar(("descarga", t, velas), del_lote, t)
+
+    bases = await asyncio.gather(*(asyncio.shield(tarea) for tarea in tareas.values()))
+    for t, base in zip(tareas, bases):
+        datos[t] = await concurrencia.ejecutar(_derivar, t, base, interval, outputsize)
+    return datos
+
+
+async def _descargar_lote(tickers: list, velas: int = VELAS_BASE):
+    # Los tickers con historial piden solo las velas nuevas (desde la más antigua
+    # de sus últimas velas); los nuevos piden la serie completa. Dos batch como máximo.
+    ultimas = await asyncio.gather(*(concurrencia.ejecutar(_ultima_vela, t, velas) for t in tickers))
+    ultimas = dict(zip(tickers, ultimas))
+    nuevos = [t for t in tickers if ultimas[t] is None]
+    incrementales = [t for t in tickers if ultimas[t] is not None]
+    desde = min((ultimas[t] for t in incrementales), default=None)
+
+    log.debug("%s no encontrados en local. Consultando Twelve Data (batch)...", ", ".join(tickers))
+    lotes = await asyncio.gather(
+        cliente_td.descargar_lote_async(nuevos, INTERVALO_BASE, velas) if nuevos else asyncio.sleep(0, {}),
+        cliente_td.descargar_lote_async(incrementales, INTERVALO_BASE, velas, desde)
+        if incrementales else asyncio.sleep(0, {})
+    )
+    return {
+        t: await concurrencia.ejecutar(_registrar_descarga, t, df, ultimas[t], velas)
+        for t, df in {**lotes[0], **lotes[1]}.items()
+    }
+
+
+# REFRESCAR DATOS (descarga forzada, la usa el planificador)
+
+async def refrescar_datos_async(symbol: str, interval: str = INTERVALO_BASE, outputsize: int = 365):
+    ticker = symbol.upper()
+    actualizado = await concurrencia.ejecutar(DB_LOCAL.actualizado, ticker)
+    if actualizado is not None:
+        serie = await concurrencia.ejecutar(_leer_local, ticker, actualizado)
+        return await concurrencia.ejecutar(_derivar, ticker, serie, interval)
 
-    # Si no está, ir a la API externa
-    print(f"DEBUG: {ticker} no encontrado en local. Consultando Twelve Data...")
-    return descargar_datos(ticker)
+    base = await _descargar_async(ticker, velas_base(interval, outputsize))
+    return await concurrencia.ejecutar(_derivar, ticker, base, interval, outputsize)
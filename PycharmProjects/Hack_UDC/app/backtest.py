@@ -0,0 +1,156 @@
+
+# LIBRERÍAS
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app import concurrencia
+from app.metricas import tramo
+from app.modelos import MODELOS, crear_modelo
+
+
+# BACKTEST CON ORIGEN MÓVIL (VENTANA EXPANSIVA)
+# En lugar de un único hueco con los últimos días, se hacen 'pliegues' cortes: en
+# cada uno el modelo se entrena con todo el historial anterior al corte y predice
+# los 'horizonte' días siguientes. Los pliegues son independientes, así que se
+# entrenan a la vez en el pool de procesos. Cada pliegue se guarda en caché por
+# versión de los datos (ticker, última escritura en el almacén, última vela, nº de
+# velas, modelo y parámetros): hasta que no cambian los datos, el backtest no se
+# vuelve a entrenar.
+
+HORIZONTE = int(os.getenv("BACKTEST_HORIZONTE", 5))
+PLIEGUES = int(os.getenv("BACKTEST_PLIEGUES", 3))
+MAX_PLIEGUES_CACHE = int(os.getenv("BACKTEST_MAX_PLIEGUES", 5000))
+MIN_ENTRENAMIENTO = 10  # Velas mínimas para entrenar un pliegue
+
+
+def cortes(n: int, horizonte: int = HORIZONTE, pliegues: int = PLIEGUES):
+    # Posiciones de corte, de la más antigua a la más reciente. El último pliegue
+    # termina en la última vela; los anteriores retroceden 'horizonte' velas cada uno.
+    posiciones = [n - horizonte * k for k in range(pliegues, 0, -1)]
+    return [c for c in posiciones if c >= MIN_ENTRENAMIENTO]
+
+
+# CÓDIGO QUE SE EJECUTA EN EL POOL (procesos o hilos)
+
+def _evaluar_pliegue(df_p: pd.DataFrame, corte: int, horizonte: int, modelo: str, params: dict):
+    # Devuelve (real, predicho, inferior, superior) del pliegue como arrays
+    m = crear_modelo(modelo, params).ajustar(df_p.iloc[:corte])
+    test = df_p.iloc[corte:corte + horizonte]
+    yhat, inferior, superior = m.intervalo(test)
+    return test['y'].to_numpy(dtype=np.float64), yhat, inferior, superior
+
+
+# RESUMEN DE LOS PLIEGUES (MAE / MAPE / COBERTURA POR PASO DEL HORIZONTE)
+
+def _redondear(valor, decimales: int = 4):
+    return None if valor is None or np.isnan(valor) else round(float(valor), decimales)
+
+
+def resumir(pliegues: list, horizonte: int):
+    real, pred, inf, sup = (np.vstack(col) for col in zip(*pliegues))  # (pliegues, horizonte)
+    error = np.abs(real - pred)
+    ape = error / np.abs(real) * 100
+
+    con_intervalo = not np.isnan(inf).all()
+    dentro = ((inf <= real) & (real <= sup)).astype(float)
+
+    por_paso = [{
+        "paso": i + 1,
+        "mae": _redondear(error[:, i].mean()),
+        "mape": _redondear(ape[:, i].mean()),
+        "cobertura": _redondear(dentro[:, i].mean()) if con_intervalo else None
+    } for i in range(horizonte)]
+
+    return {
+        "horizonte": horizonte,
+        "pliegues": len(pliegues),
+        "mae": _redondear(error.mean()),
+        "mape": _redondear(ape.mean()),
+        "cobertura": _redondear(dentro.mean()) if con_intervalo else None,
+        "por_paso": por_paso
+    }
+
+
+# MOTOR CON CACHÉ POR PLIEGUE
+
+class MotorBacktest:
+
+    def __init__(self, obtener_pool, max_pliegues: int = MAX_PLIEGUES_CACHE):
+        # 'obtener_pool' devuelve el pool de procesos del servicio de predicción,
+        # que ya tiene Prophet precargado.
+        self._obtener_pool = obtener_pool
+        self.max_pliegues = max_pliegues
+        self._pliegues = OrderedDict()  # (versión, corte, horizonte) -> arrays del pliegue
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.calculados = 0
+
+    def _planificar(self, version, n: int, horizonte: int, pliegues: int):
+        # Devuelve (claves de todos los pliegues, {clave: corte} de los que faltan)
+        claves, pendientes = [], {}
+        with self._lock:
+            for corte in cortes(n, horizonte, pliegues):
+                clave = (version, corte, horizonte)
+                claves.append(clave)
+                if clave in self._pliegues:
+                    self._pliegues.move_to_end(clave)
+                    self.aciertos += 1
+                else:
+                    pendientes[clave] = corte
+        return claves, pendientes
+
+    def _cerrar(self, claves: list, nuevos: dict, horizonte: int):
+        with self._lock:
+            self.calculados += len(nuevos)
+            self._pliegues.update(nuevos)
+            pliegues = [self._pliegues.get(c, nuevos.get(c)) for c in claves]
+            while len(self._pliegues) > self.max_pliegues:
+                self._pliegues.popitem(last=False)
+        return resumir(pliegues, horizonte)
+
+    def evaluar(self, version, df_p: pd.DataFrame, modelo: str, params: dict = None,
+                horizonte: int = HORIZONTE, pliegues: int = PLIEGUES):
+        claves, pendientes = self._planificar(version, len(df_p), horizonte, pliegues)
+        if not claves:
+            return {"error": f"Datos insuficientes para el backtest ({len(df_p)} velas)."}
+
+        if MODELOS[modelo].en_proceso:
+            futuros = {c: self._obtener_pool().submit(_evaluar_pliegue, df_p.iloc[:corte + horizonte],
+                                                      corte, horizonte, modelo, params)
+                       for c, corte in pendientes.items()}
+            nuevos = {c: f.result() for c, f in futuros.items()}
+        else:
+            nuevos = {c: _evaluar_pliegue(df_p, corte, horizonte, modelo, params)
+                      for c, corte in pendientes.items()}
+        return self._cerrar(claves, nuevos, horizonte)
+
+    async def evaluar_async(self, version, df_p: pd.DataFrame, modelo: str, params: dict = None,
+                            horizonte: int = HORIZONTE, pliegues: int = PLIEGUES):
+        claves, pendientes = self._planificar(version, len(df_p), horizonte, pliegues)
+        if not claves:
+            return {"error": f"Datos insuficientes para el backtest ({len(df_p)} velas)."}
+
+        if MODELOS[modelo].en_proceso:
+            pool = self._obtener_pool()
+            tareas = [asyncio.wrap_future(pool.submit(_evaluar_pliegue, df_p.iloc[:corte + horizonte],
+                                                      corte, horizonte, modelo, params))
+                      for corte in pendientes.values()]
+        else:
+            tareas = [concurrencia.ejecutar(_evaluar_pliegue, df_p, corte, horizonte, modelo, params)
+                      for corte in pendientes.values()]
+        with tramo("backtest"):
+            nuevos = dict(zip(pendientes, await asyncio.gather(*tareas)))
+        return self._cerrar(claves, nuevos, horizonte)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "pliegues_en_cache": len(self._pliegues),
+                "aciertos": self.aciertos,
+                "calculados": self.calculados
+            }
@@ -0,0 +1,156 @@
+
+# LIBRERÍAS
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from app.series import SerieOHLCV
+
+
+# Configuración (se puede ajustar con variables de entorno en Render)
+TTL_MERCADO_ABIERTO = int(os.getenv("CACHE_TTL_ABIERTO", 60))        # segundos
+TTL_MINIMO_CERRADO = int(os.getenv("CACHE_TTL_CERRADO_MIN", 15 * 60))  # segundos
+TTL_FALLO = int(os.getenv("CACHE_TTL_FALLO", 120))  # segundos: historial servido tras fallar Twelve Data
+MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", 500))
+MAX_BYTES = int(os.getenv("CACHE_MAX_MB", 256)) * 1024 * 1024
+
+ZONA_MERCADO = ZoneInfo("America/New_York")
+APERTURA = (9, 30)
+CIERRE = (16, 0)
+
+
+# SESIÓN DE MERCADO (NYSE / NASDAQ)
+
+def mercado_abierto(ahora: datetime = None):
+    # True si estamos en horario de negociación (lunes a viernes, 9:30-16:00 hora de Nueva York).
+    ahora = (ahora or datetime.now(ZONA_MERCADO)).astimezone(ZONA_MERCADO)
+    if ahora.weekday() >= 5:
+        return False
+    minutos = ahora.hour * 60 + ahora.minute
+    return APERTURA[0] * 60 + APERTURA[1] <= minutos < CIERRE[0] * 60 + CIERRE[1]
+
+
+def segundos_hasta_apertura(ahora: datetime = None):
+    # Segundos que faltan hasta la próxima apertura del mercado.
+    ahora = (ahora or datetime.now(ZONA_MERCADO)).astimezone(ZONA_MERCADO)
+    apertura = ahora.replace(hour=APERTURA[0], minute=APERTURA[1], second=0, microsecond=0)
+    if apertura <= ahora:
+        apertura += timedelta(days=1)
+    while apertura.weekday() >= 5:
+        apertura += timedelta(days=1)
+    return (apertura - ahora).total_seconds()
+
+
+def ttl_sesion(ahora: datetime = None):
+    # TTL de una serie según la sesión: corto con el mercado abierto,
+    # y hasta la siguiente apertura cuando está cerrado (no entran velas nuevas).
+    if mercado_abierto(ahora):
+        return TTL_MERCADO_ABIERTO
+    return max(TTL_MINIMO_CERRADO, segundos_hasta_apertura(ahora))
+
+
+def ttl_restante(actualizado: float):
+    # Segundos de vigencia que le quedan a una serie guardada en el momento 'actualizado' (epoch).
+    momento = datetime.fromtimestamp(actualizado, ZONA_MERCADO)
+    return actualizado + ttl_sesion(momento) - time.time()
+
+
+# CACHÉ TTL + LRU
+
+def _tamano_bytes(valor):
+    if isinstance(valor, SerieOHLCV):
+        return valor.nbytes
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, (bytes, str)):
+        return len(valor)
+    if isinstance(valor, tuple):
+        return sum(_tamano_bytes(v) for v in valor)
+    return 0
+
+
+class CacheSeries:
+    # Caché en memoria del proceso para las series descargadas de Twelve Data.
+    # Cada entrada caduca según su TTL y, si se supera el número de entradas o
+    # la memoria máxima, se expulsan las menos usadas recientemente (LRU).
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS, max_bytes: int = MAX_BYTES):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()  # clave -> (valor, caduca_en, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.caducadas = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+
+            valor, caduca_en, _ = entrada
+            if caduca_en <= time.monotonic():
+                self._quitar(clave)
+                self.caducadas += 1
+                self.fallos += 1
+                return None
+
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor, ttl: float = None):
+        ttl = ttl_sesion() if ttl is None else ttl
+        tamano = _tamano_bytes(valor)
+
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            # Una entrada más grande que toda la caché no se guarda
+            if tamano > self.max_bytes:
+                return
+
+            self._datos[clave] = (valor, time.monotonic() + ttl, tamano)
+            self._bytes += tamano
+
+            while len(self._datos) > self.max_entradas or self._bytes > self.max_bytes:
+                clave_antigua = next(iter(self._datos))
+                self._quitar(clave_antigua)
+                self.expulsiones += 1
+
+    def invalidar(self, clave=None):
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+                self._bytes = 0
+            elif clave in self._datos:
+                self._quitar(clave)
+
+    def _quitar(self, clave):
+        _, _, tamano = self._datos.pop(clave)
+        self._bytes -= tamano
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_entradas": self.max_entradas,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+                "caducadas": self.caducadas,
+                "ratio_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "mercado_abierto": mercado_abierto()
+            }
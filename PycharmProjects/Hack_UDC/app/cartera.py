@@ -0,0 +1,180 @@
+
+# LIBRERÍAS
+import os
+
+import numpy as np
+
+from app.series import SerieOHLCV
+
+
+# ANÁLISIS DE CARTERA
+# N series (locales o de Twelve Data) se alinean en el calendario común y todo lo demás
+# es álgebra lineal de NumPy sobre la matriz de rendimientos (T barras x N activos):
+# correlación y covarianza, beta frente a un índice de referencia, Sharpe/Sortino y
+# los pesos de mínima varianza y de máximo Sharpe (cartera tangente), en forma cerrada.
+# Con muchos activos y pocas barras (500 tickers, un año) la covarianza muestral no es
+# invertible, así que para optimizar se usa la contracción de Ledoit-Wolf hacia la
+# identidad escalada. Los pesos admiten posiciones cortas (negativos).
+
+TASA_LIBRE = float(os.getenv("CARTERA_TASA_LIBRE", 0.0))   # anual, en tanto por uno
+BENCHMARK = os.getenv("CARTERA_BENCHMARK", "SPY")
+MIN_OBSERVACIONES = 20
+
+# Barras por año de cada intervalo (para anualizar rendimientos y volatilidades)
+PERIODOS_ANUALES = {"1day": 252, "1week": 52, "1month": 12, "1year": 1}
+
+
+def _redondear(x, decimales: int = 4):
+    # Números o listas JSON: NaN/inf (sin varianza, sin caídas...) pasan a None
+    x = np.round(np.asarray(x, dtype=np.float64), decimales)
+    if x.ndim == 0:
+        return float(x) if np.isfinite(x) else None
+    validos = np.isfinite(x)
+    if validos.all():
+        return x.tolist()
+    objetos = x.astype(object)
+    objetos[~validos] = None
+    return objetos.tolist()
+
+
+# ALINEAR CIERRES EN UN CALENDARIO COMÚN
+
+def alinear(datos: dict):
+    # (tiempos en segundos, matriz de cierres T x N) con las barras en que cotizan todos
+    series = list(datos.values())
+    segundos = [s.tiempos * s.unidad for s in series]
+    comunes = segundos[0]
+    for t in segundos[1:]:
+        comunes = np.intersect1d(comunes, t, assume_unique=True)
+
+    cierres = np.empty((len(comunes), len(series)), dtype=np.float64)
+    for j, (s, t) in enumerate(zip(series, segundos)):
+        cierres[:, j] = s.close[np.searchsorted(t, comunes)]
+    return comunes, cierres
+
+
+# COVARIANZA CONTRAÍDA (LEDOIT-WOLF)
+
+def ledoit_wolf(rendimientos: np.ndarray):
+    # Sigma = delta * m * I + (1 - delta) * S, con la intensidad 'delta' óptima estimada
+    # de los propios datos. Devuelve (covarianza contraída, delta).
+    t, n = rendimientos.shape
+    x = rendimientos - rendimientos.mean(axis=0)
+    s = x.T @ x / t
+    m = np.trace(s) / n
+    d2 = ((s - m * np.eye(n)) ** 2).sum() / n
+    if d2 <= 0:
+        return s, 0.0
+    # Varianza de S estimada a partir de cada observación: ||x x' - S||^2 sin formar x x'
+    normas = (x ** 2).sum(axis=1)
+    b2 = (normas ** 2 - 2 * ((x @ s) * x).sum(axis=1) + (s ** 2).sum()).sum() / (t ** 2 * n)
+    delta = min(b2, d2) / d2
+    return delta * m * np.eye(n) + (1 - delta) * s, float(delta)
+
+
+# PESOS ÓPTIMOS (forma cerrada, sum(w) = 1)
+
+def _resolver(a: np.ndarray, b: np.ndarray):
+    # Sigma^-1 b sin invertir Sigma; si aun así es singular (series constantes), mínimos cuadrados
+    try:
+        return np.linalg.solve(a, b)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(a, b, rcond=None)[0]
+
+
+def pesos_minima_varianza(covarianza: np.ndarray):
+    w = _resolver(covarianza, np.ones(len(covarianza)))
+    return w / w.sum()
+
+
+def pesos_maximo_sharpe(covarianza: np.ndarray, exceso: np.ndarray):
+    # Cartera tangente: w proporcional a Sigma^-1 (mu - rf). Si ninguna combinación
+    # tiene exceso de rendimiento positivo no existe y se devuelve None.
+    w = _resolver(covarianza, exceso)
+    if w.sum() <= 0:
+        return None
+    return w / w.sum()
+
+
+# ANÁLISIS COMPLETO
+
+def analizar(datos: dict, benchmark: SerieOHLCV = None, tasa_libre: float = TASA_LIBRE,
+             periodos_anuales: int = 252):
+    # 'datos' ticker -> SerieOHLCV; 'benchmark' la serie del índice de referencia (opcional).
+    if len(datos) < 2:
+        return {"error": "Se necesitan al menos dos empresas para analizar una cartera."}
+
+    tickers = list(datos)
+    alineables = dict(datos)
+    if benchmark is not None:
+        alineables["__benchmark__"] = benchmark
+    tiempos, cierres = alinear(alineables)
+    if len(tiempos) <= MIN_OBSERVACIONES:
+        return {"error": f"Solo {len(tiempos)} barras comunes entre las empresas. "
+                         f"Se requieren al menos {MIN_OBSERVACIONES + 1}."}
+
+    r = cierres[1:] / cierres[:-1] - 1
+    r_indice = r[:, -1] if benchmark is not None else None
+    if benchmark is not None:
+        r = r[:, :-1]
+    k = periodos_anuales
+    rf = tasa_libre / k
+
+    media = r.mean(axis=0)
+    covarianza = np.cov(r, rowvar=False)
+    desviacion = np.sqrt(np.diag(covarianza))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlacion = covarianza / np.outer(desviacion, desviacion)
+        abajo = np.sqrt((np.minimum(r - rf, 0) ** 2).mean(axis=0))
+        sharpe = (media - rf) / desviacion * np.sqrt(k)
+        sortino = (media - rf) / abajo * np.sqrt(k)
+        beta = None
+        if r_indice is not None:
+            indice = r_indice - r_indice.mean()
+            beta = (r - media).T @ indice / (indice @ indice)
+
+    # Optimización con la covarianza contraída
+    contraida, delta = ledoit_wolf(r)
+    carteras = {
+        "minima_varianza": pesos_minima_varianza(contraida),
+        "maximo_sharpe": pesos_maximo_sharpe(contraida, media - rf),
+        "equiponderada": np.full(len(tickers), 1 / len(tickers))
+    }
+
+    def _cartera(w):
+        if w is None:
+            return None
+        rendimiento = float(w @ media) * k
+        volatilidad = float(np.sqrt(w @ covarianza @ w * k))
+        return {
+            "pesos": dict(zip(tickers, _redondear(w))),
+            "rendimiento_anual": _redondear(rendimiento),
+            "volatilidad_anual": _redondear(volatilidad),
+            "sharpe": _redondear((rendimiento - tasa_libre) / volatilidad) if volatilidad else None
+        }
+
+    activos = {
+        t: {
+            "rendimiento_anual": rendimiento,
+            "volatilidad_anual": volatilidad,
+            "sharpe": s,
+            "sortino": so,
+            "beta": b
+        }
+        for t, rendimiento, volatilidad, s, so, b in zip(
+            tickers, _redondear(media * k), _redondear(desviacion * np.sqrt(k)), _redondear(sharpe),
+            _redondear(sortino), _redondear(beta) if beta is not None else [None] * len(tickers))
+    }
+
+    return {
+        "tickers": tickers,
+        "observaciones": len(r),
+        "desde": str(np.datetime64(int(tiempos[0]), "s").astype("datetime64[D]")),
+        "hasta": str(np.datetime64(int(tiempos[-1]), "s").astype("datetime64[D]")),
+        "tasa_libre": tasa_libre,
+        "activos": activos,
+        "correlacion": _redondear(correlacion),
+        "covarianza_anual": _redondear(covarianza * k, 6),
+        "carteras": {nombre: _cartera(w) for nombre, w in carteras.items()},
+        "contraccion_covarianza": _redondear(delta)
+    }
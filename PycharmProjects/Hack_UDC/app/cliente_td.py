@@ -0,0 +1,351 @@
+
+# LIBRERÍAS
+import asyncio
+import math
+import os
+import threading
+import time
+
+import httpx
+import pandas as pd
+
+from app import concurrencia
+from app.metricas import tramo
+
+
+# Cliente HTTP para la API REST de Twelve Data (asíncrono para los endpoints y
+# síncrono para el código antiguo). Una única sesión con pool de conexiones
+# keep-alive por proceso, timeouts y reintentos. Con TWELVE_DATA_URL apuntando
+# al servidor simulado (app/stub_td.py) todo funciona sin red.
+
+URL_BASE = os.getenv("TWELVE_DATA_URL", "https://api.twelvedata.com")
+TIMEOUT = httpx.Timeout(float(os.getenv("TWELVE_DATA_TIMEOUT", 10)), connect=5.0)
+LIMITES_POOL = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+REINTENTOS = int(os.getenv("TWELVE_DATA_REINTENTOS", 3))
+ESPERA_BASE = 0.5  # segundos, se duplica en cada reintento
+
+_cliente = None
+_cliente_sync = None
+
+
+def cliente():
+    global _cliente
+    if _cliente is None or _cliente.is_closed:
+        _cliente = httpx.AsyncClient(base_url=URL_BASE, timeout=TIMEOUT, limits=LIMITES_POOL)
+    return _cliente
+
+
+def cliente_sync():
+    global _cliente_sync
+    if _cliente_sync is None or _cliente_sync.is_closed:
+        _cliente_sync = httpx.Client(base_url=URL_BASE, timeout=TIMEOUT, limits=LIMITES_POOL)
+    return _cliente_sync
+
+
+def usar_transporte(transporte: httpx.AsyncBaseTransport, url_base: str = "http://twelvedata.local"):
+    # Dirige el cliente asíncrono a otro transporte, p. ej. el servidor simulado dentro
+    # del mismo proceso: httpx.ASGITransport(app=stub_td.app). Lo usan los benchmarks.
+    global _cliente
+    _cliente = httpx.AsyncClient(base_url=url_base, transport=transporte, timeout=TIMEOUT)
+
+
+async def cerrar():
+    global _cliente, _cliente_sync
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+    if _cliente_sync is not None:
+        _cliente_sync.close()
+        _cliente_sync = None
+
+
+# CLAVES DE API Y LÍMITE DE CRÉDITOS
+# Se pueden repartir las peticiones entre varias cuentas (TWELVE_DATA_KEYS=k1,k2,...).
+# Cada clave tiene su propio token bucket con los créditos por minuto del plan
+# (en un batch cada símbolo gasta un crédito). Si no queda presupuesto, la
+# petición espera en cola (por orden de llegada) hasta ESPERA_MAXIMA segundos;
+# un 429 de Twelve Data vacía el cubo de esa clave para que se usen las demás.
+
+CREDITOS_MINUTO = float(os.getenv("TWELVE_DATA_CREDITOS_MINUTO", 8))  # Plan gratuito
+SELECCION = os.getenv("TWELVE_DATA_SELECCION", "menos_usada")  # "menos_usada" o "rotatoria"
+ESPERA_MAXIMA = float(os.getenv("TWELVE_DATA_ESPERA_MAX", 20))  # segundos
+
+
+class LimiteAlcanzado(Exception):
+    def __init__(self, espera: float):
+        self.espera = espera
+        super().__init__(f"Límite de créditos por minuto alcanzado, vuelve a intentarlo en {math.ceil(espera)} s.")
+
+
+class GestorClaves:
+
+    def __init__(self, claves: list, por_minuto: float = CREDITOS_MINUTO, seleccion: str = SELECCION):
+        self.claves = list(dict.fromkeys(claves))
+        self.seleccion = seleccion
+        self._cubos = {c: concurrencia.CuboTokens(por_minuto) for c in self.claves}
+        self._usos = dict.fromkeys(self.claves, 0)
+        self._rechazos = dict.fromkeys(self.claves, 0)  # respuestas 429
+        self._turno = 0
+        self._lock = threading.Lock()
+        self._cola = None  # asyncio.Lock, se crea en el bucle de eventos activo
+
+    def _candidatas(self, n: float):
+        if self.seleccion == "rotatoria":
+            self._turno = (self._turno + 1) % len(self.claves)
+            return self.claves[self._turno:] + self.claves[:self._turno]
+        # La que antes tenga créditos y, a igualdad, la menos usada
+        return sorted(self.claves, key=lambda c: (self._cubos[c].espera(n), self._usos[c]))
+
+    def _reservar(self, n: float):
+        # Devuelve (clave, 0) si ha podido gastar 'n' créditos, o (None, segundos de espera)
+        with self._lock:
+            n = min(n, CREDITOS_MINUTO)
+            for clave in self._candidatas(n):
+                if self._cubos[clave].intentar(n):
+                    self._usos[clave] += 1
+                    return clave, 0.0
+            return None, self._espera(n)
+
+    def _espera(self, n: float):
+        return min((cubo.espera(n) for cubo in self._cubos.values()), default=0.0)
+
+    async def adquirir(self, n: float, limite: float):
+        # 'limite' es el instante (time.monotonic) a partir del cual se renuncia
+        if self._cola is None:
+            self._cola = asyncio.Lock()
+        try:
+            await asyncio.wait_for(self._cola.acquire(), timeout=max(0.001, limite - time.monotonic()))
+        except asyncio.TimeoutError:
+            with self._lock:
+                raise LimiteAlcanzado(self._espera(min(n, CREDITOS_MINUTO)))
+        try:
+            while True:
+                clave, espera = self._reservar(n)
+                if clave is not None:
+                    return clave
+                if time.monotonic() + espera > limite:
+                    raise LimiteAlcanzado(espera)
+                await asyncio.sleep(espera)
+        finally:
+            self._cola.release()
+
+    def adquirir_sync(self, n: float, limite: float):
+        while True:
+            clave, espera = self._reservar(n)
+            if clave is not None:
+                return clave
+            if time.monotonic() + espera > limite:
+                raise LimiteAlcanzado(espera)
+            time.sleep(espera)
+
+    def rechazada(self, clave: str):
+        with self._lock:
+            self._cubos[clave].vaciar()
+            self._rechazos[clave] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "claves": len(self.claves),
+                "seleccion": self.seleccion,
+                "creditos_minuto": CREDITOS_MINUTO,
+                "por_clave": [{
+                    "clave": c[:4] + "…",
+                    "peticiones": self._usos[c],
+                    "rechazos_429": self._rechazos[c],
+                    "espera_segundos": round(self._cubos[c].espera(1), 2)
+                } for c in self.claves]
+            }
+
+
+_claves = None
+
+
+def claves():
+    # Se leen en el primer uso (después de cargar el .env)
+    global _claves
+    if _claves is None:
+        lista = os.getenv("TWELVE_DATA_KEYS") or os.getenv("TWELVE_DATA_KEY") or ""
+        _claves = GestorClaves([c.strip() for c in lista.split(",") if c.strip()])
+    return _claves
+
+
+# PETICIÓN CON REINTENTOS
+
+def _revisar(resp: httpx.Response, clave: str):
+    # (datos, None) si la respuesta vale, o (None, motivo) si hay que reintentar.
+    if resp.status_code == 429:
+        claves().rechazada(clave)
+        return None, "HTTP 429"
+    if resp.status_code >= 500:
+        return None, f"HTTP {resp.status_code}"
+    resp.raise_for_status()
+    datos = resp.json()
+    # Twelve Data también avisa del límite con HTTP 200 y {"code": 429, "status": "error"}
+    if isinstance(datos, dict) and datos.get("code") == 429:
+        claves().rechazada(clave)
+        return None, datos.get("message") or "HTTP 429"
+    return datos, None
+
+
+async def _get(ruta: str, params: dict, creditos: int = 1):
+    # Reintenta errores de red, 5xx y 429 con espera exponencial (sin esperar tras el último intento).
+    limite = time.monotonic() + ESPERA_MAXIMA
+    ultimo_error = None
+    for intento in range(REINTENTOS):
+        clave = await claves().adquirir(creditos, limite)
+        try:
+            with tramo("descarga"):
+                resp = await cliente().get(ruta, params={**params, "apikey": clave})
+                datos, ultimo_error = _revisar(resp, clave)
+            if ultimo_error is None:
+                return datos
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            ultimo_error = str(e) or type(e).__name__
+
+        if intento < REINTENTOS - 1:
+            await asyncio.sleep(ESPERA_BASE * 2 ** intento)
+
+    raise RuntimeError(f"Sin respuesta tras {REINTENTOS} intentos ({ultimo_error})")
+
+
+def _get_sync(ruta: str, params: dict, creditos: int = 1):
+    limite = time.monotonic() + ESPERA_MAXIMA
+    ultimo_error = None
+    for intento in range(REINTENTOS):
+        clave = claves().adquirir_sync(creditos, limite)
+        try:
+            with tramo("descarga"):
+                resp = cliente_sync().get(ruta, params={**params, "apikey": clave})
+                datos, ultimo_error = _revisar(resp, clave)
+            if ultimo_error is None:
+                return datos
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            ultimo_error = str(e) or type(e).__name__
+
+        if intento < REINTENTOS - 1:
+            time.sleep(ESPERA_BASE * 2 ** intento)
+
+    raise RuntimeError(f"Sin respuesta tras {REINTENTOS} intentos ({ultimo_error})")
+
+
+# CONVERSIÓN A DATAFRAME (mismo formato que td.time_series(...).as_pandas())
+
+@tramo("normalizacion")
+def valores_a_dataframe(valores: list):
+    df = pd.DataFrame(valores)
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    df = df.set_index('datetime').sort_index()
+    return df.apply(pd.to_numeric, errors='coerce')
+
+
+def serie_vacia():
+    return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'], dtype=float,
+                        index=pd.DatetimeIndex([], name='datetime'))
+
+
+def sin_velas_nuevas(mensaje: str):
+    # Twelve Data responde con error cuando no hay velas en el rango pedido.
+    return "no data is available" in mensaje.lower()
+
+
+def formatear_fecha(fecha: pd.Timestamp):
+    return fecha.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _interpretar(symbol: str, datos: dict, incremental: bool = False):
+    # Convierte la respuesta de un símbolo en DataFrame o en {"error": ...}
+    # En una descarga incremental, "no hay datos" significa "no hay velas nuevas".
+    if datos.get("status") == "error":
+        mensaje = datos.get("message", "")
+        if incremental and sin_velas_nuevas(mensaje):
+            return serie_vacia()
+        if "api key" in mensaje.lower():
+            return {"error": "API Key inválida o expirada."}
+        return {"error": f"Error en Twelve Data: {mensaje}"}
+
+    valores = datos.get("values")
+    if not valores:
+        if incremental:
+            return serie_vacia()
+        return {"error": f"No se encontraron datos para {symbol}. Revisa el ticker."}
+
+    return valores_a_dataframe(valores)
+
+
+# DESCARGAR DATOS DE UNA EMPRESA
+
+SIN_CLAVE = {"error": "No se encontró TWELVE_DATA_KEY en el archivo .env"}
+
+
+def _parametros(symbol: str, interval: str, outputsize: int, desde: pd.Timestamp = None):
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "outputsize": outputsize,
+        "order": "ASC"
+    }
+    # Descarga incremental: solo velas desde la última guardada (incluida, por si estaba a medias)
+    if desde is not None:
+        params["start_date"] = formatear_fecha(desde)
+    return params
+
+
+async def descargar_datos_async(symbol: str, interval: str = "1day", outputsize: int = 365,
+                                desde: pd.Timestamp = None):
+    try:
+        if not claves().claves:
+            return dict(SIN_CLAVE)
+
+        datos = await _get("/time_series", _parametros(symbol, interval, outputsize, desde))
+        return _interpretar(symbol, datos, incremental=desde is not None)
+    except Exception as e:
+        return {"error": f"Error en Twelve Data: {str(e)}"}
+
+
+def descargar_datos(symbol: str, interval: str = "1day", outputsize: int = 365, desde: pd.Timestamp = None):
+    # Versión síncrona (comparte claves, límites y pool de conexiones)
+    try:
+        if not claves().claves:
+            return dict(SIN_CLAVE)
+
+        datos = _get_sync("/time_series", _parametros(symbol, interval, outputsize, desde))
+        return _interpretar(symbol, datos, incremental=desde is not None)
+    except Exception as e:
+        return {"error": f"Error en Twelve Data: {str(e)}"}
+
+
+# DESCARGAR VARIAS EMPRESAS EN UNA SOLA PETICIÓN (batch de Twelve Data)
+
+MAX_LOTE = int(os.getenv("TWELVE_DATA_MAX_LOTE", 50))
+
+
+async def descargar_lote_async(symbols: list, interval: str = "1day", outputsize: int = 365,
+                               desde: pd.Timestamp = None):
+    # Devuelve {ticker: DataFrame | {"error": ...}}. Se piden hasta MAX_LOTE símbolos
+    # por petición (separados por comas, sin pasar de los créditos por minuto de una
+    # clave) y los bloques se lanzan a la vez.
+    if not claves().claves:
+        return {s: dict(SIN_CLAVE) for s in symbols}
+
+    async def bloque(simbolos):
+        if len(simbolos) == 1:
+            return {simbolos[0]: await descargar_datos_async(simbolos[0], interval, outputsize, desde)}
+        try:
+            datos = await _get("/time_series", _parametros(",".join(simbolos), interval, outputsize, desde),
+                               creditos=len(simbolos))
+        except Exception as e:
+            return {s: {"error": f"Error en Twelve Data: {str(e)}"} for s in simbolos}
+
+        # Un error global (p. ej. API key) llega sin desglosar por símbolo
+        incremental = desde is not None
+        if datos.get("status") == "error":
+            return {s: _interpretar(s, datos, incremental) for s in simbolos}
+        return {s: _interpretar(s, datos.get(s, {}), incremental) for s in simbolos}
+
+    tamano = max(1, min(MAX_LOTE, int(CREDITOS_MINUTO)))
+    bloques = [symbols[i:i + tamano] for i in range(0, len(symbols), tamano)]
+    resultados = {}
+    for parcial in await asyncio.gather(*(bloque(b) for b in bloques)):
+        resultados.update(parcial)
+    return resultados
@@ -0,0 +1,131 @@
+
+# LIBRERÍAS
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+# EJECUTORES
+# El trabajo bloqueante (lecturas de SQLite, pandas) nunca se ejecuta en el bucle
+# de eventos de FastAPI. Los entrenamientos de Prophet van aparte, al pool de
+# procesos de app/pronostico.py, así que no compiten por estos hilos.
+
+HILOS_LIGERO = int(os.getenv("HILOS_LIGERO", 16))
+
+EJECUTOR_LIGERO = ThreadPoolExecutor(max_workers=HILOS_LIGERO, thread_name_prefix="ligero")
+
+
+# LÍMITES DE CONCURRENCIA POR ENDPOINT
+
+LIMITES = {
+    "stock": int(os.getenv("LIMITE_STOCK", 32)),
+    "compare": int(os.getenv("LIMITE_COMPARE", 16)),
+    "predict": int(os.getenv("LIMITE_PREDICT", 8)),
+    "insert": int(os.getenv("LIMITE_INSERT", 4)),
+}
+
+_semaforos = {}
+
+
+def semaforo(endpoint: str):
+    # Los semáforos se crean perezosamente para que pertenezcan al bucle de eventos activo.
+    if endpoint not in _semaforos:
+        _semaforos[endpoint] = asyncio.Semaphore(LIMITES.get(endpoint, 8))
+    return _semaforos[endpoint]
+
+
+async def ejecutar(fn, *args, ejecutor=EJECUTOR_LIGERO, **kwargs):
+    # Ejecuta una función bloqueante en un pool de hilos y espera su resultado.
+    # Se copia el contexto para que los tiempos por etapa lleguen a la petición.
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    return await loop.run_in_executor(ejecutor, partial(contexto.run, fn, *args, **kwargs))
+
+
+# LIMITADOR DE TASA (TOKEN BUCKET)
+
+class CuboTokens:
+    # 'por_minuto' fichas que se reponen de forma continua, con un máximo de 'capacidad'.
+    # adquirir() espera (sin bloquear el bucle) hasta que haya fichas suficientes.
+
+    def __init__(self, por_minuto: float, capacidad: float = None):
+        self.ritmo = por_minuto / 60.0
+        self.capacidad = capacidad or por_minuto
+        self.fichas = self.capacidad
+        self._ultima = time.monotonic()
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self._ultima) * self.ritmo)
+        self._ultima = ahora
+
+    def intentar(self, n: float = 1):
+        # Consume 'n' fichas si las hay, sin esperar. Devuelve True si lo consiguió.
+        self._reponer()
+        if self.fichas >= n:
+            self.fichas -= n
+            return True
+        return False
+
+    def espera(self, n: float = 1):
+        # Segundos que faltan para tener 'n' fichas.
+        self._reponer()
+        return max(0.0, (n - self.fichas) / self.ritmo)
+
+    def vaciar(self):
+        self._reponer()
+        self.fichas = 0.0
+
+    async def adquirir(self, n: float = 1):
+        while not self.intentar(n):
+            await asyncio.sleep(self.espera(n))
+
+
+# UN SOLO VUELO (agrupación de llamadas concurrentes)
+
+class UnSoloVuelo:
+    # Las llamadas simultáneas con la misma clave (operación, ticker, versión de los datos...)
+    # comparten una única ejecución: la primera lanza la tarea y las demás esperan su
+    # resultado. La tarea sigue aunque quien la lanzó se cancele (otros pueden esperarla).
+    # El primer elemento de la clave es el nombre de la operación (para las métricas).
+
+    def __init__(self):
+        self._en_vuelo = {}  # clave -> asyncio.Task
+        self._contadores = {}  # operación -> [ejecuciones, agrupadas]
+
+    def en_curso(self, clave):
+        # Tarea en marcha para la clave (o None), para unirse a ella desde fuera
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self._contadores.setdefault(clave[0], [0, 0])[1] += 1
+        return tarea
+
+    def lanzar(self, clave, fn, *args, **kwargs):
+        # Devuelve la tarea en marcha para la clave o lanza una nueva (sin esperar: la
+        # tarea queda registrada antes de que otra corrutina pueda buscarla)
+        tarea = self.en_curso(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(fn(*args, **kwargs))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+            self._contadores.setdefault(clave[0], [0, 0])[0] += 1
+        return tarea
+
+    async def ejecutar(self, clave, fn, *args, **kwargs):
+        return await asyncio.shield(self.lanzar(clave, fn, *args, **kwargs))
+
+    def estadisticas(self):
+        return {
+            "en_vuelo": len(self._en_vuelo),
+            "operaciones": {op: {"ejecuciones": e, "agrupadas": a} for op, (e, a) in self._contadores.items()}
+        }
+
+
+VUELOS = UnSoloVuelo()
+
+
+def cerrar():
+    EJECUTOR_LIGERO.shutdown(wait=False, cancel_futures=True)
@@ -3,13 +3,87 @@ import requests
 import pandas as pd
 import plotly.express as px
 import json
+import os
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuración de la API
-API_URL = "https://hack-udc-api-1.onrender.com"
+API_URL = os.getenv("API_URL", "https://hack-udc-api-1.onrender.com")
+TIMEOUT_CONEXION = float(os.getenv("DASHBOARD_TIMEOUT_CONEXION_S", 5))
+TIMEOUT_LECTURA = float(os.getenv("DASHBOARD_TIMEOUT_S", 60))
+TIMEOUT_PREDICCION = float(os.getenv("DASHBOARD_TIMEOUT_PREDICCION_S", 180))
+TTL_DATOS = int(os.getenv("DASHBOARD_TTL_S", 60))
+TTL_PREDICCION = int(os.getenv("DASHBOARD_TTL_PREDICCION_S", 900))
 
 st.set_page_config(page_title="IA de stock - Dashboard", layout="wide", initial_sidebar_state="expanded")
 
+
+# --- 0. CLIENTE DE LA API ---
+# Streamlit vuelve a ejecutar el script entero con cada interacción, así que todo lo que
+# dura más que una ejecución vive en cachés compartidas por todas las sesiones:
+# - una sola sesión HTTP (keep-alive, pool de conexiones y reintentos ante 502/503/504,
+#   típicos de Render al despertar), en lugar de abrir una conexión TLS por petición;
+# - las respuestas GET por (ruta, parámetros) con caducidad: repetir una consulta o
+#   cambiar de pantalla y volver no genera otra petición a la API.
+# Los errores no se guardan en caché (se lanzan como ErrorAPI), así que se reintentan.
+
+class ErrorAPI(Exception):
+
+    def __init__(self, estado: int, detalle: str):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+
+
+@st.cache_resource
+def _sesion():
+    sesion = requests.Session()
+    reintentos = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                       allowed_methods=frozenset({"GET"}))
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=reintentos)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def _detalle(res):
+    try:
+        return res.json().get("detail", res.text)
+    except ValueError:
+        return res.text or res.reason
+
+
+def _pedir(ruta: str, params: dict = None, timeout: float = TIMEOUT_LECTURA):
+    res = _sesion().get(f"{API_URL}{ruta}", params=params, timeout=(TIMEOUT_CONEXION, timeout))
+    if res.status_code != 200:
+        raise ErrorAPI(res.status_code, _detalle(res))
+    return res.json()
+
+
+@st.cache_data(ttl=TTL_DATOS, show_spinner=False, max_entries=500)
+def consultar(ruta: str, params: dict = None):
+    # /stock, /compare...: la API ya responde desde su caché, aquí se ahorra el viaje
+    return _pedir(ruta, params)
+
+
+@st.cache_data(ttl=TTL_PREDICCION, show_spinner=False, max_entries=100)
+def consultar_prediccion(ruta: str, params: dict = None):
+    # Las predicciones cambian como mucho una vez al día y tardan más en calcularse
+    return _pedir(ruta, params, TIMEOUT_PREDICCION)
+
+
+def enviar(ruta: str, **kwargs):
+    # POST (cargas de datos). Tras una carga correcta se vacía la caché local de
+    # consultas para que el nuevo ticker se vea al momento.
+    res = _sesion().post(f"{API_URL}{ruta}", timeout=(TIMEOUT_CONEXION, TIMEOUT_PREDICCION), **kwargs)
+    if res.status_code != 200:
+        raise ErrorAPI(res.status_code, _detalle(res))
+    consultar.clear()
+    consultar_prediccion.clear()
+    return res.json()
+
+
 # --- 1. ESTILOS GLOBALES ---
 st.markdown("""
     <script src="https://cdn.tailwindcss.com?plugins=forms,container-queries"></script>
@@ -84,10 +158,8 @@ if menu == "Consultar Ticker":
     if btn_consultar and ticker:
         with st.spinner(f'Buscando {ticker} en intervalo {intervalo}...'):
             try:
-                res = requests.get(f"{API_URL}/stock/{ticker}", params={"interval": api_param})
-
-                if res.status_code == 200:
-                    data = res.json()
+                data = consultar(f"/stock/{ticker}", {"interval": api_param})
+                if data:
                     met = data["metricas"]
                     hist = data["historial_cierre"]
 
@@ -126,8 +198,8 @@ if menu == "Consultar Ticker":
                         fig.update_xaxes(dtick="M1", tickformat="%b %Y")
 
                     st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.error(f"Error {res.status_code}: No se pudo obtener información.")
+            except ErrorAPI as e:
+                st.error(f"Error {e.estado}: No se pudo obtener información. {e.detalle}")
             except Exception as e:
                 st.error(f"Fallo de conexión: {str(e)}")
 
@@ -149,28 +221,30 @@ elif menu == "Cargar Datos Manuales":
 
         if metodo == "Subir Archivo CSV":
             ticker_manual = st.text_input("Asignar Ticker", placeholder="Ej: MI_EMPRESA").upper()
-            uploaded_file = st.file_uploader("Cargar archivo CSV con historial", type="csv")
+            uploaded_file = st.file_uploader("Cargar archivo CSV con historial", type=["csv", "parquet"])
 
             if st.button("Guardar CSV en Base de Datos"):
                 if uploaded_file and ticker_manual:
-                    df_upload = pd.read_csv(uploaded_file)
-                    datos_json = df_upload.to_dict(orient="records")
-                    payload = {"ticker": ticker_manual, "datos": datos_json}
-                    res = requests.post(f"{API_URL}/insert-manual", json=payload)
-                    if res.status_code == 200:
+                    # El fichero se envía tal cual: la API lo procesa por bloques en streaming
+                    formato = "parquet" if uploaded_file.name.lower().endswith(".parquet") else "csv"
+                    try:
+                        enviar(f"/insert-bulk/{ticker_manual}", data=uploaded_file, params={"formato": formato})
                         st.success(f"¡Éxito! {ticker_manual} ya está disponible.")
-                    else:
-                        st.error(f"Error: {res.json().get('detail', 'Error desconocido')}")
+                    except ErrorAPI as e:
+                        st.error(f"Error: {e.detalle or 'Error desconocido'}")
+                    except requests.RequestException as e:
+                        st.error(f"Fallo de conexión: {e}")
         else:
             json_input = st.text_area("Datos JSON:", height=300, placeholder='{"ticker": "ABC", "datos": [...]}')
             if st.button("Enviar JSON a la API"):
                 try:
                     payload = json.loads(json_input)
-                    res = requests.post(f"{API_URL}/insert-manual", json=payload)
-                    if res.status_code == 200:
-                        st.success(f"¡Datos cargados correctamente!")
-                    else:
-                        st.error(f"Error de API: {res.json().get('detail', 'Estructura incorrecta')}")
+                    enviar("/insert-manual", json=payload)
+                    st.success(f"¡Datos cargados correctamente!")
+                except ErrorAPI as e:
+                    st.error(f"Error de API: {e.detalle or 'Estructura incorrecta'}")
+                except requests.RequestException as e:
+                    st.error(f"Fallo de conexión: {e}")
                 except:
                     st.error("Error: JSON no válido.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -197,9 +271,15 @@ elif menu == "Predicción IA":
 
     if btn_predecir and ticker_ia:
         with st.spinner('Entrenando Prophet...'):
-            response = requests.get(f"{API_URL}/predict/{ticker_ia}")
-            if response.status_code == 200:
-                raw_data = response.json()
+            try:
+                raw_data = consultar_prediccion(f"/predict/{ticker_ia}")
+            except ErrorAPI as e:
+                raw_data = None
+                st.error(f"Error {e.estado}: {e.detalle}")
+            except requests.RequestException as e:
+                raw_data = None
+                st.error(f"Fallo de conexión: {e}")
+            if raw_data:
                 ia_data = raw_data["ia_forecast"]
                 eficacia = ia_data["eficacia"]
                 preds = ia_data["prediccion_futura"]
@@ -250,27 +330,24 @@ elif menu == "Comparar Empresas":
         if st.button("Ejecutar Comparativa"):
             with st.spinner(f"Analizando {t1} vs {t2}..."):
                 try:
-                    response = requests.get(f"{API_URL}/compare/{t1}/{t2}")
-                    if response.status_code == 200:
-                        res_comp = response.json()
-                        lider = res_comp.get('lider-rendimiento')
-                        st.markdown(
-                            f'<div class="bg-[#13ec6d]/10 border border-[#13ec6d]/30 p-6 rounded-lg mb-8 text-center"><h3 class="text-[#13ec6d] text-4xl font-black">{lider}</h3></div>',
-                            unsafe_allow_html=True)
-
-                        col_a, col_b = st.columns(2)
-                        for col, ticker in zip([col_a, col_b], [t1, t2]):
-                            info = res_comp.get(ticker, {})
-                            with col:
-                                st.markdown(f"""
-                                <div class="bg-[#102218] p-4 rounded-lg border border-[#2d4a3b]">
-                                    <h4 class="text-white font-bold">{ticker}</h4>
-                                    <p class="text-2xl font-bold text-[#13ec6d]">{info.get('rendimiento_periodo')}</p>
-                                    <p class="text-gray-400 text-sm">Precio: ${info.get('ultimo_precio')}</p>
-                                    <p class="text-[10px] text-gray-500 mt-2">Origen: {info.get('fuente')}</p>
-                                </div>
-                                """, unsafe_allow_html=True)
-                    else:
-                        st.error("Error en la comparativa.")
+                    res_comp = consultar(f"/compare/{t1}/{t2}")
                 except Exception as e:
-                    st.error(f"Error: {e}")
\ No newline at end of file
+                    st.error(f"Error en la comparativa: {e}")
+                else:
+                    lider = res_comp.get('lider-rendimiento')
+                    st.markdown(
+                        f'<div class="bg-[#13ec6d]/10 border border-[#13ec6d]/30 p-6 rounded-lg mb-8 text-center"><h3 class="text-[#13ec6d] text-4xl font-black">{lider}</h3></div>',
+                        unsafe_allow_html=True)
+
+                    col_a, col_b = st.columns(2)
+                    for col, ticker in zip([col_a, col_b], [t1, t2]):
+                        info = res_comp.get(ticker, {})
+                        with col:
+                            st.markdown(f"""
+                            <div class="bg-[#102218] p-4 rounded-lg border border-[#2d4a3b]">
+                                <h4 class="text-white font-bold">{ticker}</h4>
+                                <p class="text-2xl font-bold text-[#13ec6d]">{info.get('rendimiento_periodo')}</p>
+                                <p class="text-gray-400 text-sm">Precio: ${info.get('ultimo_precio')}</p>
+                                <p class="text-[10px] text-gray-500 mt-2">Origen: {info.get('fuente')}</p>
+                            </div>
+                            """, unsafe_allow_html=True)
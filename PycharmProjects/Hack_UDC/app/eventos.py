@@ -0,0 +1,187 @@
+
+# LIBRERÍAS
+import asyncio
+import json
+import logging
+import os
+
+from app import api_engine as engine
+
+
+# EVENTOS EN DIRECTO (SERVER-SENT EVENTS)
+# Un centro de eventos por worker reparte cada evento entre todos los clientes
+# suscritos a su canal: el evento se codifica una sola vez y se deja en la cola de
+# cada suscriptor. Las colas tienen tamaño máximo; si un cliente lento se queda
+# atrás se descartan sus eventos más antiguos en lugar de frenar a los demás.
+# El último evento de cada canal se guarda para que quien se suscriba tarde empiece
+# con el estado actual.
+#
+# Precios: el primer cliente que se suscribe a un ticker arranca un vigilante que
+# revisa la serie cada STREAM_REFRESCO_S segundos (vía caché/almacén: Twelve Data solo
+# se consulta cuando caduca la caché) y publica la última vela y sus métricas cuando
+# cambian. Un refresco sirve a todos los suscriptores; con el último, el vigilante para.
+
+REFRESCO = float(os.getenv("STREAM_REFRESCO_S", 60))
+LATIDO = float(os.getenv("STREAM_LATIDO_S", 15))
+MAX_COLA = int(os.getenv("STREAM_MAX_COLA", 100))
+
+log = logging.getLogger("studystock.eventos")
+
+
+def formato_sse(tipo: str, datos: dict):
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class Suscripcion:
+
+    def __init__(self, canal, maximo: int = MAX_COLA):
+        self.canal = canal
+        self.cola = asyncio.Queue(maximo)
+
+    def entregar(self, evento: str):
+        # Devuelve True si hubo que descartar el evento más antiguo
+        descartado = self.cola.full()
+        if descartado:
+            self.cola.get_nowait()
+        self.cola.put_nowait(evento)
+        return descartado
+
+    async def eventos(self, latido: float = LATIDO):
+        # Eventos SSE ya codificados; un comentario de latido si no hay nada en 'latido' s
+        # (mantiene viva la conexión a través de proxies)
+        while True:
+            try:
+                yield await asyncio.wait_for(self.cola.get(), latido)
+            except asyncio.TimeoutError:
+                yield ": latido\n\n"
+
+
+class CentroEventos:
+    # Todo se usa desde el bucle de eventos del worker (sin hilos), así que no hay cerrojos.
+
+    def __init__(self, max_cola: int = MAX_COLA):
+        self.max_cola = max_cola
+        self._canales = {}   # canal -> set(Suscripcion)
+        self._ultimos = {}   # canal -> último evento codificado
+        self.publicados = 0
+        self.entregados = 0
+        self.descartados = 0
+
+    def publicar(self, canal, tipo: str, datos: dict):
+        evento = formato_sse(tipo, datos)
+        self.publicados += 1
+        suscriptores = self._canales.get(canal)
+        if not suscriptores:
+            return 0
+        self._ultimos[canal] = evento
+        for suscripcion in suscriptores:
+            self.descartados += suscripcion.entregar(evento)
+        self.entregados += len(suscriptores)
+        return len(suscriptores)
+
+    def suscribir(self, canal):
+        suscripcion = Suscripcion(canal, self.max_cola)
+        self._canales.setdefault(canal, set()).add(suscripcion)
+        if canal in self._ultimos:
+            suscripcion.entregar(self._ultimos[canal])
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        suscriptores = self._canales.get(suscripcion.canal)
+        if suscriptores is None:
+            return
+        suscriptores.discard(suscripcion)
+        if not suscriptores:
+            del self._canales[suscripcion.canal]
+            self._ultimos.pop(suscripcion.canal, None)
+
+    def suscriptores(self, canal):
+        return len(self._canales.get(canal, ()))
+
+    def estadisticas(self):
+        return {
+            "canales": len(self._canales),
+            "suscriptores": sum(len(s) for s in self._canales.values()),
+            "vigilantes": len(_vigilantes),
+            "publicados": self.publicados,
+            "entregados": self.entregados,
+            "descartados": self.descartados
+        }
+
+
+CENTRO = CentroEventos()
+
+
+# PRECIOS EN DIRECTO
+
+_vigilantes = {}  # ticker -> asyncio.Task
+_publicadas = {}  # ticker -> versión de la última serie publicada
+
+
+def canal_precio(ticker: str):
+    return ("precio", ticker)
+
+
+def evento_precio(ticker: str, serie):
+    # Última vela y métricas de /stock (las mismas que calcular_estadisticas)
+    fecha = serie.ultima_fecha
+    return {
+        "ticker": ticker,
+        "vela": {
+            "datetime": str(fecha.date()) if serie.unidad == 86400 else fecha.isoformat(),
+            "open": round(float(serie.open[-1]), 2),
+            "high": round(float(serie.high[-1]), 2),
+            "low": round(float(serie.low[-1]), 2),
+            "close": round(float(serie.close[-1]), 2),
+            "volume": int(serie.volume[-1]) if serie.volume[-1] == serie.volume[-1] else None
+        },
+        "metricas": engine.calcular_estadisticas(serie)
+    }
+
+
+def publicar_precio(ticker: str, serie):
+    # También la usa el planificador tras refrescar una serie. Solo se publica si hay
+    # suscriptores y la serie ha cambiado desde la última publicación.
+    if not CENTRO.suscriptores(canal_precio(ticker)) or not isinstance(serie, engine.SerieOHLCV) or not len(serie):
+        return
+    if _publicadas.get(ticker) != serie.version:
+        _publicadas[ticker] = serie.version
+        CENTRO.publicar(canal_precio(ticker), "precio", evento_precio(ticker, serie))
+
+
+async def _vigilar(ticker: str):
+    while CENTRO.suscriptores(canal_precio(ticker)):
+        try:
+            serie = await engine.obtener_datos_async(ticker)
+            if isinstance(serie, dict) and "error" in serie:
+                CENTRO.publicar(canal_precio(ticker), "error", {"ticker": ticker, "error": serie["error"]})
+            else:
+                publicar_precio(ticker, serie)
+        except Exception as e:
+            log.exception("Fallo al refrescar %s en directo: %s", ticker, e)
+        await asyncio.sleep(REFRESCO)
+
+
+def suscribir_precio(ticker: str):
+    suscripcion = CENTRO.suscribir(canal_precio(ticker))
+    tarea = _vigilantes.get(ticker)
+    if tarea is None or tarea.done():
+        tarea = _vigilantes[ticker] = asyncio.ensure_future(_vigilar(ticker))
+        tarea.add_done_callback(lambda t: _vigilantes.pop(ticker, None) if _vigilantes.get(ticker) is t else None)
+    return suscripcion
+
+
+def cancelar(suscripcion: Suscripcion):
+    CENTRO.cancelar(suscripcion)
+    ticker = suscripcion.canal[1] if suscripcion.canal[0] == "precio" else None
+    if ticker and not CENTRO.suscriptores(suscripcion.canal):
+        _publicadas.pop(ticker, None)
+        if ticker in _vigilantes:
+            _vigilantes.pop(ticker).cancel()
+
+
+async def detener():
+    for tarea in list(_vigilantes.values()):
+        tarea.cancel()
+    await asyncio.gather(*_vigilantes.values(), return_exceptions=True)
+    _vigilantes.clear()
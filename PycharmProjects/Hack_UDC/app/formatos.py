@@ -0,0 +1,204 @@
+
+# LIBRERÍAS
+import io
+import json
+import zlib
+
+import numpy as np
+
+# Opcionales: sin ellas no se ofrece MessagePack ni zstd (JSON, Arrow y gzip siempre)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# HISTORIAL COMPLETO EN FORMATO BINARIO (NEGOCIACIÓN DE CONTENIDO)
+# Las columnas OHLCV se envían tal como están en memoria (app/series.py), sin crear
+# un objeto Python por vela: en Arrow IPC cada ticker es un record batch que apunta a
+# los mismos arrays de NumPy, y en MessagePack cada columna va como bytes crudos
+# (little-endian) con su tipo al lado, para leerla con np.frombuffer. JSON sigue siendo
+# el formato por defecto (columnas como listas, convertidas en C con tolist()).
+# La respuesta se envía por partes (un ticker cada vez) y se comprime al vuelo con
+# zstd o gzip si el cliente lo acepta (Accept-Encoding).
+
+TIPOS = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "msgpack": "application/msgpack",
+}
+ALIAS = {
+    "application/json": "json",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "*/*": "json",
+    "application/*": "json",
+}
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 3
+
+
+def disponibles():
+    return [f for f in TIPOS if f != "msgpack" or msgpack is not None]
+
+
+def _preferencias(cabecera: str):
+    # [(valor, q)] de una cabecera Accept / Accept-Encoding, de mayor a menor q
+    valores = []
+    for orden, parte in enumerate((cabecera or "").split(",")):
+        trozos = [t.strip() for t in parte.split(";")]
+        if not trozos[0]:
+            continue
+        q = 1.0
+        for parametro in trozos[1:]:
+            if parametro.startswith("q="):
+                try:
+                    q = float(parametro[2:])
+                except ValueError:
+                    q = 0.0
+        valores.append((trozos[0].lower(), q, orden))
+    return [(v, q) for v, q, _ in sorted(valores, key=lambda x: (-x[1], x[2])) if q > 0]
+
+
+def negociar(accept: str = None, formato: str = None):
+    # Formato de la respuesta: '?formato=' manda sobre Accept. None si no se puede servir
+    # ninguno de los pedidos (-> 406).
+    if formato:
+        formato = formato.lower()
+        return formato if formato in disponibles() else None
+    if not accept:
+        return "json"
+    for tipo, _ in _preferencias(accept):
+        elegido = ALIAS.get(tipo)
+        if elegido in disponibles():
+            return elegido
+    return None
+
+
+def codificacion(accept_encoding: str = None):
+    # "zstd", "gzip" o None. Con la misma preferencia, zstd (comprime y descomprime más rápido).
+    aceptadas = dict(_preferencias(accept_encoding))
+    opciones = [c for c in ("zstd", "gzip") if (c != "zstd" or zstandard is not None)
+                and aceptadas.get(c, aceptadas.get("*", 0)) > 0]
+    return max(opciones, key=lambda c: aceptadas.get(c, aceptadas.get("*", 0)), default=None)
+
+
+class _Compresor:
+
+    def __init__(self, metodo: str):
+        if metodo == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compressobj()
+        else:
+            self._obj = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)  # 31: cabecera gzip
+
+    def comprimir(self, datos: bytes):
+        return self._obj.compress(datos)
+
+    def terminar(self):
+        return self._obj.flush()
+
+
+# CODIFICACIÓN POR COLUMNAS (un bloque por ticker)
+
+COLUMNAS = ("open", "high", "low", "close", "volume")
+
+
+def _segundos(serie):
+    return serie.tiempos * serie.unidad
+
+
+def _columnas(serie):
+    return dict(zip(COLUMNAS, (*serie.precios, serie.volume)))
+
+
+def _lista(columna: np.ndarray):
+    # Lista JSON en C; los NaN (volumen desconocido) pasan a null. Los precios float32
+    # se redondean a 4 decimales (si no, 100.95 se escribiría como 100.94999694824219).
+    if columna.dtype == np.float32:
+        columna = np.round(columna.astype(np.float64), 4)
+    if np.isfinite(columna).all():
+        return columna.tolist()
+    objetos = columna.astype(object)
+    objetos[~np.isfinite(columna)] = None
+    return objetos.tolist()
+
+
+def _bloques_json(datos: dict):
+    # {"AAPL": {"intervalo": ..., "velas": n, "datetime": [...], "open": [...], ...}, ...}
+    for i, (ticker, serie) in enumerate(datos.items()):
+        fechas = np.datetime_as_string(_segundos(serie).astype("datetime64[s]"),
+                                       unit="D" if serie.unidad == 86400 else "s")
+        contenido = {"intervalo": serie.intervalo, "velas": len(serie), "datetime": fechas.tolist(),
+                     **{nombre: _lista(columna) for nombre, columna in _columnas(serie).items()}}
+        yield (b"{" if i == 0 else b",") + json.dumps({ticker: contenido}, separators=(",", ":")).encode()[1:-1]
+    yield b"}" if datos else b"{}"
+
+
+def _bloques_msgpack(datos: dict):
+    # Un mapa por ticker (uno detrás de otro, se leen con msgpack.Unpacker):
+    # {"ticker", "intervalo", "velas", "tipos": {columna: dtype}, columna: bytes crudos}
+    for ticker, serie in datos.items():
+        columnas = {"datetime": _segundos(serie), **_columnas(serie)}
+        yield msgpack.packb({
+            "ticker": ticker,
+            "intervalo": serie.intervalo,
+            "velas": len(serie),
+            "tipos": {nombre: np.dtype(c.dtype).newbyteorder("<").str for nombre, c in columnas.items()},
+            **{nombre: np.ascontiguousarray(c, dtype=np.dtype(c.dtype).newbyteorder("<")).tobytes()
+               for nombre, c in columnas.items()}
+        })
+
+
+def _bloques_arrow(datos: dict):
+    # Stream IPC de Arrow: un record batch por ticker con la columna 'ticker' como
+    # diccionario (el mismo para todos los bloques, así que se envía una sola vez).
+    import pyarrow as pa
+
+    tickers = pa.array(list(datos), type=pa.string())
+    tipo_precio = pa.from_numpy_dtype(next(iter(datos.values())).precios.dtype) if datos else pa.float32()
+    esquema = pa.schema([("ticker", pa.dictionary(pa.int32(), pa.string())), ("datetime", pa.timestamp("s")),
+                         *((c, tipo_precio) for c in COLUMNAS[:4]), ("volume", pa.float64())])
+
+    sumidero = io.BytesIO()
+
+    def vaciar():
+        contenido = sumidero.getvalue()
+        sumidero.seek(0)
+        sumidero.truncate()
+        return contenido
+
+    escritor = pa.ipc.new_stream(sumidero, esquema)
+    for j, serie in enumerate(datos.values()):
+        columnas = [pa.DictionaryArray.from_arrays(pa.array(np.full(len(serie), j, dtype=np.int32)), tickers),
+                    pa.array(_segundos(serie), type=pa.timestamp("s")),
+                    *(pa.array(c.astype(tipo_precio.to_pandas_dtype(), copy=False)) for c in serie.precios),
+                    pa.array(serie.volume, type=pa.float64())]
+        escritor.write_batch(pa.RecordBatch.from_arrays(columnas, schema=esquema))
+        yield vaciar()
+    escritor.close()
+    yield vaciar()
+
+
+CODIFICADORES = {"json": _bloques_json, "arrow": _bloques_arrow, "msgpack": _bloques_msgpack}
+
+
+def codificar(datos: dict, formato: str, metodo: str = None):
+    # Generador de bytes de la respuesta: bloques del formato, comprimidos si hay 'metodo'
+    bloques = CODIFICADORES[formato](datos)
+    if metodo is None:
+        yield from bloques
+        return
+    compresor = _Compresor(metodo)
+    for bloque in bloques:
+        comprimido = compresor.comprimir(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.terminar()
@@ -0,0 +1,184 @@
+
+# LIBRERÍAS
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app.series import SerieOHLCV
+
+
+# INDICADORES TÉCNICOS
+# Todo se calcula con operaciones vectorizadas de pandas/NumPy (rolling, ewm,
+# cumsum...), sin bucles por vela. Las medias exponenciales (EMA, MACD, RSI y ATR
+# de Wilder) son recursivas, así que se pueden continuar desde su último valor:
+# cuando se revisa la última vela o se añaden velas a la misma serie solo se calculan
+# esas velas. Ese estado (EMA, RSI, VWAP acumulado...) depende de la primera vela, así
+# que si la ventana se desplaza (ultimas(n) pierde la vela más antigua) se recalcula
+# entera: el resultado es siempre el de un cálculo completo de la misma ventana.
+# El acierto de la caché se comprueba con la versión de la serie, que incluye su última
+# escritura en el almacén; si cambia, solo se continúa el cálculo anterior cuando las
+# velas ya calculadas siguen idénticas (una carga puede reescribir velas antiguas).
+
+SMA = (20, 50)
+EMA = (12, 26)
+MACD = (12, 26, 9)
+RSI = 14
+BOLLINGER = (20, 2.0)
+ATR = 14
+VOLATILIDAD = 20
+DIAS_ANUALES = 252
+
+# Velas de contexto necesarias para las medias móviles simples
+VENTANA_MAX = max(*SMA, BOLLINGER[0], VOLATILIDAD + 1)
+
+MAX_TICKERS = int(os.getenv("INDICADORES_MAX_TICKERS", 1000))
+
+# Columnas internas que permiten continuar el cálculo (no se devuelven en la API)
+INTERNAS = ['_rsi_ganancia', '_rsi_perdida', '_pv', '_vol', '_max']
+
+
+def _ewm(x: pd.Series, alpha: float, semilla: float = None):
+    # EMA recursiva (adjust=False). Con 'semilla' continúa una EMA ya calculada:
+    # y_1 = alpha * x_1 + (1 - alpha) * semilla
+    if semilla is None or np.isnan(semilla):
+        return x.ewm(alpha=alpha, adjust=False).mean()
+    extendida = pd.concat([pd.Series([semilla]), x], ignore_index=True)
+    return pd.Series(extendida.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:], index=x.index)
+
+
+def _calcular(ohlcv: pd.DataFrame, contexto: pd.DataFrame = None, estado: pd.Series = None):
+    # Indicadores de las velas de 'ohlcv'. 'contexto' son las velas anteriores
+    # (para las ventanas móviles) y 'estado' la última fila ya calculada.
+    estado = {} if estado is None else estado
+    completo = ohlcv if contexto is None or contexto.empty else pd.concat([contexto, ohlcv])
+    n = len(ohlcv)
+
+    c, h, l, v = (ohlcv[col].astype(float) for col in ['close', 'high', 'low', 'volume'])
+    cierre = completo['close'].astype(float)
+    cierre_previo = cierre.shift(1).iloc[-n:]
+
+    res = pd.DataFrame(index=ohlcv.index)
+
+    # Medias móviles simples y Bandas de Bollinger (ventanas con contexto)
+    for ventana in SMA:
+        res[f'sma_{ventana}'] = cierre.rolling(ventana).mean().iloc[-n:]
+    media = cierre.rolling(BOLLINGER[0]).mean().iloc[-n:]
+    desviacion = cierre.rolling(BOLLINGER[0]).std(ddof=0).iloc[-n:]
+    res['bb_media'] = media
+    res['bb_superior'] = media + BOLLINGER[1] * desviacion
+    res['bb_inferior'] = media - BOLLINGER[1] * desviacion
+
+    # Volatilidad anualizada de los rendimientos logarítmicos
+    log_ret = np.log(cierre).diff()
+    res['volatilidad'] = (log_ret.rolling(VOLATILIDAD).std() * np.sqrt(DIAS_ANUALES)).iloc[-n:]
+
+    # Medias exponenciales y MACD
+    for span in sorted(set(EMA) | set(MACD[:2])):
+        res[f'ema_{span}'] = _ewm(c, 2 / (span + 1), estado.get(f'ema_{span}'))
+    res['macd'] = res[f'ema_{MACD[0]}'] - res[f'ema_{MACD[1]}']
+    res['macd_senal'] = _ewm(res['macd'], 2 / (MACD[2] + 1), estado.get('macd_senal'))
+    res['macd_hist'] = res['macd'] - res['macd_senal']
+
+    # RSI (suavizado de Wilder)
+    delta = c - cierre_previo
+    res['_rsi_ganancia'] = _ewm(delta.clip(lower=0), 1 / RSI, estado.get('_rsi_ganancia'))
+    res['_rsi_perdida'] = _ewm((-delta).clip(lower=0), 1 / RSI, estado.get('_rsi_perdida'))
+    res['rsi'] = 100 - 100 / (1 + res['_rsi_ganancia'] / res['_rsi_perdida'])
+
+    # ATR (rango verdadero con suavizado de Wilder)
+    rango = np.fmax(h - l, np.fmax((h - cierre_previo).abs(), (l - cierre_previo).abs()))
+    res['atr'] = _ewm(rango, 1 / ATR, estado.get('atr'))
+
+    # Drawdown desde el máximo y VWAP acumulado
+    maximo = np.fmax.accumulate(np.concatenate([[estado.get('_max', -np.inf)], c.to_numpy()]))[1:]
+    res['_max'] = maximo
+    res['drawdown'] = c / maximo - 1
+
+    tipico = (h + l + c) / 3
+    res['_pv'] = (tipico * v).cumsum() + estado.get('_pv', 0.0)
+    res['_vol'] = v.cumsum() + estado.get('_vol', 0.0)
+    res['vwap'] = res['_pv'] / res['_vol']
+
+    return res
+
+
+def calcular_indicadores(df: pd.DataFrame):
+    # Cálculo completo, sin caché. Devuelve solo las columnas públicas.
+    return _calcular(df).drop(columns=INTERNAS)
+
+
+# MOTOR CON CACHÉ POR (TICKER, VERSIÓN DE LA SERIE)
+
+def _mismas_velas(anterior: SerieOHLCV, serie: SerieOHLCV, n: int):
+    # True si las n primeras velas de las dos series son idénticas (comparación de arrays)
+    if n < 0 or len(anterior) < n or len(serie) < n:
+        return False
+    return (np.array_equal(anterior.tiempos[:n], serie.tiempos[:n])
+            and np.array_equal(anterior.precios[:, :n], serie.precios[:, :n], equal_nan=True)
+            and np.array_equal(anterior.volume[:n], serie.volume[:n], equal_nan=True))
+
+
+class MotorIndicadores:
+
+    def __init__(self, max_tickers: int = MAX_TICKERS):
+        self.max_tickers = max_tickers
+        self._cache = OrderedDict()  # ticker -> (versión, serie, resultado)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.incrementales = 0
+        self.completos = 0
+
+    def calcular(self, ticker: str, serie: SerieOHLCV):
+        # El acierto se comprueba sobre la serie compacta; el DataFrame solo se
+        # construye cuando hay velas que calcular. Una serie sin marca del almacén
+        # (la de quien llame al motor directamente) se compara vela a vela.
+        version = serie.version
+        with self._lock:
+            previo = self._cache.get(ticker)
+
+        if previo is not None and previo[0] == version and (
+                serie.fuente or _mismas_velas(previo[1], serie, len(serie))):
+            self.aciertos += 1
+            resultado = previo[2]
+        else:
+            resultado = self._actualizar(previo, serie)
+
+        with self._lock:
+            self._cache[ticker] = (version, serie, resultado)
+            self._cache.move_to_end(ticker)
+            while len(self._cache) > self.max_tickers:
+                self._cache.popitem(last=False)
+
+        return resultado.drop(columns=INTERNAS)
+
+    def _actualizar(self, previo, serie: SerieOHLCV):
+        df = serie.a_dataframe()
+        if previo is not None and len(previo[1]) and _mismas_velas(previo[1], serie, len(previo[1]) - 1):
+            # Mismas velas salvo la última conocida: se recalcula desde esa vela (puede
+            # haber cambiado si estaba a medias) continuando el estado de la anterior.
+            ultima = previo[1].ultima_fecha
+            if ultima in df.index:
+                self.incrementales += 1
+                pos = df.index.get_loc(ultima)
+                base = previo[2].loc[:ultima].iloc[:-1]
+                estado = base.iloc[-1] if len(base) else None
+                contexto = df.iloc[max(0, pos - VENTANA_MAX):pos]
+                return pd.concat([base, _calcular(df.iloc[pos:], contexto, estado)])
+
+        self.completos += 1
+        return _calcular(df)
+
+    def calcular_lote(self, datos: dict):
+        return {t: self.calcular(t, s) for t, s in datos.items() if isinstance(s, SerieOHLCV)}
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "tickers": len(self._cache),
+                "aciertos": self.aciertos,
+                "incrementales": self.incrementales,
+                "completos": self.completos
+            }
@@ -0,0 +1,156 @@
+
+# LIBRERÍAS
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from app import concurrencia
+
+
+# INGESTA MASIVA EN STREAMING (CSV / NDJSON / PARQUET)
+# El cuerpo de la petición se lee por trozos y se procesa en bloques: cada bloque
+# se convierte directamente en columnas tipadas, se valida de forma vectorizada y
+# se guarda en una preparación temporal del almacén. Solo si todo el fichero es
+# válido se incorpora al ticker en una única transacción: una carga que falla a
+# mitad no deja filas sueltas. La memoria usada depende del tamaño del bloque,
+# no del tamaño del fichero.
+
+BYTES_BLOQUE = int(os.getenv("INGESTA_MB_BLOQUE", 4)) * 1024 * 1024
+FILAS_BLOQUE_PARQUET = int(os.getenv("INGESTA_FILAS_BLOQUE", 100_000))
+MB_MEMORIA_PARQUET = 16  # Por encima se vuelca a un fichero temporal
+
+COLUMNAS_REQ = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+PRECIOS = ['open', 'high', 'low', 'close']
+
+FORMATOS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+def detectar_formato(content_type: str, formato: str = None):
+    if formato:
+        return formato.lower() if formato.lower() in ("csv", "ndjson", "parquet") else None
+    return FORMATOS.get((content_type or "").split(";")[0].strip().lower())
+
+
+# VALIDACIÓN VECTORIZADA DE UN BLOQUE
+
+def validar_bloque(df: pd.DataFrame):
+    # Devuelve (DataFrame listo para guardar, nº de filas descartadas) o {"error": ...}
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    for col in COLUMNAS_REQ:
+        if col not in df.columns:
+            return {"error": f"Falta la columna obligatoria: {col}"}
+
+    fechas = pd.to_datetime(df['datetime'], errors='coerce')
+    valores = df[PRECIOS + ['volume']].apply(pd.to_numeric, errors='coerce').astype(np.float64)
+
+    precios = valores[PRECIOS].to_numpy()
+    validas = (
+        fechas.notna().to_numpy()
+        & np.isfinite(valores.to_numpy()).all(axis=1)
+        & (precios > 0).all(axis=1)
+        & (valores['high'].to_numpy() >= valores['low'].to_numpy())
+        & (valores['volume'].to_numpy() >= 0)
+    )
+
+    limpio = valores[validas]
+    limpio.index = pd.DatetimeIndex(fechas[validas], name='datetime')
+    return limpio, int((~validas).sum())
+
+
+# LECTORES POR FORMATO (cada uno produce DataFrames por bloque)
+
+def _leer_texto(cabecera: bytes, trozo: bytes, formato: str):
+    if formato == "csv":
+        return pd.read_csv(io.BytesIO(cabecera + trozo), low_memory=False)
+    return pd.read_json(io.BytesIO(trozo), lines=True, dtype=False)
+
+
+async def _bloques_texto(flujo, formato: str):
+    # Corta el flujo en bloques de líneas completas de ~BYTES_BLOQUE.
+    pendiente = bytearray()
+    cabecera = b""
+    async for parte in flujo:
+        pendiente.extend(parte)
+        if formato == "csv" and not cabecera and b"\n" in pendiente:
+            fin = pendiente.index(b"\n") + 1
+            cabecera = bytes(pendiente[:fin])
+            del pendiente[:fin]
+        while len(pendiente) >= BYTES_BLOQUE:
+            corte = pendiente.rfind(b"\n", 0, BYTES_BLOQUE) + 1 or pendiente.rfind(b"\n") + 1
+            if not corte:
+                break
+            trozo = bytes(pendiente[:corte])
+            del pendiente[:corte]
+            yield await concurrencia.ejecutar(_leer_texto, cabecera, trozo, formato)
+
+    if pendiente.strip():
+        yield await concurrencia.ejecutar(_leer_texto, cabecera, bytes(pendiente), formato)
+
+
+async def _bloques_parquet(flujo):
+    # Parquet guarda sus metadatos al final: se vuelca a un fichero temporal
+    # (en memoria si es pequeño) y se lee por grupos de filas.
+    import pyarrow.parquet as pq
+
+    with tempfile.SpooledTemporaryFile(max_size=MB_MEMORIA_PARQUET * 1024 * 1024) as f:
+        async for parte in flujo:
+            await concurrencia.ejecutar(f.write, parte)
+        f.seek(0)
+
+        fichero = pq.ParquetFile(f)
+        columnas = [c for c in fichero.schema_arrow.names if c.strip().lower() in COLUMNAS_REQ]
+        lotes = fichero.iter_batches(batch_size=FILAS_BLOQUE_PARQUET, columns=columnas or None)
+        while True:
+            lote = await concurrencia.ejecutar(next, lotes, None)
+            if lote is None:
+                break
+            yield lote.to_pandas()
+
+
+# INGESTA COMPLETA
+
+async def ingerir(almacen, ticker: str, flujo, formato: str):
+    if formato == "parquet":
+        bloques = _bloques_parquet(flujo)
+    else:
+        bloques = _bloques_texto(flujo, formato)
+
+    preparacion = almacen.preparacion()
+    filas = descartadas = num_bloques = 0
+    try:
+        async for df in bloques:
+            validado = await concurrencia.ejecutar(validar_bloque, df)
+            if isinstance(validado, dict):
+                return validado
+            limpio, malas = validado
+            await concurrencia.ejecutar(preparacion.guardar, ticker, limpio)
+            filas += len(limpio)
+            descartadas += malas
+            num_bloques += 1
+
+        if filas == 0:
+            return {"error": "El fichero no contiene registros válidos."}
+        await concurrencia.ejecutar(almacen.incorporar, preparacion, ticker)
+    except (ValueError, json.JSONDecodeError, pd.errors.ParserError) as e:
+        return {"error": f"Error al procesar los datos: {str(e)}"}
+    finally:
+        # Sin efecto si ya se incorporó; si la carga falló, borra los bloques guardados
+        await concurrencia.ejecutar(preparacion.descartar)
+
+    return {
+        "mensaje": f"Empresa {ticker} cargada con {filas} registros.",
+        "registros": filas,
+        "descartados": descartadas,
+        "bloques": num_bloques
+    }
@@ -1,18 +1,52 @@
 # LIBRERÍAS
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import List
 from pydantic import BaseModel
 import uvicorn
 from app import api_engine as engine
+from app import cartera, cliente_td, concurrencia, eventos, formatos, ingesta, metricas, planificador, respuestas
 import pandas as pd
+import json
+import logging
 import os
+import time
+
+
+# Logs: una línea JSON por petición en "studystock.peticiones" con el desglose por etapas.
+# LOG_LEVEL=DEBUG muestra también de dónde sale cada serie (local, caché, Twelve Data).
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+# httpx registra cada URL, que incluye la clave de Twelve Data
+logging.getLogger("httpx").setLevel(logging.WARNING)
+log = logging.getLogger("studystock.api")
+
+
+# Ciclo de vida: al arrancar lanzamos el planificador de la watchlist;
+# al apagar cerramos el pool HTTP y los ejecutores
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    planificador.iniciar()
+    arranque = metricas.marcar_listo()
+    mem = metricas.memoria()
+    log.info("Worker %d listo en %.2f s (precargado=%s), RSS %.0f MB, PSS %.0f MB", os.getpid(),
+             arranque["listo"], arranque["precargado"], mem["rss"] / 2**20, mem.get("pss", 0) / 2**20)
+    yield
+    await planificador.detener()
+    await eventos.detener()
+    await cliente_td.cerrar()
+    concurrencia.cerrar()
+    engine.SERVICIO_PRONOSTICO.cerrar()
 
 
 # Creamos el objeto
 app = FastAPI(
     title="Twelve Data Financial AI",
-    description="API de análisis bursátil con Inteligencia Artificial"
+    description="API de análisis bursátil con Inteligencia Artificial",
+    lifespan=lifespan
 )
 
 # --- CONFIGURACIÓN DE CORS ---
@@ -24,6 +58,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- MÉTRICAS: LATENCIA POR ENDPOINT Y DESGLOSE POR ETAPAS DE CADA PETICIÓN ---
+
+@app.middleware("http")
+async def medir_peticion(request: Request, call_next):
+    testigo = metricas.iniciar_peticion()
+    inicio = time.perf_counter()
+
+    def terminar(estado: int, streaming: bool = False):
+        # Plantilla de la ruta ("/stock/{symbol}") para no crear una serie por ticker
+        ruta = request.scope.get("route")
+        endpoint = ruta.path if ruta is not None else "desconocido"
+        metricas.terminar_peticion(testigo, endpoint, request.method, estado, time.perf_counter() - inicio, streaming)
+
+    try:
+        respuesta = await call_next(request)
+    except BaseException:
+        terminar(500)
+        raise
+
+    # El tiempo se cierra al enviar el último byte del cuerpo, no al tener las cabeceras.
+    # Sin Content-Length el cuerpo va en streaming (/history, /predict/batch, SSE).
+    streaming = "content-length" not in respuesta.headers and respuesta.status_code not in (204, 304)
+    cuerpo = respuesta.body_iterator
+
+    async def cuerpo_medido():
+        try:
+            async for parte in cuerpo:
+                yield parte
+        finally:
+            terminar(respuesta.status_code, streaming)
+
+    respuesta.body_iterator = cuerpo_medido()
+    return respuesta
+
+
 # --- MODELOS DE DATOS (Pydantic): TIPO DE DATO "EMPRESA" ---
 
 class RegistroData(BaseModel):
@@ -41,71 +110,383 @@ class EmpresaManualRequest(BaseModel):
 # --- ENDPOINTS ---
 
 
+# Las respuestas de /stock, /compare y /predict se cachean ya serializadas por versión
+# de los datos (app/respuestas.py), con ETag y 304 si el cliente ya las tiene.
+# 'interval' (1day, 1week, 1month, 1year) elige el tamaño de barra: las barras se
+# remuestrean en el servidor a partir de la serie diaria, sin pedir nada a Twelve Data.
+
 # GET /STOCK -> ANALIZAR UNA EMPRESA
 
 @app.get("/stock/{symbol}")
-async def get_stock(symbol: str):
-    data = engine.obtener_datos(symbol.upper())
+async def get_stock(symbol: str, request: Request, interval: str = "1day"):
+    ticker = symbol.upper()
+
+    # Si el planificador ya lo tiene calculado, lo servimos indicando su antigüedad
+    # (solo precalcula la serie diaria)
+    precalculado = None
+    if interval == "1day":
+        precalculado = await concurrencia.ejecutar(planificador.leer, "stock", ticker)
+    if precalculado:
+        resultado, antiguedad = precalculado
+        return await respuestas.responder(
+            request, ("stock", ticker, "precalculado", planificador.version_precalculo(antiguedad)),
+            lambda: {**resultado, **planificador.info_antiguedad(antiguedad)},
+            planificador.segundos_vigencia(antiguedad))
+
+    async with concurrencia.semaforo("stock"):
+        data = await engine.obtener_datos_async(ticker, interval)
 
     if isinstance(data, dict) and "error" in data:
         raise HTTPException(status_code=400, detail=data["error"])
 
-    stats = engine.calcular_estadisticas(data)
+    return await respuestas.responder(request, ("stock", ticker, respuestas.version_datos(data)),
+                                      lambda: engine.resumen_stock(ticker, data), revalidar=engine.es_local(data))
+
+
+# GET /COMPARE -> COMPARAR DOS EMPRESAS
+
+async def _comparar(request: Request, tickers: list, interval: str = "1day"):
+    async with concurrencia.semaforo("compare"):
+        datos = await engine.obtener_datos_lote_async(tickers, interval)
+
+    for df in datos.values():
+        if isinstance(df, dict) and "error" in df:
+            raise HTTPException(status_code=400, detail=df["error"])
+
+    return await respuestas.responder(
+        request, ("compare", tuple(tickers), respuestas.version_datos(*datos.values())),
+        lambda: concurrencia.ejecutar(engine.resumen_comparativa, datos), revalidar=engine.es_local(*datos.values()))
+
+
+@app.get("/compare/{symbol1}/{symbol2}")
+async def compare_stocks(symbol1: str, symbol2: str, request: Request, interval: str = "1day"):
+    return await _comparar(request, [symbol1.upper(), symbol2.upper()], interval)
+
+
+# GET /STOCKS Y /COMPARE CON VARIAS EMPRESAS (?symbols=A,B,C)
 
-    # --- CAMBIO AQUÍ: Forzamos la conversión a datetime al iterar ---
+MAX_SIMBOLOS = int(os.getenv("MAX_SIMBOLOS", 50))
+MAX_SIMBOLOS_CARTERA = int(os.getenv("MAX_SIMBOLOS_CARTERA", 500))
+
+def _leer_simbolos(symbols: str, maximo: int = MAX_SIMBOLOS):
+    tickers = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not tickers:
+        raise HTTPException(status_code=400, detail="Indica al menos un ticker en 'symbols'.")
+    if len(tickers) > maximo:
+        raise HTTPException(status_code=400, detail=f"Máximo {maximo} tickers por petición.")
+    return tickers
+
+
+@app.get("/stocks")
+async def get_stocks(symbols: str):
+    tickers = _leer_simbolos(symbols)
+    async with concurrencia.semaforo("stock"):
+        datos = await engine.obtener_datos_lote_async(tickers)
+
+    validos = {t: s for t, s in datos.items() if isinstance(s, engine.SerieOHLCV)}
+    errores = {t: s["error"] for t, s in datos.items() if t not in validos}
+    if not validos:
+        raise HTTPException(status_code=400, detail=errores)
+
+    cierres = await concurrencia.ejecutar(engine.alinear_cierres, validos)
     historial = {
-        str(pd.to_datetime(fecha).date()): round(float(precio), 2)
-        for fecha, precio in data['close'].tail(15).items()
+        str(fecha.date()): {t: round(float(v), 2) for t, v in fila.items() if pd.notna(v)}
+        for fecha, fila in cierres.tail(15).iterrows()
     }
 
     return {
-        "ticker": symbol.upper(),
-        "metricas": stats,
-        "historial_cierre": historial
+        "tickers": list(validos),
+        "metricas": {t: engine.calcular_estadisticas(s) for t, s in validos.items()},
+        "historial_cierre": historial,
+        "errores": errores
     }
 
 
-# GET /COMPARE -> COMPARAR DOS EMPRESAS
+@app.get("/compare")
+async def compare_many(symbols: str, request: Request, interval: str = "1day"):
+    return await _comparar(request, _leer_simbolos(symbols), interval)
 
-@app.get("/compare/{symbol1}/{symbol2}")
-async def compare_stocks(symbol1: str, symbol2: str):
-    resultado = engine.comparar_empresas(symbol1.upper(), symbol2.upper())
 
-    if "error" in resultado:
-        raise HTTPException(status_code=400, detail=resultado["error"])
+# GET /PORTFOLIO -> ANÁLISIS DE CARTERA (?symbols=A,B,C&benchmark=SPY)
+# Correlación, covarianza, beta frente al índice, Sharpe/Sortino y pesos de mínima
+# varianza y máximo Sharpe. Los tickers sin datos se omiten y se listan en 'errores';
+# si el índice no está disponible la beta sale a null. Caché por tickers y versión de datos.
 
-    return resultado
+@app.get("/portfolio")
+async def portfolio(symbols: str, request: Request, benchmark: str = cartera.BENCHMARK,
+                    interval: str = "1day", rf: float = cartera.TASA_LIBRE):
+    tickers = _leer_simbolos(symbols, MAX_SIMBOLOS_CARTERA)
+    if interval not in cartera.PERIODOS_ANUALES:
+        raise HTTPException(status_code=400, detail=f"Intervalo no soportado: {interval}.")
+    indice = benchmark.strip().upper() or None
 
+    async with concurrencia.semaforo("compare"):
+        datos = await engine.obtener_datos_lote_async(tickers + ([indice] if indice else []), interval)
 
-# GET /PREDICT -> PREDECIR EL FUTURO DE LA EMPRESA (IA)
+    validos = {t: datos[t] for t in tickers if isinstance(datos[t], engine.SerieOHLCV)}
+    errores = {t: datos[t]["error"] for t in tickers if t not in validos}
+    serie_indice = datos.get(indice) if indice else None
+    if indice and not isinstance(serie_indice, engine.SerieOHLCV):
+        errores[indice] = serie_indice["error"]
+        indice = serie_indice = None
+    if len(validos) < 2:
+        raise HTTPException(status_code=400, detail=errores or "Indica al menos dos tickers en 'symbols'.")
 
-@app.get("/predict/{symbol}")
-async def predict(symbol: str):
-    df = engine.obtener_datos(symbol.upper())
+    async def construir():
+        res = await concurrencia.ejecutar(engine.analizar_cartera, validos, serie_indice, interval, rf)
+        if "error" in res:
+            raise HTTPException(status_code=400, detail=res["error"])
+        return {**res, "benchmark": indice, "intervalo": interval, "errores": errores}
 
-    if isinstance(df, dict) and "error" in df:
-        raise HTTPException(status_code=404, detail=df["error"])
+    series = list(validos.values()) + ([serie_indice] if indice else [])
+    return await respuestas.responder(
+        request, ("portfolio", tuple(tickers), indice, interval, rf, respuestas.version_datos(*series)), construir,
+        revalidar=engine.es_local(*series))
 
-    res = engine.predecir_ia(df)
 
-    # Si la función de IA devuelve un error interno
-    if isinstance(res, dict) and "error" in res:
-        raise HTTPException(status_code=400, detail=res["error"])
+# GET /HISTORY -> HISTORIAL COMPLETO POR COLUMNAS (JSON, ARROW IPC O MESSAGEPACK)
+# El formato se negocia con Accept (o '?formato=json|arrow|msgpack') y la compresión
+# con Accept-Encoding (zstd o gzip). Sin 'outputsize' se envía toda la serie base
+# (SERIE_BASE_VELAS velas diarias) en el intervalo pedido.
+# Los tickers sin datos se omiten y se indican en la cabecera X-Errores (JSON).
+
+async def _historial(request: Request, tickers: list, interval: str, outputsize: int, formato: str):
+    tipo = formatos.negociar(request.headers.get("accept"), formato)
+    if tipo is None:
+        raise HTTPException(status_code=406, detail=f"Formatos disponibles: {', '.join(formatos.disponibles())}.")
+    metodo = formatos.codificacion(request.headers.get("accept-encoding"))
+
+    async with concurrencia.semaforo("stock"):
+        datos = await engine.obtener_datos_lote_async(tickers, interval, outputsize)
+
+    validos = {t: s for t, s in datos.items() if isinstance(s, engine.SerieOHLCV)}
+    errores = {t: s["error"] for t, s in datos.items() if t not in validos}
+    if not validos:
+        raise HTTPException(status_code=400, detail=errores)
+
+    cabeceras = {"Vary": "Accept, Accept-Encoding"}
+    if metodo:
+        cabeceras["Content-Encoding"] = metodo
+    if errores:
+        cabeceras["X-Errores"] = json.dumps(errores)
+    # El generador es síncrono: Starlette lo recorre en su pool de hilos, fuera del bucle
+    return StreamingResponse(formatos.codificar(validos, tipo, metodo), media_type=formatos.TIPOS[tipo],
+                             headers=cabeceras)
+
 
+@app.get("/history/{symbol}")
+async def history(symbol: str, request: Request, interval: str = "1day", outputsize: int = None,
+                  formato: str = None):
+    return await _historial(request, [symbol.upper()], interval, outputsize, formato)
+
+
+@app.get("/history")
+async def history_many(symbols: str, request: Request, interval: str = "1day", outputsize: int = None,
+                       formato: str = None):
+    return await _historial(request, _leer_simbolos(symbols, MAX_SIMBOLOS_CARTERA), interval, outputsize, formato)
+
+
+# GET /INDICATORS -> INDICADORES TÉCNICOS DE UNA EMPRESA
+
+@app.get("/indicators/{symbol}")
+async def get_indicators(symbol: str, ultimos: int = 30):
+    async with concurrencia.semaforo("stock"):
+        data = await engine.obtener_datos_async(symbol.upper())
+
+        if isinstance(data, dict) and "error" in data:
+            raise HTTPException(status_code=400, detail=data["error"])
+
+        return await concurrencia.ejecutar(engine.calcular_indicadores, symbol.upper(), data, max(1, ultimos))
+
+
+# GET /PREDICT -> PREDECIR EL FUTURO DE LA EMPRESA (IA)
+
+def _formatear_prediccion(ticker: str, res: dict, model: str):
     # Mapeo para que el Dashboard (Archivo Dos) reciba los nombres que espera
     return {
-        "ticker": symbol.upper(),
+        "ticker": ticker,
         "ia_forecast": {
+            "modelo": res.get("modelo", model),
             "eficacia": {
                 "precision_porcentual": res["metricas"]["precision_porcentual"],
                 "error_medio_usd": res["metricas"]["error_medio_usd"],
                 "confiabilidad": "Alta" if float(res["metricas"]["precision_porcentual"].replace('%', '')) > 85 else "Media"
             },
-            "prediccion_futura": res["predicciones"]
+            "prediccion_futura": res["predicciones"],
+            "backtest": res.get("backtest")
         }
     }
 
 
+# GET /PREDICT/BATCH -> PREDECIR VARIAS EMPRESAS EN UN SOLO TRABAJO (?symbols=A,B,C)
+# Los entrenamientos se reparten entre los procesos del pool y cada resultado se
+# envía (una línea NDJSON por ticker) en cuanto termina, con su tiempo.
+# Se declara antes que /predict/{symbol} para que "batch" no se tome como ticker.
+
+@app.get("/predict/batch")
+async def predict_batch(symbols: str, model: str = "prophet"):
+    tickers = _leer_simbolos(symbols)
+
+    async def lineas():
+        inicio = time.perf_counter()
+        correctos = 0
+        async for ticker, res, segundos in engine.predecir_lote_async(tickers, model):
+            if "error" in res:
+                linea = {"ticker": ticker, "error": res["error"]}
+            else:
+                correctos += 1
+                linea = _formatear_prediccion(ticker, res, model)
+            linea["segundos"] = round(segundos, 3)
+            yield json.dumps(linea) + "\n"
+
+        yield json.dumps({"resumen": {
+            "tickers": len(tickers),
+            "correctos": correctos,
+            "segundos_total": round(time.perf_counter() - inicio, 3)
+        }}) + "\n"
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson")
+
+
+@app.get("/predict/{symbol}")
+async def predict(symbol: str, request: Request, model: str = "prophet", interval: str = "1day"):
+    ticker = symbol.upper()
+
+    # El planificador solo precalcula con el modelo por defecto (Prophet) y barras diarias
+    precalculado = None
+    if model == "prophet" and interval == "1day":
+        precalculado = await concurrencia.ejecutar(planificador.leer, "predict", ticker)
+    if precalculado:
+        res, antiguedad = precalculado
+        if isinstance(res, dict) and "error" in res:
+            raise HTTPException(status_code=400, detail=res["error"])
+        return await respuestas.responder(
+            request, ("predict", ticker, model, "precalculado", planificador.version_precalculo(antiguedad)),
+            lambda: {**_formatear_prediccion(ticker, res, model), **planificador.info_antiguedad(antiguedad)},
+            planificador.segundos_vigencia(antiguedad))
+
+    df = await engine.obtener_datos_async(ticker, interval)
+
+    if isinstance(df, dict) and "error" in df:
+        raise HTTPException(status_code=404, detail=df["error"])
+
+    async def construir():
+        # Prophet se entrena en el pool de procesos, con un máximo de peticiones simultáneas
+        async with concurrencia.semaforo("predict"):
+            res = await engine.predecir_ia_async(df, ticker, model)
+
+        # Si la función de IA devuelve un error interno
+        if isinstance(res, dict) and "error" in res:
+            raise HTTPException(status_code=400, detail=res["error"])
+
+        return _formatear_prediccion(ticker, res, model)
+
+    return await respuestas.responder(request, ("predict", ticker, model, respuestas.version_datos(df)), construir,
+                                      revalidar=engine.es_local(df))
+
+
+# GET /STREAM -> EVENTOS EN DIRECTO (SERVER-SENT EVENTS)
+# /stream/stock/{symbol}: la última vela y sus métricas cada vez que cambian.
+# /stream/predict/{symbol}: estado del trabajo de predicción (en_cola, descargando,
+# ajustando) con resultados parciales (backtest y predicción) y el resultado final
+# ('completado' o 'error', tras el que se cierra el stream). Los clientes del mismo
+# ticker comparten un solo refresco o entrenamiento (app/eventos.py).
+
+CABECERAS_SSE = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+FIN_TRABAJO = ("event: completado", "event: error")
+
+
+def _respuesta_sse(suscripcion: eventos.Suscripcion, fin: tuple = ()):
+    async def emitir():
+        try:
+            async for evento in suscripcion.eventos():
+                yield evento
+                if evento.startswith(fin):
+                    return
+        finally:
+            eventos.cancelar(suscripcion)
+
+    return StreamingResponse(emitir(), media_type="text/event-stream", headers=CABECERAS_SSE)
+
+
+@app.get("/stream/stock/{symbol}")
+async def stream_stock(symbol: str):
+    return _respuesta_sse(eventos.suscribir_precio(symbol.upper()))
+
+
+async def _trabajo_prediccion(canal: tuple, ticker: str, model: str, interval: str):
+    def publicar(tipo, **datos):
+        eventos.CENTRO.publicar(canal, tipo, {"ticker": ticker, **datos})
+
+    def progreso(etapa, datos):
+        if etapa == "ajustando":
+            publicar("estado", estado="ajustando", **datos)
+        else:
+            publicar("parcial", etapa=etapa, **datos)
+
+    try:
+        publicar("estado", estado="en_cola")
+        precalculado = None
+        if model == "prophet" and interval == "1day":
+            precalculado = await concurrencia.ejecutar(planificador.leer, "predict", ticker)
+        if precalculado and "error" not in precalculado[0]:
+            res, antiguedad = precalculado
+            publicar("completado", **_formatear_prediccion(ticker, res, model), **planificador.info_antiguedad(antiguedad))
+            return
+
+        publicar("estado", estado="descargando")
+        df = await engine.obtener_datos_async(ticker, interval)
+        if isinstance(df, dict) and "error" in df:
+            publicar("error", error=df["error"])
+            return
+
+        async with concurrencia.semaforo("predict"):
+            res = await engine.predecir_ia_async(df, ticker, model, progreso=progreso)
+        if "error" in res:
+            publicar("error", error=res["error"])
+        else:
+            publicar("completado", **_formatear_prediccion(ticker, res, model))
+    except Exception as e:
+        log.exception("Fallo en la predicción en directo de %s", ticker)
+        publicar("error", error=f"Fallo en el motor de IA: {str(e)}")
+
+
+@app.get("/stream/predict/{symbol}")
+async def stream_predict(symbol: str, model: str = "prophet", interval: str = "1day"):
+    ticker = symbol.upper()
+    canal = ("predict", ticker, model, interval)
+    # Suscribirse antes de lanzar el trabajo para no perder ningún estado; si ya hay
+    # uno en marcha para el mismo ticker y modelo, se recibe su estado actual y se sigue
+    suscripcion = eventos.CENTRO.suscribir(canal)
+    concurrencia.VUELOS.lanzar(("stream_predict", *canal[1:]), _trabajo_prediccion, canal, ticker, model, interval)
+    return _respuesta_sse(suscripcion, FIN_TRABAJO)
+
+
+# GET /BACKTEST -> EFICACIA DEL MODELO CON VALIDACIÓN DE ORIGEN MÓVIL
+# 'pliegues' cortes con ventana expansiva; MAE / MAPE / cobertura por día del horizonte
+
+MAX_HORIZONTE = 30
+MAX_PLIEGUES = 20
+
+@app.get("/backtest/{symbol}")
+async def backtest(symbol: str, model: str = "prophet", horizonte: int = 5, pliegues: int = 3):
+    if not 1 <= horizonte <= MAX_HORIZONTE or not 1 <= pliegues <= MAX_PLIEGUES:
+        raise HTTPException(status_code=400,
+                            detail=f"'horizonte' debe estar entre 1 y {MAX_HORIZONTE} y 'pliegues' entre 1 y {MAX_PLIEGUES}.")
+
+    df = await engine.obtener_datos_async(symbol.upper())
+    if isinstance(df, dict) and "error" in df:
+        raise HTTPException(status_code=404, detail=df["error"])
+
+    async with concurrencia.semaforo("predict"):
+        res = await engine.backtest_async(df, symbol.upper(), model, horizonte, pliegues)
+
+    if "error" in res:
+        raise HTTPException(status_code=400, detail=res["error"])
+
+    return {"ticker": symbol.upper(), **res}
+
+
 # POST /INSERT-MANUAL -> INTRODUCIR UNA EMPRESA
 
 @app.post("/insert-manual")
@@ -113,13 +494,88 @@ async def insert_manual(request: EmpresaManualRequest):
     # Convertimos los objetos Pydantic a diccionarios simples
     datos_dict = [reg.dict() for reg in request.datos]
 
-    resultado = engine.guardar_datos_manuales(request.ticker, datos_dict)
+    async with concurrencia.semaforo("insert"):
+        resultado = await concurrencia.ejecutar(engine.guardar_datos_manuales, request.ticker, datos_dict)
 
     if "error" in resultado:
         raise HTTPException(status_code=400, detail=resultado["error"])
 
     return resultado
 
+# POST /INSERT-BULK -> CARGA MASIVA EN STREAMING (CSV, NDJSON o Parquet)
+# El cuerpo se envía tal cual (sin JSON) con su Content-Type, o indicando ?formato=
+
+@app.post("/insert-bulk/{ticker}")
+async def insert_bulk(ticker: str, request: Request, formato: str = None):
+    tipo = ingesta.detectar_formato(request.headers.get("content-type"), formato)
+    if tipo is None:
+        raise HTTPException(status_code=415, detail="Formato no soportado. Usa CSV, NDJSON o Parquet.")
+
+    async with concurrencia.semaforo("insert"):
+        resultado = await ingesta.ingerir(engine.DB_LOCAL, ticker.upper(), request.stream(), tipo)
+
+    if "error" in resultado:
+        raise HTTPException(status_code=400, detail=resultado["error"])
+
+    return resultado
+
+# GET /CACHE/STATS -> CONTADORES DE LAS CACHÉS Y DE LAS LLAMADAS AGRUPADAS
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**engine.CACHE_SERIES.estadisticas(),
+            "respuestas": respuestas.CACHE_RESPUESTAS.estadisticas(),
+            "vuelos": concurrencia.VUELOS.estadisticas(),
+            "twelve_data": cliente_td.claves().estadisticas()}
+
+# GET /PREDICT/STATS -> ESTADO DEL SERVICIO DE PREDICCIÓN
+
+@app.get("/predict-stats")
+async def predict_stats():
+    return engine.SERVICIO_PRONOSTICO.estadisticas()
+
+# GET /METRICS -> MÉTRICAS EN FORMATO PROMETHEUS (de este worker)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    filas_local, bytes_local = await concurrencia.ejecutar(engine.DB_LOCAL.tamano)
+    caches = {"series": engine.CACHE_SERIES.estadisticas(), "respuestas": respuestas.CACHE_RESPUESTAS.estadisticas()}
+    pronostico = engine.SERVICIO_PRONOSTICO.estadisticas()
+    vuelos = concurrencia.VUELOS.estadisticas()["operaciones"]
+    directo = eventos.CENTRO.estadisticas()
+
+    texto = metricas.exponer(
+        metricas.valor("studystock_cache_aciertos_total", "Aciertos de cada caché.", "counter",
+                       {c: e["aciertos"] for c, e in caches.items()}, "cache"),
+        metricas.valor("studystock_cache_fallos_total", "Fallos de cada caché.", "counter",
+                       {c: e["fallos"] for c, e in caches.items()}, "cache"),
+        metricas.valor("studystock_cache_ratio_aciertos", "Proporción de aciertos de cada caché.", "gauge",
+                       {c: e["ratio_aciertos"] for c, e in caches.items()}, "cache"),
+        metricas.valor("studystock_cache_bytes", "Memoria usada por cada caché.", "gauge",
+                       {c: e["bytes"] for c, e in caches.items()}, "cache"),
+        metricas.valor("studystock_db_local_filas", "Velas guardadas en DB_LOCAL.", "gauge", {None: filas_local}),
+        metricas.valor("studystock_db_local_bytes", "Bytes de datos de las velas de DB_LOCAL.", "gauge",
+                       {None: bytes_local}),
+        metricas.valor("studystock_pronosticos_en_curso", "Entrenamientos de predicción en marcha.", "gauge",
+                       {None: pronostico["en_curso"]}),
+        metricas.valor("studystock_pronosticos_entrenados_total", "Predicciones entrenadas (sin caché).", "counter",
+                       {None: pronostico["entrenamientos"]}),
+        metricas.valor("studystock_vuelos_ejecuciones_total", "Ejecuciones reales por operación (single-flight).",
+                       "counter", {op: v["ejecuciones"] for op, v in vuelos.items()}, "operacion"),
+        metricas.valor("studystock_vuelos_agrupadas_total", "Llamadas que esperaron a una ejecución en curso.",
+                       "counter", {op: v["agrupadas"] for op, v in vuelos.items()}, "operacion"),
+        metricas.valor("studystock_stream_suscriptores", "Clientes conectados a /stream.", "gauge",
+                       {None: directo["suscriptores"]}),
+        metricas.valor("studystock_stream_eventos_total", "Eventos de /stream publicados, entregados y descartados.",
+                       "counter", {e: directo[e] for e in ("publicados", "entregados", "descartados")}, "tipo"),
+        metricas.exponer_arranque(),
+    )
+    return PlainTextResponse(texto, media_type="text/plain; version=0.0.4")
+
+
+# Tiempo de importación (con preload de gunicorn, el del master)
+metricas.ARRANQUE["importacion"] = metricas.edad_proceso()
+
 # FUNCION DE EJECUCIÓN RENDER
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+
+# LIBRERÍAS
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# MÉTRICAS (formato de texto de Prometheus) Y TIEMPOS POR ETAPA
+# Cada etapa del camino caliente (descarga, normalización, ajuste de Prophet,
+# predicción, estadísticas, serialización...) se mide con tramo("nombre"). El
+# tiempo va al histograma de su etapa y al desglose de la petición en curso,
+# que se escribe como una línea JSON en el log "studystock.peticiones".
+# Las métricas son de cada proceso (cada worker de gunicorn expone las suyas).
+
+CUBETAS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Respuestas en streaming: hasta el último byte (una conexión SSE puede durar horas)
+CUBETAS_STREAMING = CUBETAS + (60, 300, 900, 3600)
+
+log_peticiones = logging.getLogger("studystock.peticiones")
+
+_peticion = contextvars.ContextVar("etapas_peticion", default=None)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(claves: tuple, valores: tuple):
+    if not claves:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in zip(claves, valores)) + "}"
+
+
+class Histograma:
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), cubetas: tuple = CUBETAS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.cubetas = cubetas
+        self._series = {}  # valores de etiquetas -> [cuentas por cubeta, suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *etiquetas):
+        with self._lock:
+            serie = self._series.setdefault(etiquetas, [[0] * len(self.cubetas), 0.0, 0])
+            posicion = bisect.bisect_left(self.cubetas, valor)
+            if posicion < len(self.cubetas):
+                serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            for valores, (cuentas, suma, total) in sorted(self._series.items()):
+                acumulado = 0
+                for limite, cuenta in zip(self.cubetas, cuentas):
+                    acumulado += cuenta
+                    etiquetas = _etiquetas(self.etiquetas + ("le",), valores + (limite,))
+                    lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+                etiquetas = _etiquetas(self.etiquetas + ("le",), valores + ("+Inf",))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {total}")
+                etiquetas = _etiquetas(self.etiquetas, valores)
+                lineas.append(f"{self.nombre}_sum{etiquetas} {suma}")
+                lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class Contador:
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, *etiquetas, n: float = 1):
+        with self._lock:
+            self._series[etiquetas] = self._series.get(etiquetas, 0) + n
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            for valores, total in sorted(self._series.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+
+def valor(nombre: str, ayuda: str, tipo: str, muestras: dict, etiqueta: str = None):
+    # Métrica calculada al exponer (gauge o contador leído de otro módulo).
+    # 'muestras' es {valor de la etiqueta: número}, o {None: número} sin etiqueta.
+    lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+    for clave, numero in muestras.items():
+        etiquetas = _etiquetas((etiqueta,), (clave,)) if etiqueta else ""
+        lineas.append(f"{nombre}{etiquetas} {float(numero)}")
+    return lineas
+
+
+# MÉTRICAS DE LA API
+
+PETICIONES = Histograma("studystock_peticion_segundos", "Latencia de las peticiones HTTP por endpoint.",
+                        ("endpoint", "metodo"))
+STREAMING = Histograma("studystock_streaming_segundos",
+                       "Duración de las respuestas en streaming (/history, /predict/batch, SSE) hasta el último byte.",
+                       ("endpoint", "metodo"), CUBETAS_STREAMING)
+RESPUESTAS = Contador("studystock_peticiones_total", "Peticiones HTTP por endpoint y código de estado.",
+                      ("endpoint", "metodo", "estado"))
+ETAPAS = Histograma("studystock_etapa_segundos", "Duración de cada etapa del procesamiento.", ("etapa",))
+
+
+# TRAMOS (ETAPAS) Y DESGLOSE POR PETICIÓN
+
+def registrar(etapa: str, segundos: float):
+    ETAPAS.observar(segundos, etapa)
+    desglose = _peticion.get()
+    if desglose is not None:
+        with desglose["lock"]:
+            desglose["etapas"][etapa] = desglose["etapas"].get(etapa, 0.0) + segundos
+
+
+@contextmanager
+def tramo(etapa: str):
+    # Se usa como 'with tramo("etapa"):' o como decorador '@tramo("etapa")'
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(etapa, time.perf_counter() - inicio)
+
+
+def iniciar_peticion():
+    # Abre el desglose de etapas de la petición actual (contexto de asyncio)
+    return _peticion.set({"etapas": {}, "lock": threading.Lock()})
+
+
+def terminar_peticion(testigo, endpoint: str, metodo: str, estado: int, segundos: float,
+                      streaming: bool = False):
+    # Las respuestas en streaming van a su propio histograma: su duración es la del
+    # envío completo y mezclarla con la latencia de las demás falsearía ambas.
+    desglose = _peticion.get() or {"etapas": {}}
+    try:
+        _peticion.reset(testigo)
+    except ValueError:
+        pass  # el cuerpo en streaming terminó en otro contexto (cliente desconectado)
+
+    (STREAMING if streaming else PETICIONES).observar(segundos, endpoint, metodo)
+    RESPUESTAS.sumar(endpoint, metodo, estado)
+    if log_peticiones.isEnabledFor(logging.INFO):
+        log_peticiones.info(json.dumps({
+            "endpoint": endpoint,
+            "metodo": metodo,
+            "estado": estado,
+            "streaming": streaming,
+            "ms": round(segundos * 1000, 2),
+            "etapas_ms": {e: round(s * 1000, 2) for e, s in desglose["etapas"].items()}
+        }))
+
+
+# ARRANQUE Y MEMORIA DEL PROCESO
+# Con preload de gunicorn la app se importa en el master y cada worker nace por
+# fork: 'precargado' lo indica y la edad del proceso cuenta desde el fork. El valor
+# lo pone gunicorn.conf.py en STUDYSTOCK_PRECARGADO al crear cada worker (la opción
+# efectiva de gunicorn); fuera de gunicorn es False.
+
+_IMPORTADO = time.perf_counter()
+ARRANQUE = {"importacion": None, "listo": None, "precargado": False}
+
+
+def edad_proceso():
+    # Segundos desde que nació el proceso (Linux: /proc; si no, desde que se importó este módulo)
+    try:
+        with open("/proc/self/stat") as f:
+            inicio = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as f:
+            return float(f.read().split()[0]) - inicio
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _IMPORTADO
+
+
+def memoria():
+    # Memoria del proceso en bytes. 'pss' reparte las páginas compartidas (copy-on-write
+    # tras el fork, librerías) entre los procesos que las usan: es lo que cuesta cada worker.
+    campos = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "compartida", "Shared_Dirty": "compartida",
+              "Private_Clean": "privada", "Private_Dirty": "privada"}
+    try:
+        resultado = dict.fromkeys(("rss", "pss", "compartida", "privada"), 0)
+        with open("/proc/self/smaps_rollup") as f:
+            for linea in f:
+                nombre, _, resto = linea.partition(":")
+                if nombre in campos:
+                    resultado[campos[nombre]] += int(resto.split()[0]) * 1024
+        return resultado
+    except OSError:
+        import resource
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def marcar_listo():
+    ARRANQUE["listo"] = edad_proceso()
+    ARRANQUE["precargado"] = os.getenv("STUDYSTOCK_PRECARGADO") == "1"
+    return ARRANQUE
+
+
+def exponer_arranque():
+    fases = {f: ARRANQUE[f] for f in ("importacion", "listo") if ARRANQUE[f] is not None}
+    return (valor("studystock_arranque_segundos", "Segundos desde el inicio del proceso hasta cada fase.",
+                  "gauge", fases, "fase")
+            + valor("studystock_precargado", "1 si el worker nació por fork de un master con la app precargada.",
+                    "gauge", {None: ARRANQUE["precargado"]})
+            + valor("studystock_memoria_bytes", "Memoria del proceso (rss, pss, compartida, privada).",
+                    "gauge", memoria(), "tipo"))
+
+
+def exponer(*extra: list):
+    # Texto de /metrics: métricas propias más las que se calculan al vuelo ('extra')
+    lineas = PETICIONES.exponer() + STREAMING.exponer() + RESPUESTAS.exponer() + ETAPAS.exponer()
+    for bloque in extra:
+        lineas += bloque
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,115 @@
+
+# LIBRERÍAS
+import numpy as np
+import pandas as pd
+
+
+# MODELOS DE PREDICCIÓN
+# Todos siguen la misma interfaz: ajustar(df_p) con columnas ds / y / volume, y
+# predecir(futuro) con columnas ds / volume, que devuelve un array con 'yhat'.
+# intervalo(futuro) devuelve además los límites del intervalo de predicción (80%),
+# que el backtest usa para medir la cobertura. Así el servicio de predicción
+# calcula el mismo backtest y la misma respuesta para cualquier modelo.
+
+Z_INTERVALO = 1.2816  # Cuantil normal del intervalo central del 80% (igual que Prophet)
+
+class Pronosticador:
+    nombre = ""
+    en_proceso = True  # True: se entrena en el pool de procesos (modelos pesados)
+    parametros = {}
+
+    def __init__(self, **params):
+        self.params = {**self.parametros, **params}
+
+    def ajustar(self, df_p: pd.DataFrame):
+        raise NotImplementedError
+
+    def predecir(self, futuro: pd.DataFrame):
+        raise NotImplementedError
+
+    def intervalo(self, futuro: pd.DataFrame):
+        # (yhat, inferior, superior). Sin intervalo propio los límites quedan en NaN.
+        yhat = self.predecir(futuro)
+        return yhat, np.full(len(yhat), np.nan), np.full(len(yhat), np.nan)
+
+
+# PROPHET (Meta)
+
+class ProphetPronosticador(Pronosticador):
+    nombre = "prophet"
+    parametros = {"daily_seasonality": False, "yearly_seasonality": True}
+
+    def ajustar(self, df_p: pd.DataFrame):
+        from prophet import Prophet
+        self.modelo = Prophet(**self.params)
+        self.modelo.add_regressor('volume')
+        self.modelo.fit(df_p)
+        return self
+
+    def predecir(self, futuro: pd.DataFrame):
+        return self.modelo.predict(futuro[['ds', 'volume']])['yhat'].to_numpy()
+
+    def intervalo(self, futuro: pd.DataFrame):
+        pred = self.modelo.predict(futuro[['ds', 'volume']])
+        return pred['yhat'].to_numpy(), pred['yhat_lower'].to_numpy(), pred['yhat_upper'].to_numpy()
+
+
+# RÁPIDO: REGRESIÓN RIDGE SOBRE RETARDOS (NumPy)
+# Predice la variación diaria del cierre a partir de las 'retardos' variaciones
+# anteriores. El ajuste es una única resolución lineal (milisegundos) y la
+# predicción se encadena paso a paso sobre el horizonte.
+
+class RidgeRetardos(Pronosticador):
+    nombre = "fast"
+    en_proceso = False
+    parametros = {"retardos": 10, "alpha": 1.0}
+
+    def ajustar(self, df_p: pd.DataFrame):
+        p = int(self.params["retardos"])
+        y = df_p['y'].to_numpy(dtype=np.float64)
+        dy = np.diff(y)
+        p = max(1, min(p, len(dy) // 2))
+
+        # Matriz de retardos: fila t = [dy_{t-1}, ..., dy_{t-p}]
+        ventanas = np.lib.stride_tricks.sliding_window_view(dy, p + 1)
+        X = ventanas[:, :-1][:, ::-1]
+        objetivo = ventanas[:, -1]
+
+        self.media_x = X.mean(axis=0)
+        self.media_y = objetivo.mean()
+        Xc = X - self.media_x
+        A = Xc.T @ Xc + self.params["alpha"] * np.eye(p)
+        self.coef = np.linalg.solve(A, Xc.T @ (objetivo - self.media_y))
+        residuos = objetivo - self.media_y - Xc @ self.coef
+        self.sigma = float(residuos.std()) if len(residuos) > 1 else 0.0
+
+        self.p = p
+        self.ultimos_dy = dy[-p:][::-1]  # el más reciente primero
+        self.ultimo_y = y[-1]
+        return self
+
+    def predecir(self, futuro: pd.DataFrame):
+        retardos = self.ultimos_dy.copy()
+        nivel = self.ultimo_y
+        yhat = np.empty(len(futuro))
+        for i in range(len(futuro)):
+            paso = self.media_y + (retardos - self.media_x) @ self.coef
+            nivel += paso
+            yhat[i] = nivel
+            retardos = np.concatenate([[paso], retardos[:-1]])
+        return yhat
+
+    def intervalo(self, futuro: pd.DataFrame):
+        # Paseo aleatorio sobre los residuos: la incertidumbre crece con sqrt(paso)
+        yhat = self.predecir(futuro)
+        margen = Z_INTERVALO * self.sigma * np.sqrt(np.arange(1, len(yhat) + 1))
+        return yhat, yhat - margen, yhat + margen
+
+
+MODELOS = {m.nombre: m for m in (ProphetPronosticador, RidgeRetardos)}
+
+
+def crear_modelo(nombre: str, params: dict = None):
+    if nombre not in MODELOS:
+        raise ValueError(f"Modelo desconocido: {nombre}. Disponibles: {', '.join(MODELOS)}")
+    return MODELOS[nombre](**(params or {}))
@@ -0,0 +1,173 @@
+
+# LIBRERÍAS
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from app import api_engine as engine
+from app import concurrencia, eventos
+from app.almacen import AlmacenResultados, RUTA_DB
+from app.cache import ZONA_MERCADO, CIERRE
+
+
+# PLANIFICADOR DE PRECÁLCULO
+# Tras el cierre del mercado refresca las series de una lista de tickers
+# (watchlist) y deja calculadas sus respuestas de /stock y /predict.
+# Los resultados se guardan en SQLite, así que cualquier worker puede servirlos.
+
+# Lista separada por comas en WATCHLIST, o un ticker por línea en WATCHLIST_FILE
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE")
+PETICIONES_MINUTO = float(os.getenv("PLANIFICADOR_PETICIONES_MINUTO", 8))  # Plan gratuito de Twelve Data
+MINUTOS_TRAS_CIERRE = int(os.getenv("PLANIFICADOR_MINUTOS_TRAS_CIERRE", 20))
+VIGENCIA = float(os.getenv("PLANIFICADOR_VIGENCIA_HORAS", 24)) * 3600
+AL_ARRANCAR = os.getenv("PLANIFICADOR_AL_ARRANCAR", "1") == "1"
+
+RESULTADOS = AlmacenResultados()
+
+log = logging.getLogger("studystock.planificador")
+
+_tarea = None
+_cerrojo = None
+
+
+def watchlist():
+    if WATCHLIST_FILE and os.path.exists(WATCHLIST_FILE):
+        with open(WATCHLIST_FILE) as f:
+            tickers = [linea.strip() for linea in f]
+    else:
+        tickers = os.getenv("WATCHLIST", "").split(",")
+    # Sin duplicados y respetando el orden
+    return list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+
+
+def proxima_ejecucion(ahora: datetime = None):
+    # Próximo día laborable a la hora de cierre + margen (hora de Nueva York).
+    ahora = (ahora or datetime.now(ZONA_MERCADO)).astimezone(ZONA_MERCADO)
+    objetivo = ahora.replace(hour=CIERRE[0], minute=CIERRE[1], second=0, microsecond=0)
+    objetivo += timedelta(minutes=MINUTOS_TRAS_CIERRE)
+    if objetivo <= ahora:
+        objetivo += timedelta(days=1)
+    while objetivo.weekday() >= 5:
+        objetivo += timedelta(days=1)
+    return objetivo
+
+
+# RESULTADOS PRECALCULADOS
+
+def leer(tipo: str, ticker: str):
+    # Devuelve (resultado, antigüedad en segundos) si hay un precálculo vigente.
+    guardado = RESULTADOS.leer(tipo, ticker)
+    if guardado is None:
+        return None
+    resultado, calculado = guardado
+    antiguedad = time.time() - calculado
+    if antiguedad > VIGENCIA:
+        return None
+    return resultado, antiguedad
+
+
+def segundos_vigencia(antiguedad: float):
+    # Cuánto puede cachearse un precálculo: hasta que caduque o hasta la próxima ronda.
+    hasta_ronda = (proxima_ejecucion() - datetime.now(ZONA_MERCADO)).total_seconds()
+    return max(0.0, min(VIGENCIA - antiguedad, hasta_ronda))
+
+
+def version_precalculo(antiguedad: float):
+    # Momento del cálculo (epoch): identifica la versión del resultado guardado
+    return round(time.time() - antiguedad)
+
+
+def info_antiguedad(antiguedad: float):
+    return {
+        "precalculado": True,
+        "antiguedad_segundos": int(antiguedad),
+        "calculado": datetime.fromtimestamp(time.time() - antiguedad, ZONA_MERCADO).isoformat(timespec="seconds")
+    }
+
+
+async def precalcular(ticker: str, limitador: concurrencia.CuboTokens):
+    # Refresca la serie (consume una petición del presupuesto) y calcula /stock y /predict.
+    await limitador.adquirir()
+    df = await engine.refrescar_datos_async(ticker)
+    if isinstance(df, dict) and "error" in df:
+        log.warning("Planificador: %s -> %s", ticker, df['error'])
+        return False
+
+    # La serie recién refrescada llega también a los clientes de /stream/stock
+    eventos.publicar_precio(ticker, df)
+
+    resumen = await concurrencia.ejecutar(engine.resumen_stock, ticker, df)
+    await concurrencia.ejecutar(RESULTADOS.guardar, "stock", ticker, resumen)
+
+    res = await engine.predecir_ia_async(df, ticker)
+    if "error" not in res:
+        await concurrencia.ejecutar(RESULTADOS.guardar, "predict", ticker, res)
+    return True
+
+
+async def ejecutar_ronda(tickers: list = None):
+    tickers = watchlist() if tickers is None else tickers
+    limitador = concurrencia.CuboTokens(PETICIONES_MINUTO)
+    inicio = time.monotonic()
+    correctos = 0
+    for ticker in tickers:
+        try:
+            correctos += await precalcular(ticker, limitador)
+        except Exception as e:
+            log.exception("Planificador: fallo en %s: %s", ticker, e)
+    log.info("Planificador: %d/%d tickers precalculados en %.1fs",
+             correctos, len(tickers), time.monotonic() - inicio)
+
+
+async def _bucle():
+    if AL_ARRANCAR:
+        await ejecutar_ronda()
+    while True:
+        espera = (proxima_ejecucion() - datetime.now(ZONA_MERCADO)).total_seconds()
+        await asyncio.sleep(max(espera, 0))
+        await ejecutar_ronda()
+
+
+# ARRANQUE / PARADA (desde el lifespan de FastAPI)
+
+def _tomar_cerrojo():
+    # Solo un worker de gunicorn por máquina ejecuta el planificador.
+    global _cerrojo
+    os.makedirs(os.path.dirname(RUTA_DB), exist_ok=True)
+    f = open(os.path.join(os.path.dirname(RUTA_DB), "planificador.lock"), "w")
+    try:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:
+            # Windows (desarrollo local): bloqueo del primer byte del fichero
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return False
+    _cerrojo = f
+    return True
+
+
+def iniciar():
+    global _tarea
+    if not watchlist() or not _tomar_cerrojo():
+        return
+    _tarea = asyncio.create_task(_bucle())
+
+
+async def detener():
+    global _tarea, _cerrojo
+    if _tarea is not None:
+        _tarea.cancel()
+        try:
+            await _tarea
+        except asyncio.CancelledError:
+            pass
+        _tarea = None
+    if _cerrojo is not None:
+        _cerrojo.close()
+        _cerrojo = None
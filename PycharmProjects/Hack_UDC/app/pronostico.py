@@ -0,0 +1,334 @@
+
+# LIBRERÍAS
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app import concurrencia
+from app.backtest import HORIZONTE, PLIEGUES, MotorBacktest
+from app.metricas import registrar
+from app.modelos import MODELOS, crear_modelo
+from app.series import INTERVALOS, SerieOHLCV, como_serie
+
+
+# SERVICIO DE PREDICCIÓN (IA)
+# Los modelos pesados (Prophet) se entrenan en un pool de procesos "caliente": cada
+# proceso carga Prophet/cmdstanpy una sola vez al arrancar. Los ligeros (app/modelos.py)
+# se ajustan en un hilo. Los resultados se guardan en caché por (ticker, última escritura
+# en el almacén, última vela, nº de velas, modelo y parámetros), así que mientras no
+# cambien los datos una predicción repetida no vuelve a entrenar. Las métricas de eficacia salen del
+# backtest con origen móvil (app/backtest.py), que se entrena en paralelo al modelo
+# final y también se guarda en caché por versión de los datos.
+
+PROCESOS_IA = int(os.getenv("PROCESOS_IA", min(4, os.cpu_count() or 1)))
+MAX_RESULTADOS = int(os.getenv("PRONOSTICO_MAX_RESULTADOS", 1000))
+MAX_MODELOS_WORKER = int(os.getenv("PRONOSTICO_MAX_MODELOS", 32))
+# Arranque del pool: con "forkserver" un proceso servidor importa Prophet/Stan una sola
+# vez y cada proceso del pool nace por fork de él (copy-on-write), en lugar de que cada
+# uno lo importe desde cero como con "spawn".
+INICIO_POOL = os.getenv("PRONOSTICO_INICIO",
+                        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+MODELO_POR_DEFECTO = "prophet"
+DIAS_PREDICCION = 7
+
+
+# PREPARAR DATOS PARA PROPHET (columnas ds / y / volume)
+# Solo se construye el DataFrame cuando hay que entrenar: un acierto de caché
+# se resuelve con la clave, que sale directamente de la serie compacta.
+
+def preparar_prophet(serie: SerieOHLCV):
+    df_p = pd.DataFrame({
+        'ds': serie.fechas,
+        'y': serie.close.astype(np.float64),
+        'volume': serie.volume
+    })
+    return df_p.dropna(subset=['ds', 'y', 'volume']).reset_index(drop=True)
+
+
+def clave_pronostico(serie: SerieOHLCV, ticker: str = None, modelo: str = MODELO_POR_DEFECTO,
+                     params: dict = None):
+    # Versión de los datos: la última escritura de la serie en el almacén (una carga puede
+    # cambiar velas antiguas sin tocar la última). Sin ticker, o si la serie no viene del
+    # almacén, usamos un hash del contenido.
+    huella = serie.huella() if not ticker or not serie.fuente else None
+    origen = ticker or huella
+    escritura = (serie.fuente, serie.actualizado) if serie.fuente else huella
+    params = {**MODELOS[modelo].parametros, **(params or {})}
+    return (origen, escritura, serie.intervalo, str(serie.ultima_fecha), len(serie), modelo,
+            tuple(sorted(params.items())))
+
+
+# CÓDIGO QUE SE EJECUTA DENTRO DE LOS PROCESOS DEL POOL
+
+_modelos = OrderedDict()  # Modelos entrenados en este proceso: clave -> modelo final
+# Los modelos ligeros se ajustan en el pool de hilos, así que varios hilos usan la caché a la vez
+_cerrojo_modelos = threading.Lock()
+
+
+def _iniciar_worker():
+    # Se ejecuta una vez por proceso: carga Stan/cmdstanpy antes de la primera petición
+    # (con forkserver ya viene importado del servidor y no cuesta nada).
+    import prophet  # noqa: F401
+    logging.getLogger('prophet').setLevel(logging.ERROR)
+    logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
+
+
+def _contexto_pool():
+    contexto = multiprocessing.get_context(INICIO_POOL)
+    if INICIO_POOL == "forkserver":
+        contexto.set_forkserver_preload(["app.pronostico", "prophet"])
+    return contexto
+
+
+def _entrenar(clave, df_p: pd.DataFrame, modelo: str, params: dict):
+    # Modelo final con toda la serie, reutilizando los ya entrenados en este proceso.
+    # El ajuste se hace fuera del cerrojo: solo se protege el acceso a la caché.
+    with _cerrojo_modelos:
+        m_final = _modelos.get(clave)
+        if m_final is not None:
+            _modelos.move_to_end(clave)
+            return m_final
+
+    m_final = crear_modelo(modelo, params).ajustar(df_p)
+
+    with _cerrojo_modelos:
+        _modelos[clave] = m_final
+        while len(_modelos) > MAX_MODELOS_WORKER:
+            _modelos.popitem(last=False)
+    return m_final
+
+
+def _ajustar_y_predecir(clave, df_p: pd.DataFrame, modelo: str, params: dict, periodos: int,
+                        frecuencia: str = "D"):
+    # Los tiempos de ajuste y predicción se devuelven en 'tiempos' (este código puede
+    # ejecutarse en otro proceso) y el servicio los registra como etapas.
+    try:
+        inicio = time.perf_counter()
+        m_final = _entrenar(clave, df_p, modelo, params)
+        ajuste = time.perf_counter() - inicio
+
+        # Predicción Futura Final (las 'periodos' barras siguientes a la última, volumen medio):
+        # días naturales en la serie diaria, inicio de semana/mes/año en las remuestreadas
+        future = pd.DataFrame({
+            'ds': pd.date_range(df_p['ds'].iloc[-1], periods=periodos + 1, freq=frecuencia)[1:],
+            'volume': df_p['volume'].mean()
+        })
+        yhat_final = m_final.predecir(future)
+
+        return {
+            "status": "success",
+            "modelo": modelo,
+            "predicciones": {str(ds.date()): round(float(y), 2) for ds, y in zip(future['ds'], yhat_final)},
+            "tiempos": {"ajuste": ajuste, "prediccion": time.perf_counter() - inicio - ajuste}
+        }
+
+    except Exception as e:
+        logging.getLogger("studystock.pronostico").exception("Fallo en el motor de IA")
+        return {"error": f"Fallo en el motor de IA: {str(e)}"}
+
+
+def _registrar_tiempos(res: dict, modelo: str):
+    for etapa, segundos in res.pop("tiempos", {}).items():
+        registrar(f"{etapa}_{modelo}", segundos)
+    return res
+
+
+def _combinar(res: dict, backtest: dict):
+    # Añade a la predicción las métricas del backtest (error medio y precisión = 100 - MAPE)
+    if "error" in res:
+        return res
+    if "error" in backtest:
+        return backtest
+    return {
+        **res,
+        "metricas": {
+            "error_medio_usd": round(backtest["mae"], 2),
+            "precision_porcentual": f"{round(100 - backtest['mape'], 2)}%"
+        },
+        "backtest": backtest
+    }
+
+
+# SERVICIO (lado del proceso de la API)
+
+class ServicioPronostico:
+
+    def __init__(self, procesos: int = PROCESOS_IA, max_resultados: int = MAX_RESULTADOS):
+        self.procesos = procesos
+        self.max_resultados = max_resultados
+        self._pool = None
+        self._resultados = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.entrenamientos = 0
+        self.en_curso = 0
+        self.backtest = MotorBacktest(lambda: self.pool)
+
+    @property
+    def pool(self):
+        # El pool se crea en el primer uso: los workers que solo sirven /stock no lo pagan.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.procesos,
+                    mp_context=_contexto_pool(),
+                    initializer=_iniciar_worker
+                )
+            return self._pool
+
+    def _buscar(self, clave):
+        with self._lock:
+            if clave in self._resultados:
+                self._resultados.move_to_end(clave)
+                self.aciertos += 1
+                return self._resultados[clave]
+        return None
+
+    def _guardar(self, clave, res):
+        if "error" in res:
+            return res
+        with self._lock:
+            self._resultados[clave] = res
+            while len(self._resultados) > self.max_resultados:
+                self._resultados.popitem(last=False)
+        return res
+
+    def _preparar(self, serie: SerieOHLCV, ticker: str, modelo: str, params: dict, periodos: int):
+        if modelo not in MODELOS:
+            return None, {"error": f"Modelo desconocido: {modelo}. Disponibles: {', '.join(MODELOS)}"}
+        serie = como_serie(serie)
+        # Si hay menos de 15 registros de valores en el historial de la empresa, al modelo
+        # de IA no le sirve como aprendizaje (muy pocos datos).
+        if len(serie) < 15:
+            return None, {"error": f"Datos insuficientes ({len(serie)}). Se requieren al menos 15."}
+        clave = clave_pronostico(serie, ticker, modelo, params)
+        return (clave, serie), self._buscar((clave, periodos))
+
+    def predecir(self, serie: SerieOHLCV, ticker: str = None, modelo: str = MODELO_POR_DEFECTO,
+                 params: dict = None, periodos: int = DIAS_PREDICCION):
+        try:
+            trabajo, res = self._preparar(serie, ticker, modelo, params, periodos)
+            if res is not None:
+                return res
+            clave, serie = trabajo
+            df_p, frecuencia = preparar_prophet(serie), INTERVALOS[serie.intervalo]
+            self.entrenamientos += 1
+            self.en_curso += 1
+            try:
+                if MODELOS[modelo].en_proceso:
+                    futuro = self.pool.submit(_ajustar_y_predecir, clave, df_p, modelo, params, periodos, frecuencia)
+                    backtest = self.backtest.evaluar(clave, df_p, modelo, params)
+                    res = futuro.result()
+                else:
+                    backtest = self.backtest.evaluar(clave, df_p, modelo, params)
+                    res = _ajustar_y_predecir(clave, df_p, modelo, params, periodos, frecuencia)
+            finally:
+                self.en_curso -= 1
+            return self._guardar((clave, periodos), _combinar(_registrar_tiempos(res, modelo), backtest))
+        except Exception as e:
+            return {"error": f"Fallo en el motor de IA: {str(e)}"}
+
+    async def predecir_async(self, serie: SerieOHLCV, ticker: str = None, modelo: str = MODELO_POR_DEFECTO,
+                             params: dict = None, periodos: int = DIAS_PREDICCION, progreso=None):
+        # Igual que predecir(), pero espera al proceso sin ocupar ningún hilo.
+        # Los modelos ligeros se ajustan en el pool de hilos (el viaje al proceso costaría más).
+        # 'progreso(etapa, datos)' se llama desde el bucle de eventos al empezar el ajuste
+        # ("ajustando") y al terminar el backtest y el modelo final, con sus resultados parciales.
+        try:
+            trabajo, res = self._preparar(serie, ticker, modelo, params, periodos)
+            if res is not None:
+                return res
+            clave, serie = trabajo
+            # Las peticiones simultáneas con la misma versión de datos comparten un entrenamiento
+            return await concurrencia.VUELOS.ejecutar(("predict", clave, periodos), self._calcular_async,
+                                                      clave, serie, modelo, params, periodos, progreso)
+        except Exception as e:
+            return {"error": f"Fallo en el motor de IA: {str(e)}"}
+
+    async def _calcular_async(self, clave, serie: SerieOHLCV, modelo: str, params: dict, periodos: int,
+                              progreso=None):
+        avisar = progreso or (lambda etapa, datos: None)
+
+        async def parcial(etapa, tarea):
+            res = await tarea
+            avisar(etapa, {k: v for k, v in res.items() if k != "tiempos"})
+            return res
+
+        self.entrenamientos += 1
+        self.en_curso += 1
+        try:
+            avisar("ajustando", {"modelo": modelo, "velas": len(serie)})
+            df_p, frecuencia = preparar_prophet(serie), INTERVALOS[serie.intervalo]
+            if MODELOS[modelo].en_proceso:
+                final = asyncio.wrap_future(
+                    self.pool.submit(_ajustar_y_predecir, clave, df_p, modelo, params, periodos, frecuencia))
+            else:
+                final = concurrencia.ejecutar(_ajustar_y_predecir, clave, df_p, modelo, params, periodos, frecuencia)
+            # El modelo final y los pliegues del backtest se entrenan a la vez
+            backtest = self.backtest.evaluar_async(clave, df_p, modelo, params)
+            res, backtest = await asyncio.gather(parcial("prediccion", final), parcial("backtest", backtest))
+            return self._guardar((clave, periodos), _combinar(_registrar_tiempos(res, modelo), backtest))
+        except Exception as e:
+            return {"error": f"Fallo en el motor de IA: {str(e)}"}
+        finally:
+            self.en_curso -= 1
+
+    async def backtest_async(self, serie: SerieOHLCV, ticker: str = None, modelo: str = MODELO_POR_DEFECTO,
+                             params: dict = None, horizonte: int = HORIZONTE, pliegues: int = PLIEGUES):
+        # Solo el backtest (sin predicción futura), con horizonte y nº de pliegues a medida
+        try:
+            trabajo, error = self._preparar(serie, ticker, modelo, params, None)
+            if trabajo is None:
+                return error
+            clave, serie = trabajo
+            df_p = preparar_prophet(serie)
+            res = await concurrencia.VUELOS.ejecutar(("backtest", clave, horizonte, pliegues), self.backtest.evaluar_async,
+                                                     clave, df_p, modelo, params, horizonte, pliegues)
+            return res if "error" in res else {"modelo": modelo, **res}
+        except Exception as e:
+            return {"error": f"Fallo en el motor de IA: {str(e)}"}
+
+    async def predecir_lote(self, datos: dict, modelo: str = MODELO_POR_DEFECTO):
+        # Lanza todas las predicciones a la vez (el pool reparte los entrenamientos entre
+        # sus procesos) y devuelve (ticker, resultado, segundos) según van terminando.
+        async def una(ticker, serie):
+            inicio = time.perf_counter()
+            res = await self.predecir_async(serie, ticker, modelo)
+            return ticker, res, time.perf_counter() - inicio
+
+        tareas = [asyncio.ensure_future(una(t, s)) for t, s in datos.items()]
+        try:
+            for siguiente in asyncio.as_completed(tareas):
+                yield await siguiente
+        finally:
+            # Si el cliente corta el streaming no seguimos esperando resultados
+            for tarea in tareas:
+                tarea.cancel()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "procesos": self.procesos,
+                "pool_activo": self._pool is not None,
+                "inicio_pool": INICIO_POOL,
+                "resultados_en_cache": len(self._resultados),
+                "aciertos": self.aciertos,
+                "entrenamientos": self.entrenamientos,
+                "en_curso": self.en_curso,
+                "backtest": self.backtest.estadisticas()
+            }
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,84 @@
+
+# LIBRERÍAS
+import hashlib
+import inspect
+import json
+import os
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.cache import CacheSeries, ttl_sesion
+from app.metricas import tramo
+from app.series import SerieOHLCV
+
+
+# CACHÉ DE RESPUESTAS HTTP (ETag / 304 / Cache-Control)
+# Las respuestas de /stock, /compare y /predict solo cambian cuando llegan velas
+# nuevas. Se guardan ya serializadas (bytes JSON) con clave (endpoint, parámetros,
+# versión de los datos), así que un acierto se salta tanto el trabajo de pandas
+# como la codificación JSON. El ETag es el hash del cuerpo: si el cliente ya lo
+# tiene (If-None-Match) se responde 304 sin cuerpo.
+# Los datos de Twelve Data solo cambian con la sesión de mercado, así que navegadores
+# y proxies pueden guardarlos 'max-age' segundos. Los tickers locales (DB_LOCAL) cambian
+# con cualquier carga: su respuesta va con 'no-cache' (siempre se revalida con el ETag).
+
+MAX_ENTRADAS = int(os.getenv("RESPUESTAS_MAX_ENTRADAS", 2000))
+MAX_BYTES = int(os.getenv("RESPUESTAS_MAX_MB", 64)) * 1024 * 1024
+
+CACHE_RESPUESTAS = CacheSeries(max_entradas=MAX_ENTRADAS, max_bytes=MAX_BYTES)
+
+
+def version_datos(*series: SerieOHLCV):
+    # Versión de una o varias series: última vela, nº de velas, último cierre (el cierre
+    # cubre la vela del día, que se revisa mientras el mercado está abierto) y última
+    # escritura en el almacén (una carga puede cambiar velas antiguas).
+    return tuple(s.version for s in series)
+
+
+def serializar(contenido):
+    # Mismos bytes que JSONResponse(jsonable_encoder(...)). Las respuestas ya son tipos
+    # nativos de JSON, así que json.dumps va directo (jsonable_encoder recorre cada valor
+    # en Python: ~0,5 s para la matriz de correlación de una cartera de 500 empresas);
+    # solo si aparece otro tipo (fechas, NumPy...) se pasa por jsonable_encoder.
+    try:
+        return json.dumps(contenido, ensure_ascii=False, allow_nan=False, indent=None,
+                          separators=(",", ":")).encode("utf-8")
+    except (TypeError, ValueError):
+        return JSONResponse(jsonable_encoder(contenido)).body
+
+
+def calcular_etag(cuerpo: bytes):
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+
+def _coincide(request: Request, etag: str):
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return False
+    etiquetas = [e.strip().removeprefix("W/") for e in cabecera.split(",")]
+    return "*" in etiquetas or etag in etiquetas
+
+
+async def responder(request: Request, clave: tuple, construir, max_age: float = None, revalidar: bool = False):
+    # 'construir' devuelve el contenido (dict) de la respuesta; solo se llama si no
+    # está en caché. Puede ser una función normal o asíncrona. Con 'revalidar' (datos
+    # locales) el cliente no puede reutilizar la respuesta sin preguntar.
+    max_age = int(max(0, ttl_sesion() if max_age is None else max_age))
+
+    entrada = CACHE_RESPUESTAS.obtener(clave)
+    if entrada is None:
+        contenido = construir()
+        if inspect.isawaitable(contenido):
+            contenido = await contenido
+        with tramo("serializacion"):
+            cuerpo = serializar(contenido)
+        entrada = (cuerpo, calcular_etag(cuerpo))
+        CACHE_RESPUESTAS.guardar(clave, entrada, ttl=max_age)
+
+    cuerpo, etag = entrada
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache" if revalidar else f"public, max-age={max_age}"}
+    if _coincide(request, etag):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
@@ -0,0 +1,260 @@
+
+# LIBRERÍAS
+import glob
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# SERIES OHLCV COMPACTAS (COLUMNAS NUMPY CONTIGUAS)
+# Un DataFrame por serie cuesta índice, bloques float64 y objetos de pandas. Aquí
+# cada serie son tres arrays: tiempos int64 (días desde 1970 en las series diarias,
+# segundos en las intradía), precios open/high/low/close en un bloque float32
+# (4 x n, cada columna contigua) y volumen float64. Las estadísticas, la comparativa
+# y la clave de la predicción trabajan sobre vistas de estos arrays sin crear un
+# DataFrame por petición; solo se materializa uno al entrenar o calcular indicadores.
+# Con SERIES_MMAP_DIR las series se escriben además en ficheros binarios que cada
+# worker abre con mmap: todos leen la misma copia desde la caché de páginas del sistema.
+
+PRECIO_DTYPE = np.dtype(os.getenv("SERIES_PRECIO_DTYPE", "float32"))
+DIRECTORIO_MMAP = os.getenv("SERIES_MMAP_DIR")
+
+PRECIOS = ('open', 'high', 'low', 'close')
+COLUMNAS = PRECIOS + ('volume',)
+DIA = 86400
+
+# Intervalos de barra y su frecuencia de pandas (para fechar las barras futuras)
+INTERVALO_BASE = "1day"
+INTERVALOS = {"1day": "D", "1week": "W-MON", "1month": "MS", "1year": "YS"}
+
+
+class SerieOHLCV:
+    __slots__ = ('tiempos', 'unidad', 'precios', 'volume', 'mapeada', 'intervalo', 'fuente', 'actualizado')
+
+    def __init__(self, tiempos: np.ndarray, unidad: int, precios: np.ndarray, volume: np.ndarray,
+                 mapeada: bool = False, intervalo: str = INTERVALO_BASE, fuente: str = None,
+                 actualizado: float = 0.0):
+        self.tiempos = tiempos    # int64, en 'unidad' segundos desde 1970
+        self.unidad = unidad      # 86400 (diaria) o 1 (intradía)
+        self.precios = precios    # (4, n): open, high, low, close
+        self.volume = volume      # float64
+        self.mapeada = mapeada    # True si los arrays son vistas de un fichero mmap
+        self.intervalo = intervalo  # tamaño de cada barra ("1day", "1week", ...)
+        self.fuente = fuente      # fuente del almacén de la que se leyó ("local", ...) o None
+        self.actualizado = actualizado  # última escritura de esa fuente en el almacén (epoch)
+
+    # --- Construcción ---
+
+    @classmethod
+    def desde_columnas(cls, segundos: np.ndarray, precios: np.ndarray, volume: np.ndarray):
+        # 'segundos' epoch en segundos; 'precios' (4, n) en cualquier tipo numérico
+        segundos = np.asarray(segundos, dtype=np.int64)
+        unidad = DIA if len(segundos) and not (segundos % DIA).any() else 1
+        return cls(segundos // unidad, unidad, np.ascontiguousarray(precios, dtype=PRECIO_DTYPE),
+                   np.ascontiguousarray(volume, dtype=np.float64))
+
+    @classmethod
+    def desde_dataframe(cls, df: pd.DataFrame):
+        fechas = pd.DatetimeIndex(df['datetime'] if 'datetime' in df.columns else df.index)
+        if fechas.tz is not None:
+            fechas = fechas.tz_localize(None)
+        precios = df[list(PRECIOS)].to_numpy(dtype=np.float64).T
+        return cls.desde_columnas(fechas.asi8 // 10**9, precios, df['volume'].to_numpy(dtype=np.float64))
+
+    # --- Columnas (vistas, sin copia) ---
+
+    @property
+    def open(self):
+        return self.precios[0]
+
+    @property
+    def high(self):
+        return self.precios[1]
+
+    @property
+    def low(self):
+        return self.precios[2]
+
+    @property
+    def close(self):
+        return self.precios[3]
+
+    def __len__(self):
+        return len(self.tiempos)
+
+    @property
+    def nbytes(self):
+        # Memoria propia del proceso (la de una serie mapeada es de la caché de páginas)
+        if self.mapeada:
+            return 0
+        return self.tiempos.nbytes + self.precios.nbytes + self.volume.nbytes
+
+    def fecha(self, posicion: int = -1):
+        return pd.Timestamp(int(self.tiempos[posicion]) * self.unidad, unit='s')
+
+    @property
+    def ultima_fecha(self):
+        return self.fecha(-1)
+
+    @property
+    def fechas(self):
+        return pd.DatetimeIndex(pd.to_datetime(self.tiempos * self.unidad, unit='s'), name='datetime')
+
+    def ultimas(self, n: int):
+        # Vista de las últimas n velas
+        if n >= len(self):
+            return self
+        return SerieOHLCV(self.tiempos[-n:], self.unidad, self.precios[:, -n:], self.volume[-n:],
+                          self.mapeada, self.intervalo, self.fuente, self.actualizado)
+
+    def sellar(self, fuente: str, actualizado: float):
+        # Marca la serie con la escritura del almacén de la que procede
+        self.fuente, self.actualizado = fuente, actualizado
+        return self
+
+    @property
+    def version(self):
+        # Última vela, nº de velas, último cierre (el cierre cubre la vela del día en curso) y
+        # última escritura en el almacén: una carga puede cambiar velas antiguas sin tocar la última
+        if not len(self):
+            return (self.intervalo, 0, 0, 0.0, self.actualizado)
+        return (self.intervalo, int(self.tiempos[-1]), len(self), float(self.close[-1]), self.actualizado)
+
+    def huella(self):
+        # Hash del contenido (tiempos, cierres y volumen) para series sin ticker
+        h = hashlib.blake2b(digest_size=8)
+        for array in (self.tiempos, self.close, self.volume):
+            h.update(np.ascontiguousarray(array).tobytes())
+        return int.from_bytes(h.digest(), "little")
+
+    # --- Materialización (solo cuando hace falta pandas) ---
+
+    def a_dataframe(self):
+        datos = {col: self.precios[i].astype(np.float64) for i, col in enumerate(PRECIOS)}
+        datos['volume'] = np.array(self.volume)
+        return pd.DataFrame(datos, index=self.fechas)
+
+    def __getstate__(self):
+        # Al enviarla a otro proceso se copian los arrays (un mmap no se puede serializar)
+        return (np.array(self.tiempos), self.unidad, np.array(self.precios), np.array(self.volume), self.intervalo,
+                self.fuente, self.actualizado)
+
+    def __setstate__(self, estado):
+        (self.tiempos, self.unidad, self.precios, self.volume, self.intervalo,
+         self.fuente, self.actualizado) = estado
+        self.mapeada = False
+
+
+def como_serie(datos):
+    # Acepta una SerieOHLCV o un DataFrame OHLCV (p. ej. de quien llame al motor directamente)
+    return datos if isinstance(datos, SerieOHLCV) else SerieOHLCV.desde_dataframe(datos)
+
+
+# REMUESTREO A BARRAS SEMANALES, MENSUALES Y ANUALES
+# Solo se guarda la serie base (diaria) de cada ticker; el resto de intervalos se
+# construye agrupando las velas consecutivas del mismo periodo, sin bucles:
+# apertura de la primera, cierre de la última, máximo/mínimo y volumen acumulado
+# con reduceat. Cada barra se fecha con el inicio de su periodo (como Twelve Data).
+
+def _inicio_periodo(serie: SerieOHLCV, intervalo: str):
+    # Día (desde 1970) en que empieza el periodo de cada vela
+    dias = serie.tiempos * serie.unidad // DIA
+    if intervalo == "1week":
+        # El 1-1-1970 fue jueves: las semanas van de lunes (día -3) a domingo
+        return (dias + 3) // 7 * 7 - 3
+    unidad = "datetime64[M]" if intervalo == "1month" else "datetime64[Y]"
+    return dias.astype("datetime64[D]").astype(unidad).astype("datetime64[D]").astype(np.int64)
+
+
+def remuestrear(serie: SerieOHLCV, intervalo: str):
+    if intervalo == serie.intervalo or intervalo == INTERVALO_BASE:
+        return serie
+    if not len(serie):
+        return SerieOHLCV(serie.tiempos, DIA, serie.precios, serie.volume, intervalo=intervalo,
+                          fuente=serie.fuente, actualizado=serie.actualizado)
+
+    periodo = _inicio_periodo(serie, intervalo)
+    inicios = np.flatnonzero(np.r_[True, periodo[1:] != periodo[:-1]])
+    finales = np.r_[inicios[1:], len(periodo)] - 1
+
+    precios = np.empty((4, len(inicios)), dtype=serie.precios.dtype)
+    precios[0] = serie.open[inicios]
+    precios[1] = np.fmax.reduceat(serie.high, inicios)
+    precios[2] = np.fmin.reduceat(serie.low, inicios)
+    precios[3] = serie.close[finales]
+    volume = np.add.reduceat(np.nan_to_num(serie.volume), inicios)
+    return SerieOHLCV(periodo[inicios], DIA, precios, volume, intervalo=intervalo,
+                      fuente=serie.fuente, actualizado=serie.actualizado)
+
+
+# FICHEROS MMAP COMPARTIDOS ENTRE WORKERS
+# Formato: cabecera de 32 bytes (firma y nº de velas, unidad y bytes por precio en int64) y
+# después las columnas seguidas: tiempos int64, precios (4 x n) y volumen float64.
+# Se escriben en un temporal y se renombran, así que un lector nunca ve un fichero a
+# medias; la versión (última escritura en SQLite) va en el nombre, y al escribir una
+# versión nueva se borran las anteriores (quien ya las tenga mapeadas las sigue leyendo).
+
+FIRMA = b"OHLCV\x00\x00\x01"
+CABECERA = 32
+
+
+def escribir_mmap(ruta: str, serie: SerieOHLCV):
+    cabecera = np.array([len(serie), serie.unidad, serie.precios.dtype.itemsize], dtype=np.int64)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(FIRMA + cabecera.tobytes())
+        f.write(np.ascontiguousarray(serie.tiempos, dtype=np.int64).tobytes())
+        f.write(np.ascontiguousarray(serie.precios).tobytes())
+        f.write(np.ascontiguousarray(serie.volume, dtype=np.float64).tobytes())
+    os.replace(temporal, ruta)
+
+
+def leer_mmap(ruta: str):
+    # Devuelve la serie con sus arrays como vistas del fichero mapeado (solo lectura)
+    bruto = np.memmap(ruta, dtype=np.uint8, mode="r")
+    if bytes(bruto[:8]) != FIRMA:
+        raise ValueError(f"Fichero de serie no válido: {ruta}")
+    n, unidad, itemsize = (int(x) for x in np.frombuffer(bruto, dtype=np.int64, count=3, offset=8))
+    inicio_precios = CABECERA + 8 * n
+    inicio_volumen = inicio_precios + 4 * n * itemsize
+    tiempos = np.frombuffer(bruto, dtype=np.int64, count=n, offset=CABECERA)
+    precios = np.frombuffer(bruto, dtype=np.dtype(f"f{itemsize}"), count=4 * n, offset=inicio_precios)
+    volume = np.frombuffer(bruto, dtype=np.float64, count=n, offset=inicio_volumen)
+    return SerieOHLCV(tiempos, unidad, precios.reshape(4, n), volume, mapeada=True)
+
+
+class ArchivoSeries:
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _prefijo(self, fuente: str, ticker: str, velas: int):
+        # 'velas' None: la serie completa (las de DB_LOCAL)
+        nombre = f"{fuente}__{ticker}__{velas or 'todas'}".replace(":", "_").replace("/", "_")
+        return os.path.join(self.directorio, nombre)
+
+    def leer(self, fuente: str, ticker: str, velas: int, version: float):
+        ruta = f"{self._prefijo(fuente, ticker, velas)}__{int(version * 1000)}.ohlcv"
+        try:
+            return leer_mmap(ruta).sellar(fuente, version)
+        except (OSError, ValueError):
+            return None
+
+    def escribir(self, fuente: str, ticker: str, velas: int, version: float, serie: SerieOHLCV):
+        prefijo = self._prefijo(fuente, ticker, velas)
+        ruta = f"{prefijo}__{int(version * 1000)}.ohlcv"
+        escribir_mmap(ruta, serie)
+        for antigua in glob.glob(glob.escape(prefijo) + "__*.ohlcv"):
+            if antigua != ruta:
+                try:
+                    os.remove(antigua)
+                except OSError:
+                    pass
+        return leer_mmap(ruta).sellar(fuente, version)
+
+
+ARCHIVO_SERIES = ArchivoSeries(DIRECTORIO_MMAP) if DIRECTORIO_MMAP else None
@@ -0,0 +1,108 @@
+
+# LIBRERÍAS
+import asyncio
+import os
+import zlib
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI
+
+from app.concurrencia import CuboTokens
+
+
+# SERVIDOR SIMULADO DE TWELVE DATA
+# Imita el endpoint /time_series (un símbolo o varios separados por comas, outputsize,
+# start_date, order) con series sintéticas deterministas por ticker, latencia
+# configurable y, opcionalmente, el límite de créditos por minuto con la misma
+# respuesta 429 que la API real. Sirve para probar la API y hacer pruebas de carga sin red:
+#
+#   uvicorn app.stub_td:app --port 8100
+#   TWELVE_DATA_URL=http://localhost:8100 TWELVE_DATA_KEY=demo uvicorn app.main:app
+
+LATENCIA_MS = float(os.getenv("STUB_LATENCIA_MS", 50))
+CREDITOS_MINUTO = float(os.getenv("STUB_CREDITOS_MINUTO", 0))  # 0 = sin límite
+INVALIDOS = set(os.getenv("STUB_INVALIDOS", "BAD,INVALID").split(","))
+HISTORIA = 5000  # velas generadas por ticker e intervalo (el máximo de outputsize)
+
+FRECUENCIAS = {
+    "1min": "min", "5min": "5min", "15min": "15min", "30min": "30min", "45min": "45min",
+    "1h": "h", "2h": "2h", "4h": "4h", "1day": "B", "1week": "W-FRI", "1month": "ME"
+}
+
+app = FastAPI(title="Twelve Data (simulado)")
+
+_cubos = {}  # apikey -> CuboTokens
+
+
+def _error(codigo: int, mensaje: str):
+    return {"code": codigo, "message": mensaje, "status": "error"}
+
+
+@lru_cache(maxsize=256)
+def _historia(symbol: str, interval: str, fin: pd.Timestamp):
+    # Historia completa (HISTORIA velas hasta 'fin') con semilla fija por ticker: cada
+    # petición recorta su cola, así que descargas con distinto outputsize o start_date
+    # dan el mismo precio para la misma fecha.
+    fechas = pd.date_range(end=fin, periods=HISTORIA, freq=FRECUENCIAS.get(interval, "B"))
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    cierre = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, HISTORIA)))
+    apertura = cierre * (1 + rng.normal(0, 0.005, HISTORIA))
+    maximo = np.maximum(apertura, cierre) * (1 + np.abs(rng.normal(0, 0.005, HISTORIA)))
+    minimo = np.minimum(apertura, cierre) * (1 - np.abs(rng.normal(0, 0.005, HISTORIA)))
+    volumen = rng.integers(100_000, 5_000_000, HISTORIA)
+    return fechas, apertura, maximo, minimo, cierre, volumen
+
+
+def _serie(symbol: str, interval: str, outputsize: int, start_date: str = None, order: str = "DESC"):
+    if symbol in INVALIDOS:
+        return _error(400, f"**symbol** not found: {symbol}. Please specify it correctly.")
+
+    fin = pd.Timestamp.now().normalize() - pd.Timedelta(days=1)
+    fechas, apertura, maximo, minimo, cierre, volumen = _historia(symbol, interval, fin)
+    inicio = HISTORIA - outputsize
+    if start_date:
+        inicio = max(inicio, int(fechas.searchsorted(pd.Timestamp(start_date))))
+    if inicio >= HISTORIA:
+        return _error(400, "No data is available on the specified dates. Try setting different start/end dates.")
+    fechas, apertura, maximo, minimo, cierre, volumen = (
+        x[inicio:] for x in (fechas, apertura, maximo, minimo, cierre, volumen))
+
+    formato = "%Y-%m-%d" if FRECUENCIAS.get(interval, "B") in ("B", "W-FRI", "ME") else "%Y-%m-%d %H:%M:%S"
+    valores = [
+        {"datetime": f.strftime(formato), "open": f"{o:.5f}", "high": f"{h:.5f}", "low": f"{l:.5f}",
+         "close": f"{c:.5f}", "volume": str(v)}
+        for f, o, h, l, c, v in zip(fechas, apertura, maximo, minimo, cierre, volumen)
+    ]
+    if order.upper() != "ASC":
+        valores.reverse()
+
+    return {"meta": {"symbol": symbol, "interval": interval}, "values": valores, "status": "ok"}
+
+
+@app.get("/time_series")
+async def time_series(symbol: str, interval: str = "1day", outputsize: int = 30, start_date: str = None,
+                      order: str = "DESC", apikey: str = None):
+    if LATENCIA_MS:
+        await asyncio.sleep(LATENCIA_MS / 1000)
+
+    simbolos = [s.strip().upper() for s in symbol.split(",") if s.strip()]
+    if not apikey:
+        return _error(401, "**apikey** parameter is incorrect or not specified.")
+
+    # Cada símbolo de un batch gasta un crédito, como en la API real
+    if CREDITOS_MINUTO:
+        cubo = _cubos.setdefault(apikey, CuboTokens(CREDITOS_MINUTO))
+        if not cubo.intentar(len(simbolos)):
+            return _error(429, "You have run out of API credits for the current minute.")
+
+    outputsize = max(1, min(outputsize, HISTORIA))
+    if len(simbolos) == 1:
+        return _serie(simbolos[0], interval, outputsize, start_date, order)
+    return {s: _serie(s, interval, outputsize, start_date, order) for s in simbolos}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("STUB_PORT", 8100)))
@@ -0,0 +1,68 @@
+
+# LIBRERÍAS
+import json
+import os
+import subprocess
+import sys
+from multiprocessing import get_all_start_methods
+
+import numpy as np
+
+
+# ARRANQUE EN FRÍO
+# Cada medida se toma en un proceso nuevo (como un worker recién creado):
+#  - importar app.main: segundos desde que nace el intérprete y memoria tras importar.
+#  - calentar el pool de predicción: hasta que todos los procesos tienen Prophet cargado,
+#    con arranque "spawn" (cada proceso lo importa) y "forkserver" (se importa una vez).
+
+_IMPORTAR_APP = """
+import json
+import app.main
+from app import metricas
+print(json.dumps({"segundos": metricas.ARRANQUE["importacion"], "memoria": metricas.memoria(),
+                  "prophet_cargado": "prophet" in __import__("sys").modules}))
+"""
+
+_CALENTAR_POOL = """
+import json, time
+if __name__ == "__main__":
+    from app.pronostico import ServicioPronostico
+    servicio = ServicioPronostico()
+    inicio = time.perf_counter()
+    list(servicio.pool.map(time.sleep, [0.2] * servicio.procesos))
+    print(json.dumps({"segundos": time.perf_counter() - inicio - 0.2, "procesos": servicio.procesos}))
+    servicio.cerrar()
+"""
+
+
+def _proceso(codigo: str, entorno: dict = None):
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True,
+                            env={**os.environ, **(entorno or {})}, cwd=os.getcwd())
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def _resumen(medidas: list):
+    segundos = np.array([m["segundos"] for m in medidas])
+    return {
+        "repeticiones": len(medidas),
+        "mediana_s": round(float(np.median(segundos)), 4),
+        "min_s": round(float(segundos.min()), 4)
+    }
+
+
+def ejecutar(repeticiones: int = 3, pool: bool = True):
+    resultados = {}
+
+    medidas = [_proceso(_IMPORTAR_APP) for _ in range(repeticiones)]
+    resultados["importar_app"] = {
+        **_resumen(medidas),
+        "rss_mb": round(medidas[-1]["memoria"]["rss"] / 2**20, 1),
+        "prophet_cargado": medidas[-1]["prophet_cargado"]
+    }
+
+    if pool:
+        for inicio in [m for m in ("spawn", "forkserver") if m in get_all_start_methods()]:
+            medidas = [_proceso(_CALENTAR_POOL, {"PRONOSTICO_INICIO": inicio}) for _ in range(repeticiones)]
+            resultados[f"calentar_pool_{inicio}"] = {**_resumen(medidas), "procesos": medidas[-1]["procesos"]}
+
+    return resultados
@@ -0,0 +1,79 @@
+
+# LIBRERÍAS
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks import sinteticos
+
+
+# PRUEBA DE CARGA DE LA API
+# Lanza 'peticiones' peticiones con 'concurrencia' clientes simultáneos contra la app
+# FastAPI dentro del mismo proceso (httpx.ASGITransport, Twelve Data simulado) o
+# contra un servidor ya arrancado (--url). Mide rendimiento y percentiles por escenario.
+
+def escenarios(n_simbolos: int):
+    tickers = sinteticos.simbolos(n_simbolos)
+    return {
+        "stock": lambda rng: f"/stock/{rng.choice(tickers)}",
+        "compare": lambda rng: "/compare?symbols=" + ",".join(rng.sample(tickers, min(3, len(tickers)))),
+        "indicators": lambda rng: f"/indicators/{rng.choice(tickers)}",
+        "predict_fast": lambda rng: f"/predict/{rng.choice(tickers)}?model=fast",
+    }
+
+
+async def _lanzar(cliente: httpx.AsyncClient, generar, peticiones: int, concurrencia: int, semilla: int):
+    rng = random.Random(semilla)
+    rutas = [generar(rng) for _ in range(peticiones)]
+    latencias = []
+    errores = 0
+    siguiente = iter(rutas)
+
+    async def trabajador():
+        nonlocal errores
+        for ruta in siguiente:
+            inicio = time.perf_counter()
+            try:
+                resp = await cliente.get(ruta)
+                if resp.status_code >= 400:
+                    errores += 1
+            except httpx.HTTPError:
+                errores += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    total = time.perf_counter() - inicio
+
+    latencias = np.array(latencias)
+    return {
+        "peticiones": peticiones,
+        "concurrencia": concurrencia,
+        "errores": errores,
+        "rps": round(peticiones / total, 2),
+        "p50_ms": round(float(np.percentile(latencias, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencias, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencias, 99)), 3),
+        "max_ms": round(float(latencias.max()), 3)
+    }
+
+
+async def ejecutar(n_simbolos: int = 20, peticiones: int = 2000, concurrencia: int = 32,
+                   url: str = None, semilla: int = 0):
+    if url:
+        cliente = httpx.AsyncClient(base_url=url, timeout=60,
+                                    limits=httpx.Limits(max_connections=concurrencia))
+    else:
+        from app.main import app
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    resultados = {}
+    async with cliente:
+        # Calentamiento: primera descarga de cada símbolo (no se mide)
+        await cliente.get("/stocks", params={"symbols": ",".join(sinteticos.simbolos(n_simbolos))})
+        for nombre, generar in escenarios(n_simbolos).items():
+            resultados[nombre] = await _lanzar(cliente, generar, peticiones, concurrencia, semilla)
+    return resultados
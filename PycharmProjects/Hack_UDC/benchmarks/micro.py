@@ -0,0 +1,72 @@
+
+# LIBRERÍAS
+import time
+
+import numpy as np
+
+from benchmarks import sinteticos
+
+
+# MICRO-BENCHMARKS DEL MOTOR
+# Cada caso es una función sin argumentos que se ejecuta 'repeticiones' veces
+# (tras una ejecución de calentamiento). Se devuelven mediana, p95 y mínimo en ms.
+
+def medir(fn, repeticiones: int = 20, calentamiento: int = 1):
+    for _ in range(calentamiento):
+        fn()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos = np.array(tiempos)
+    return {
+        "repeticiones": repeticiones,
+        "mediana_ms": round(float(np.median(tiempos)), 4),
+        "p95_ms": round(float(np.percentile(tiempos, 95)), 4),
+        "min_ms": round(float(tiempos.min()), 4)
+    }
+
+
+def ejecutar(velas: int = 365, repeticiones: int = 20, prophet: bool = True):
+    from app import api_engine as engine
+    from app.respuestas import serializar  # la misma codificación que la caché de respuestas
+
+    # El motor trabaja con series compactas (app/series.py), como las que salen del almacén
+    df = sinteticos.serie_ohlcv(velas, semilla=1)
+    serie = engine.como_serie(df)
+    resultados = {}
+
+    resultados["calcular_estadisticas"] = medir(lambda: engine.calcular_estadisticas(serie), repeticiones * 5)
+    resultados["resumen_stock"] = medir(lambda: engine.resumen_stock("SYN", serie), repeticiones * 5)
+
+    # Barras semanales/mensuales a partir de la serie diaria (sin la caché de remuestreos)
+    for intervalo in ("1week", "1month"):
+        resultados[f"remuestrear_{intervalo}"] = medir(lambda: engine.remuestrear(serie, intervalo), repeticiones * 5)
+
+    # Inserción: un ticker nuevo en cada repetición (sin upsert sobre velas ya guardadas)
+    registros = sinteticos.registros(df)
+    contador = iter(range(10**9))
+    resultados["guardar_datos_manuales"] = medir(
+        lambda: engine.guardar_datos_manuales(f"BENCH{next(contador)}", registros), repeticiones)
+
+    # Predicción: una serie distinta por repetición para no acertar en la caché de resultados
+    semillas = iter(range(1000, 10**9))
+
+    def predecir(modelo):
+        return lambda: engine.predecir_ia(sinteticos.serie_ohlcv(velas, semilla=next(semillas)), None, modelo)
+
+    resultados["predecir_ia_fast"] = medir(predecir("fast"), repeticiones)
+    if prophet:
+        resultados["predecir_ia_prophet"] = medir(predecir("prophet"), max(3, repeticiones // 5))
+
+    # Acierto de caché: la misma serie dos veces
+    resultados["predecir_ia_cache"] = medir(lambda: engine.predecir_ia(serie, "SYN", "fast"), repeticiones * 5)
+
+    # Serialización JSON de las respuestas más habituales
+    resumen = engine.resumen_stock("SYN", serie)
+    indicadores = engine.calcular_indicadores("SYN", serie, ultimos=velas)
+    resultados["json_stock"] = medir(lambda: serializar(resumen), repeticiones * 5)
+    resultados["json_indicadores"] = medir(lambda: serializar(indicadores), repeticiones)
+
+    return resultados
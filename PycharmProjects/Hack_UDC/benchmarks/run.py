@@ -0,0 +1,138 @@
+
+# LIBRERÍAS
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# BENCHMARKS DE STUDYSTOCK
+# Arranque en frío, micro-benchmarks del motor y prueba de carga de la API, sin red: los datos son
+# sintéticos y Twelve Data se sustituye por el servidor simulado (app/stub_td.py)
+# dentro del mismo proceso. El resultado es un JSON que se puede comparar entre commits.
+#
+#   python -m benchmarks.run --salida bench_main.json
+#   python -m benchmarks.run --velas 2000 --simbolos 50 --concurrencia 64 --salida bench_rama.json
+#   python -m benchmarks.run --comparar bench_main.json bench_rama.json
+
+
+def _preparar_entorno(args):
+    # Antes de importar la app: base de datos temporal, sin planificador y con el
+    # servidor simulado sin latencia ni límite de créditos.
+    os.environ["STUDYSTOCK_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+    os.environ.setdefault("TWELVE_DATA_KEY", "bench")
+    os.environ["PLANIFICADOR_AL_ARRANCAR"] = "0"
+    os.environ["STUB_LATENCIA_MS"] = str(args.latencia_stub)
+    os.environ["STUB_CREDITOS_MINUTO"] = "0"
+    os.environ["TWELVE_DATA_CREDITOS_MINUTO"] = "100000"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _meta(args):
+    return {
+        "commit": _commit(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")}
+    }
+
+
+def _carga(args):
+    import httpx
+    from app import cliente_td, stub_td
+    from benchmarks import carga
+
+    if not args.url:
+        cliente_td.usar_transporte(httpx.ASGITransport(app=stub_td.app))
+    return asyncio.run(carga.ejecutar(args.simbolos, args.peticiones, args.concurrencia, args.url))
+
+
+def ejecutar(args):
+    _preparar_entorno(args)
+    from benchmarks import arranque, micro
+
+    todas = not (args.solo_micro or args.solo_carga or args.solo_arranque)
+    resultado = {"meta": _meta(args)}
+    try:
+        if todas or args.solo_arranque:
+            # Antes que el resto: mide procesos nuevos, sin la app importada en este
+            resultado["arranque"] = arranque.ejecutar(pool=not args.sin_prophet)
+        if todas or args.solo_micro:
+            resultado["micro"] = micro.ejecutar(args.velas, args.repeticiones, prophet=not args.sin_prophet)
+        if todas or args.solo_carga:
+            resultado["carga"] = _carga(args)
+    finally:
+        from app import api_engine
+        api_engine.SERVICIO_PRONOSTICO.cerrar()
+    return resultado
+
+
+# COMPARACIÓN ENTRE DOS EJECUCIONES
+# Ratio nuevo/base por métrica: < 1 en tiempos (o > 1 en rps) es una mejora.
+
+def comparar(base: dict, nuevo: dict):
+    filas = []
+    secciones = (("arranque", ("mediana_s", "rss_mb")), ("micro", ("mediana_ms", "p95_ms")),
+                 ("carga", ("rps", "p50_ms", "p95_ms", "p99_ms")))
+    for seccion, metricas in secciones:
+        for caso, valores in base.get(seccion, {}).items():
+            otros = nuevo.get(seccion, {}).get(caso)
+            if not otros:
+                continue
+            for m in metricas:
+                a, b = valores.get(m), otros.get(m)
+                if a and b is not None:
+                    filas.append((f"{seccion}.{caso}.{m}", a, b, b / a))
+    return filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de StudyStock (sin red)")
+    parser.add_argument("--velas", type=int, default=365, help="Velas por serie sintética")
+    parser.add_argument("--simbolos", type=int, default=20, help="Símbolos distintos en la prueba de carga")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--peticiones", type=int, default=1000, help="Peticiones por escenario de carga")
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--latencia-stub", type=float, default=0, help="Latencia simulada de Twelve Data (ms)")
+    parser.add_argument("--url", help="Servidor ya arrancado contra el que lanzar la carga")
+    parser.add_argument("--sin-prophet", action="store_true", help="Omite el micro-benchmark de Prophet")
+    parser.add_argument("--solo-micro", action="store_true")
+    parser.add_argument("--solo-carga", action="store_true")
+    parser.add_argument("--solo-arranque", action="store_true")
+    parser.add_argument("--salida", help="Fichero JSON de resultados (por defecto, salida estándar)")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NUEVO"), help="Compara dos ficheros de resultados")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        with open(args.comparar[0]) as f_base, open(args.comparar[1]) as f_nuevo:
+            base, nuevo = json.load(f_base), json.load(f_nuevo)
+        print(f"{'métrica':<45} {'base':>12} {'nuevo':>12} {'ratio':>8}")
+        for nombre, a, b, ratio in comparar(base, nuevo):
+            print(f"{nombre:<45} {a:>12.3f} {b:>12.3f} {ratio:>8.3f}")
+        return
+
+    resultado = json.dumps(ejecutar(args), indent=2)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(resultado)
+    else:
+        print(resultado)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+
+# LIBRERÍAS
+import numpy as np
+import pandas as pd
+
+
+# DATOS OHLCV SINTÉTICOS
+# Paseo aleatorio geométrico con semilla fija: el mismo (ticker, velas, semilla)
+# genera siempre la misma serie, así los resultados se pueden comparar entre commits.
+
+def serie_ohlcv(velas: int = 365, semilla: int = 0, fin: str = "2025-12-31"):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.bdate_range(end=fin, periods=velas, name="datetime")
+    cierre = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, velas)))
+    apertura = cierre * (1 + rng.normal(0, 0.005, velas))
+    maximo = np.maximum(apertura, cierre) * (1 + np.abs(rng.normal(0, 0.005, velas)))
+    minimo = np.minimum(apertura, cierre) * (1 - np.abs(rng.normal(0, 0.005, velas)))
+    volumen = rng.integers(100_000, 5_000_000, velas).astype(float)
+    return pd.DataFrame({"open": apertura, "high": maximo, "low": minimo, "close": cierre, "volume": volumen},
+                        index=fechas)
+
+
+def simbolos(n: int = 20):
+    return [f"SYN{i:03d}" for i in range(n)]
+
+
+def universo(n_simbolos: int = 20, velas: int = 365):
+    # {ticker: DataFrame} para n símbolos
+    return {t: serie_ohlcv(velas, semilla=i) for i, t in enumerate(simbolos(n_simbolos))}
+
+
+def registros(df: pd.DataFrame):
+    # Formato del cuerpo de /insert-manual (lista de diccionarios)
+    tabla = df.reset_index()
+    tabla["datetime"] = tabla["datetime"].dt.strftime("%Y-%m-%d")
+    tabla["volume"] = tabla["volume"].astype(int)
+    return tabla.to_dict(orient="records")
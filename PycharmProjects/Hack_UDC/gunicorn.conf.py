@@ -0,0 +1,30 @@
+
+# CONFIGURACIÓN DE GUNICORN
+# gunicorn lee este fichero solo si se arranca desde esta carpeta:
+#   gunicorn app.main:app
+# Los argumentos de la línea de comandos (-w, -k...) tienen prioridad.
+
+import os
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+# PRELOAD: la app (FastAPI, pandas, NumPy y los módulos de app/) se importa una vez en
+# el master y cada worker nace por fork compartiendo esas páginas (copy-on-write), así
+# que arranca al instante y ocupa menos. Prophet no se importa en los workers de la API:
+# solo en el pool de predicción, que lo carga una vez por worker desde su forkserver.
+# GUNICORN_PRELOAD=0 vuelve a importar la app en cada worker (útil con --reload).
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def post_fork(server, worker):
+    # Se ejecuta en cada worker recién creado: le indica si la app venía precargada del
+    # master (lo publican /metrics y el log de arranque). Es la opción efectiva, incluido
+    # --preload en la línea de comandos; importar app/ en el master no lo cambia.
+    os.environ["STUDYSTOCK_PRECARGADO"] = "1" if server.cfg.preload_app else "0"
+
+
+def when_ready(server):
+    from app import metricas
+    server.log.info("Master listo en %.2f s (preload=%s)", metricas.edad_proceso(), preload_app)
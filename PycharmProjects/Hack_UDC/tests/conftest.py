@@ -0,0 +1,23 @@
+
+# CONFIGURACIÓN COMÚN DE LAS PRUEBAS
+# Se ejecutan desde PycharmProjects/Hack_UDC con: python -m pytest -q tests
+
+# LIBRERÍAS
+import os
+import tempfile
+
+# Antes de importar la app: base de datos temporal y sin planificador
+os.environ.setdefault("STUDYSTOCK_DB", os.path.join(tempfile.mkdtemp(), "pruebas.db"))
+os.environ.setdefault("PLANIFICADOR_AL_ARRANCAR", "0")
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def cliente():
+    # Un solo arranque de la app para todas las pruebas: al salir, el lifespan cierra
+    # el pool de hilos de app/concurrencia.py y ya no se puede volver a usar
+    from app.main import app
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,103 @@
+
+# PRUEBAS DE LAS DESCARGAS DE TWELVE DATA (app/api_engine.py)
+# Twelve Data se sustituye por una historia fija en memoria: cada descarga devuelve
+# sus últimas 'outputsize' velas, o las velas desde 'desde' si es incremental.
+
+# LIBRERÍAS
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import api_engine as engine, cliente_td
+from app.almacen import AlmacenOHLCV
+from app.cache import CacheSeries
+from app.series import INTERVALO_BASE
+
+
+def _historia(velas: int):
+    fechas = pd.bdate_range("2024-01-01", periods=velas, name="datetime")
+    cierre = 100 + np.arange(velas, dtype=float)
+    return pd.DataFrame({"open": cierre, "high": cierre + 1, "low": cierre - 1, "close": cierre,
+                         "volume": 1000.0}, index=fechas)
+
+
+class TwelveFalso:
+
+    def __init__(self, historia: pd.DataFrame):
+        self.historia = historia
+        self.error = False
+        self.llamadas = []  # (ticker, outputsize, desde)
+
+    async def __call__(self, symbol: str, interval: str = "1day", outputsize: int = 365, desde=None):
+        self.llamadas.append((symbol, outputsize, desde))
+        await asyncio.sleep(0.01)
+        if self.error:
+            return {"error": "Error en Twelve Data: sin conexión"}
+        df = self.historia if desde is None else self.historia[self.historia.index >= desde]
+        return df.tail(outputsize).copy()
+
+
+@pytest.fixture
+def twelve(monkeypatch, tmp_path):
+    # Almacenes y caché vacíos en cada prueba
+    ruta = str(tmp_path / "series.db")
+    monkeypatch.setattr(engine, "series_twelve",
+                        lambda interval=INTERVALO_BASE: AlmacenOHLCV(f"twelvedata:{interval}", ruta))
+    monkeypatch.setattr(engine, "DB_LOCAL", AlmacenOHLCV("local", ruta))
+    monkeypatch.setattr(engine, "CACHE_SERIES", CacheSeries())
+    falso = TwelveFalso(_historia(60))
+    monkeypatch.setattr(cliente_td, "descargar_datos_async", falso)
+    return falso
+
+
+def test_descarga_incremental_fusiona_las_velas_nuevas(twelve):
+    twelve.historia = _historia(40)
+    serie = asyncio.run(engine._descargar_y_registrar("INC", 365))
+    assert len(serie) == 40
+    assert twelve.llamadas[-1][2] is None
+
+    # Llegan dos velas nuevas y se revisa la última que ya estaba guardada
+    nueva = _historia(42)
+    nueva.loc[nueva.index[39], "close"] = 500.0
+    twelve.historia = nueva
+    serie = asyncio.run(engine._descargar_y_registrar("INC", 365))
+
+    assert twelve.llamadas[-1][2] == nueva.index[39]  # solo se piden las velas desde la última
+    assert len(serie) == 42
+    assert float(serie.close[39]) == 500.0
+    assert np.array_equal(serie.tiempos, np.unique(serie.tiempos))
+    assert np.array_equal(serie.close[:39], nueva["close"].to_numpy()[:39])
+
+
+def test_si_falla_la_actualizacion_se_sirve_y_cachea_el_historial(twelve):
+    asyncio.run(engine._descargar_y_registrar("FALLA", 365))
+    twelve.error = True
+    serie = asyncio.run(engine._descargar_y_registrar("FALLA", 365))
+
+    assert len(serie) == 60
+    assert engine.CACHE_SERIES.obtener(("FALLA", INTERVALO_BASE, 365)) is serie
+
+
+def test_si_falla_la_primera_descarga_se_devuelve_el_error(twelve):
+    twelve.error = True
+    resultado = asyncio.run(engine._descargar_y_registrar("NUEVO", 365))
+    assert "error" in resultado
+    assert engine.CACHE_SERIES.obtener(("NUEVO", INTERVALO_BASE, 365)) is None
+
+
+def test_peticiones_simultaneas_comparten_la_descarga(twelve):
+    async def principal():
+        return await asyncio.gather(*(engine.obtener_datos_async("VUELO") for _ in range(5)))
+
+    series = asyncio.run(principal())
+    assert len(twelve.llamadas) == 1
+    assert all(len(s) == 60 and s.version == series[0].version for s in series)
+
+
+def test_los_intervalos_gruesos_comparten_una_sola_ampliacion(twelve):
+    asyncio.run(engine.obtener_datos_async("AMPLIA"))
+    for intervalo in ("1week", "1month", "1year", "1week"):
+        asyncio.run(engine.obtener_datos_async("AMPLIA", intervalo))
+    assert [llamada[1] for llamada in twelve.llamadas] == [engine.VELAS_BASE, engine.MAX_VELAS_BASE]
@@ -0,0 +1,75 @@
+
+# PRUEBAS DEL BACKTEST CON ORIGEN MÓVIL (app/backtest.py)
+
+# LIBRERÍAS
+import numpy as np
+import pandas as pd
+
+from app import backtest
+from app.backtest import MotorBacktest, cortes, resumir
+
+
+def _df_p(velas: int):
+    # Formato de entrenamiento (ds, y, volume), como preparar_prophet
+    return pd.DataFrame({
+        "ds": pd.bdate_range("2024-01-01", periods=velas),
+        "y": 100 + np.sin(np.arange(velas) / 5) * 10,
+        "volume": 1000.0
+    })
+
+
+def test_cortes_retroceden_un_horizonte_por_pliegue():
+    assert cortes(100, horizonte=5, pliegues=3) == [85, 90, 95]
+    # Los pliegues sin MIN_ENTRENAMIENTO velas de entrenamiento se descartan
+    assert cortes(20, horizonte=5, pliegues=3) == [10, 15]
+    assert cortes(12, horizonte=5, pliegues=3) == []
+
+
+def test_cada_pliegue_entrena_solo_con_el_pasado(monkeypatch):
+    vistos = []
+    evaluar = backtest._evaluar_pliegue
+
+    def espia(df_p, corte, horizonte, modelo, params):
+        vistos.append((corte, df_p["ds"].iloc[corte - 1]))
+        return evaluar(df_p, corte, horizonte, modelo, params)
+
+    monkeypatch.setattr(backtest, "_evaluar_pliegue", espia)
+    df_p = _df_p(100)
+    res = MotorBacktest(obtener_pool=None).evaluar(("v", 1), df_p, "fast", horizonte=5, pliegues=3)
+
+    assert res["pliegues"] == 3
+    assert len(res["por_paso"]) == 5
+    assert sorted(c for c, _ in vistos) == [85, 90, 95]
+    assert all(ultima == df_p["ds"].iloc[c - 1] for c, ultima in vistos)
+
+
+def test_los_pliegues_se_cachean_por_version():
+    motor = MotorBacktest(obtener_pool=None)
+    df_p = _df_p(100)
+    primero = motor.evaluar(("v", 1), df_p, "fast")
+    assert motor.evaluar(("v", 1), df_p, "fast") == primero
+    assert motor.estadisticas()["calculados"] == backtest.PLIEGUES
+    assert motor.estadisticas()["aciertos"] == backtest.PLIEGUES
+
+    # Otra versión de los datos (p. ej. una carga nueva) vuelve a entrenar
+    motor.evaluar(("v", 2), df_p, "fast")
+    assert motor.estadisticas()["calculados"] == 2 * backtest.PLIEGUES
+
+
+def test_datos_insuficientes():
+    res = MotorBacktest(obtener_pool=None).evaluar(("v", 1), _df_p(12), "fast")
+    assert "error" in res
+
+
+def test_resumen_de_errores_y_cobertura():
+    # Dos pliegues de horizonte 2: (real, predicho, inferior, superior)
+    pliegues = [
+        (np.array([100.0, 100.0]), np.array([90.0, 110.0]), np.array([80.0, 105.0]), np.array([120.0, 115.0])),
+        (np.array([50.0, 50.0]), np.array([50.0, 45.0]), np.array([40.0, 40.0]), np.array([60.0, 60.0])),
+    ]
+    res = resumir(pliegues, 2)
+    assert res["mae"] == 6.25
+    assert res["mape"] == 7.5
+    assert res["cobertura"] == 0.75
+    assert [p["mae"] for p in res["por_paso"]] == [5.0, 7.5]
+    assert [p["cobertura"] for p in res["por_paso"]] == [1.0, 0.5]
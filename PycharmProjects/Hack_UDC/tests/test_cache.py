@@ -0,0 +1,56 @@
+
+# PRUEBAS DE LA CACHÉ TTL + LRU (app/cache.py)
+
+# LIBRERÍAS
+import numpy as np
+
+from app.cache import CacheSeries
+from app.series import SerieOHLCV
+
+
+def _serie(velas: int):
+    return SerieOHLCV.desde_columnas(np.arange(velas) * 86400, np.ones((4, velas)), np.ones(velas))
+
+
+def test_entrada_caducada_no_se_devuelve():
+    cache = CacheSeries()
+    cache.guardar("viva", 1, ttl=60)
+    cache.guardar("caducada", 2, ttl=0)
+    assert cache.obtener("viva") == 1
+    assert cache.obtener("caducada") is None
+    estadisticas = cache.estadisticas()
+    assert estadisticas["caducadas"] == 1
+    assert estadisticas["entradas"] == 1
+
+
+def test_expulsa_la_menos_usada_al_superar_las_entradas():
+    cache = CacheSeries(max_entradas=2)
+    cache.guardar("a", 1, ttl=60)
+    cache.guardar("b", 2, ttl=60)
+    cache.obtener("a")  # 'b' pasa a ser la menos usada
+    cache.guardar("c", 3, ttl=60)
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") == 1
+    assert cache.obtener("c") == 3
+    assert cache.estadisticas()["expulsiones"] == 1
+
+
+def test_expulsa_por_memoria_y_no_guarda_entradas_mayores_que_la_cache():
+    tamano = _serie(100).nbytes
+    cache = CacheSeries(max_bytes=2 * tamano)
+    for clave in ("a", "b", "c"):
+        cache.guardar(clave, _serie(100), ttl=60)
+    assert cache.obtener("a") is None
+    assert cache.estadisticas()["bytes"] == 2 * tamano
+
+    cache.guardar("grande", _serie(1000), ttl=60)
+    assert cache.obtener("grande") is None
+    assert cache.obtener("b") is not None and cache.obtener("c") is not None
+
+
+def test_guardar_de_nuevo_reemplaza_la_entrada():
+    cache = CacheSeries()
+    cache.guardar("a", _serie(10), ttl=60)
+    cache.guardar("a", _serie(20), ttl=60)
+    assert len(cache.obtener("a")) == 20
+    assert cache.estadisticas()["bytes"] == _serie(20).nbytes
@@ -0,0 +1,70 @@
+
+# PRUEBAS DEL ANÁLISIS DE CARTERA (app/cartera.py)
+
+# LIBRERÍAS
+import numpy as np
+import pytest
+
+from app import cartera
+from app.series import DIA, SerieOHLCV
+
+
+def _serie(cierres, dias=None):
+    cierres = np.asarray(cierres, dtype=np.float64)
+    dias = np.arange(len(cierres)) if dias is None else np.asarray(dias)
+    return SerieOHLCV.desde_columnas(dias * DIA, np.vstack([cierres] * 4), np.ones(len(cierres)))
+
+
+def _desde_rendimientos(r):
+    return 100 * np.cumprod(np.r_[1.0, 1 + r])
+
+
+def test_pesos_de_minima_varianza_y_maximo_sharpe():
+    covarianza = np.diag([1.0, 4.0])
+    assert cartera.pesos_minima_varianza(covarianza) == pytest.approx([0.8, 0.2])
+    assert cartera.pesos_maximo_sharpe(np.eye(2), np.array([1.0, 3.0])) == pytest.approx([0.25, 0.75])
+    # Sin exceso de rendimiento positivo no hay cartera tangente
+    assert cartera.pesos_maximo_sharpe(np.eye(2), np.array([-1.0, -1.0])) is None
+
+
+def test_ledoit_wolf_contrae_hacia_la_identidad_escalada():
+    r = np.random.default_rng(0).normal(0, 0.01, (60, 5))
+    contraida, delta = cartera.ledoit_wolf(r)
+    muestral = np.cov(r, rowvar=False, bias=True)
+    m = np.trace(muestral) / 5
+    assert 0 <= delta <= 1
+    assert contraida == pytest.approx(delta * m * np.eye(5) + (1 - delta) * muestral)
+    assert np.all(np.linalg.eigvalsh(contraida) > 0)
+
+
+def test_alinea_en_las_fechas_comunes():
+    a = _serie([1, 2, 3, 4], dias=[0, 1, 2, 3])
+    b = _serie([10, 30, 40], dias=[0, 2, 3])
+    tiempos, cierres = cartera.alinear({"A": a, "B": b})
+    assert (tiempos // DIA).tolist() == [0, 2, 3]
+    assert cierres.tolist() == [[1, 10], [3, 30], [4, 40]]
+
+
+def test_beta_correlacion_y_pesos_de_una_cartera():
+    r = np.random.default_rng(1).normal(0.001, 0.01, 250)
+    indice = _serie(_desde_rendimientos(r))
+    datos = {"IGUAL": _serie(_desde_rendimientos(r)), "DOBLE": _serie(_desde_rendimientos(2 * r)),
+             "OTRA": _serie(_desde_rendimientos(np.random.default_rng(2).normal(0, 0.01, 250)))}
+
+    res = cartera.analizar(datos, indice, tasa_libre=0.0, periodos_anuales=252)
+
+    assert res["observaciones"] == 250
+    assert res["activos"]["IGUAL"]["beta"] == pytest.approx(1.0)
+    assert res["activos"]["DOBLE"]["beta"] == pytest.approx(2.0)
+    assert res["correlacion"][0][1] == pytest.approx(1.0)
+    assert res["activos"]["DOBLE"]["volatilidad_anual"] == pytest.approx(
+        2 * res["activos"]["IGUAL"]["volatilidad_anual"], abs=1e-4)
+    for nombre in ("minima_varianza", "equiponderada"):
+        assert sum(res["carteras"][nombre]["pesos"].values()) == pytest.approx(1.0, abs=1e-3)
+    assert res["carteras"]["equiponderada"]["pesos"]["OTRA"] == pytest.approx(1 / 3, abs=1e-4)
+
+
+def test_errores_de_la_cartera():
+    assert "error" in cartera.analizar({"A": _serie(np.arange(1, 50))})
+    pocas = {"A": _serie(np.arange(1, 10)), "B": _serie(np.arange(2, 11))}
+    assert "error" in cartera.analizar(pocas)
@@ -0,0 +1,82 @@
+
+# PRUEBAS DE UNA SOLA EJECUCIÓN POR CLAVE (app/concurrencia.py)
+
+# LIBRERÍAS
+import asyncio
+
+import pytest
+
+from app.concurrencia import UnSoloVuelo
+
+
+def test_llamadas_simultaneas_comparten_una_ejecucion():
+    vuelos = UnSoloVuelo()
+    llamadas = []
+
+    async def trabajo(x):
+        llamadas.append(x)
+        await asyncio.sleep(0.05)
+        return x * 2
+
+    async def principal():
+        return await asyncio.gather(*(vuelos.ejecutar(("doble", 1), trabajo, 1) for _ in range(5)),
+                                    vuelos.ejecutar(("doble", 2), trabajo, 2))
+
+    assert asyncio.run(principal()) == [2] * 5 + [4]
+    assert llamadas == [1, 2]
+    estadisticas = vuelos.estadisticas()
+    assert estadisticas["operaciones"]["doble"] == {"ejecuciones": 2, "agrupadas": 4}
+    assert estadisticas["en_vuelo"] == 0
+
+
+def test_al_terminar_la_clave_se_vuelve_a_ejecutar():
+    vuelos = UnSoloVuelo()
+    llamadas = []
+
+    async def trabajo():
+        llamadas.append(1)
+        return len(llamadas)
+
+    async def principal():
+        return [await vuelos.ejecutar(("contar",), trabajo), await vuelos.ejecutar(("contar",), trabajo)]
+
+    assert asyncio.run(principal()) == [1, 2]
+
+
+def test_un_error_llega_a_todos_los_que_esperan():
+    vuelos = UnSoloVuelo()
+    llamadas = []
+
+    async def trabajo():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("fallo")
+
+    async def principal():
+        return await asyncio.gather(*(vuelos.ejecutar(("falla",), trabajo) for _ in range(3)),
+                                    return_exceptions=True)
+
+    resultados = asyncio.run(principal())
+    assert len(llamadas) == 1
+    assert all(isinstance(r, ValueError) for r in resultados)
+    assert vuelos.estadisticas()["en_vuelo"] == 0
+
+
+def test_la_tarea_sigue_aunque_se_cancele_quien_la_lanzo():
+    vuelos = UnSoloVuelo()
+
+    async def trabajo():
+        await asyncio.sleep(0.05)
+        return "hecho"
+
+    async def principal():
+        primera = asyncio.ensure_future(vuelos.ejecutar(("larga",), trabajo))
+        await asyncio.sleep(0)
+        segunda = asyncio.ensure_future(vuelos.ejecutar(("larga",), trabajo))
+        await asyncio.sleep(0.01)
+        primera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primera
+        return await segunda
+
+    assert asyncio.run(principal()) == "hecho"
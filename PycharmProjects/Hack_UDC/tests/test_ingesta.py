@@ -0,0 +1,49 @@
+
+# PRUEBAS DE LA CARGA MASIVA (POST /insert-bulk)
+
+# LIBRERÍAS
+import pandas as pd
+import pytest
+
+from app import api_engine as engine, ingesta
+from app.almacen import AlmacenOHLCV
+
+
+def _csv(filas: int):
+    fechas = pd.date_range("2000-01-03", periods=filas, freq="D")
+    lineas = ["datetime,open,high,low,close,volume"]
+    lineas += [f"{f.date()},10.5,11.0,10.0,10.8,1000" for f in fechas]
+    return ("\n".join(lineas) + "\n").encode()
+
+
+@pytest.fixture(autouse=True)
+def db_local(monkeypatch, tmp_path):
+    # DB_LOCAL en una base de datos vacía y bloques pequeños para que el fichero se trocee
+    monkeypatch.setattr(engine, "DB_LOCAL", AlmacenOHLCV("local", str(tmp_path / "local.db")))
+    monkeypatch.setattr(ingesta, "BYTES_BLOQUE", 64 * 1024)
+
+
+def test_carga_correcta(cliente):
+    res = cliente.post("/insert-bulk/PRUEBA", content=_csv(20_000), headers={"Content-Type": "text/csv"})
+    assert res.status_code == 200, res.text
+    assert res.json()["bloques"] > 1
+    assert len(engine.DB_LOCAL.leer("PRUEBA")) == 20_000
+
+
+def test_error_en_un_bloque_posterior_no_deja_filas(cliente):
+    # Los primeros bloques son válidos; el último tiene una comilla sin cerrar
+    cuerpo = _csv(20_000) + b'2060-01-01,"10.5,11.0,10.0,10.8,1000\n'
+    res = cliente.post("/insert-bulk/ROTO", content=cuerpo, headers={"Content-Type": "text/csv"})
+    assert res.status_code == 400
+    assert "ROTO" not in engine.DB_LOCAL
+    assert engine.DB_LOCAL.leer("ROTO") is None
+    filas = engine.DB_LOCAL._con.execute("SELECT COUNT(*) FROM velas").fetchone()[0]
+    assert filas == 0
+
+
+def test_error_no_modifica_un_ticker_existente(cliente):
+    cliente.post("/insert-bulk/PRUEBA", content=_csv(100), headers={"Content-Type": "text/csv"})
+    cuerpo = _csv(20_000) + b'2060-01-01,"10.5\n'
+    res = cliente.post("/insert-bulk/PRUEBA", content=cuerpo, headers={"Content-Type": "text/csv"})
+    assert res.status_code == 400
+    assert len(engine.DB_LOCAL.leer("PRUEBA")) == 100
@@ -0,0 +1,68 @@
+
+# PRUEBAS DE INVALIDACIÓN TRAS VOLVER A CARGAR UN TICKER LOCAL
+# Una carga puede cambiar velas antiguas sin tocar la última: la versión de la serie
+# incluye su última escritura en el almacén, así que respuestas, remuestreos,
+# indicadores y predicciones en caché tienen que cambiar.
+
+# LIBRERÍAS
+import pandas as pd
+import pytest
+
+from app import api_engine as engine
+from app.almacen import AlmacenOHLCV
+from app.series import ArchivoSeries
+
+RUTAS = ("/stock/RECARGA?interval=1week", "/indicators/RECARGA", "/predict/RECARGA?model=fast")
+
+
+def _registros(cambio: int = None):
+    # 120 sesiones desde un lunes; la vela 99 es el viernes (cierre semanal) de la semana 20
+    registros = []
+    for i, fecha in enumerate(pd.bdate_range("2024-01-01", periods=120)):
+        cierre = 500.0 if i == cambio else 100 + i * 0.5
+        registros.append({"datetime": str(fecha.date()), "open": cierre, "high": cierre + 1,
+                          "low": cierre - 1, "close": cierre, "volume": 1000})
+    return registros
+
+
+def _cargar(cliente, registros):
+    res = cliente.post("/insert-manual", json={"ticker": "RECARGA", "datos": registros})
+    assert res.status_code == 200, res.text
+
+
+@pytest.fixture(autouse=True)
+def db_local(monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "DB_LOCAL", AlmacenOHLCV("local", str(tmp_path / "local.db")))
+
+
+def test_recarga_cambia_predict_indicators_y_stock_remuestreado(cliente):
+    _cargar(cliente, _registros())
+    antes = {ruta: cliente.get(ruta) for ruta in RUTAS}
+    assert all(res.status_code == 200 for res in antes.values())
+
+    _cargar(cliente, _registros(cambio=99))
+    for ruta, previa in antes.items():
+        res = cliente.get(ruta, headers={"If-None-Match": previa.headers.get("etag", "")})
+        assert res.status_code == 200, ruta
+        assert res.json() != previa.json(), ruta
+
+
+def test_respuesta_local_se_revalida_siempre(cliente):
+    _cargar(cliente, _registros())
+    res = cliente.get("/stock/RECARGA")
+    assert res.headers["cache-control"] == "no-cache"
+    assert cliente.get("/stock/RECARGA", headers={"If-None-Match": res.headers["etag"]}).status_code == 304
+
+
+def test_serie_local_en_cache_y_compartida_hasta_la_siguiente_carga(cliente, monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "ARCHIVO_SERIES", ArchivoSeries(str(tmp_path / "mmap")))
+    _cargar(cliente, _registros())
+    primera = engine._buscar_guardado("RECARGA", "1day", None)
+    assert primera.mapeada
+    assert engine._buscar_guardado("RECARGA", "1day", None) is primera
+
+    _cargar(cliente, _registros(cambio=10))
+    segunda = engine._buscar_guardado("RECARGA", "1day", None)
+    assert segunda is not primera
+    assert float(segunda.close[10]) == 500.0
+    assert len(list((tmp_path / "mmap").iterdir())) == 1